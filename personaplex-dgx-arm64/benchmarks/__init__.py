@@ -0,0 +1,4 @@
+"""
+Benchmarks for PersonaPlex
+Offline micro-benchmarks and HTTP load generation against a tiny stand-in model
+"""
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Binary endpoint overhead report
+Sends the same prompts to /generate (JSON) and /generate/binary (packed
+int32 and msgpack token IDs), and the same audio to /generate/audio
+(multipart WAV) and /generate/binary (headered PCM), one request at a
+time, and reports per-request latency and the overhead each JSON route
+adds; also checks that token requests produce the same greedy text
+"""
+
+import io
+import sys
+import time
+import wave
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, Any, Callable
+
+import numpy as np
+import requests
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
+
+from src import binary
+from create_tiny_model import create_tiny_model, write_config
+from benchmarks.load import PROMPTS
+from benchmarks.results import summarize, write_results
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def silent_audio(seconds: float, sample_rate: int) -> np.ndarray:
+    """Mono int16 silence, answered after VAD without reaching the model"""
+    return np.zeros(int(seconds * sample_rate), dtype='<i2')
+
+
+def as_wav(samples: np.ndarray, sample_rate: int) -> bytes:
+    """Mono 16-bit samples as WAV bytes"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+def time_requests(send: Callable[[int], requests.Response], count: int, warmup: int) -> Dict[str, Any]:
+    """Latency of count sequential requests after warmup ones"""
+    for index in range(warmup):
+        send(index)
+    latencies = []
+    for index in range(count):
+        start = time.perf_counter()
+        response = send(index)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f"{response.url} returned {response.status_code}: {response.text[:200]}")
+    return {'latency_ms': summarize(latencies)}
+
+
+def run_report(new_tokens: int = 1, count: int = 200, warmup: int = 10,
+               audio_seconds: float = 1.0, prompt_repeat: int = 1) -> Dict[str, Any]:
+    """Latency of the JSON and binary routes on a tiny-model server"""
+    from transformers import AutoTokenizer
+    from load_test_saturation import start_server
+
+    workdir = tempfile.mkdtemp(prefix="personaplex-binary-")
+    model_dir = create_tiny_model(str(Path(workdir) / "model"))
+    # No batching wait and no response cache, so both routes run the same
+    # single greedy generation
+    config_path = write_config(model_dir, str(Path(workdir) / "config.yaml"), overrides={
+        'performance': {'batch_wait_ms': 0, 'response_cache': {'enabled': False}},
+        'audio': {'vad': {'enabled': True, 'on_silence': 'empty'}}
+    })
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    prompts = [" ".join([prompt] * prompt_repeat) for prompt in PROMPTS]
+    prompt_ids = [tokenizer(prompt)['input_ids'] for prompt in prompts]
+    sample_rate = 16000
+    samples = silent_audio(audio_seconds, sample_rate)
+    wav = as_wav(samples, sample_rate)
+    pcm = binary.pack_pcm_header(sample_rate, 1, '<i2') + samples.tobytes()
+
+    base_url, stop = start_server(config_path)
+    session = requests.Session()
+
+    def send_json(index: int) -> requests.Response:
+        ids = prompt_ids[index % len(PROMPTS)]
+        return session.post(f"{base_url}/generate", json={
+            'text': prompts[index % len(PROMPTS)], 'max_length': len(ids) + new_tokens, 'bypass_cache': True
+        }, timeout=60)
+
+    def send_tokens(index: int) -> requests.Response:
+        ids = prompt_ids[index % len(PROMPTS)]
+        return session.post(
+            f"{base_url}/generate/binary", params={'max_length': len(ids) + new_tokens},
+            data=binary.pack_tokens(ids), headers={'Content-Type': binary.TOKENS_TYPE}, timeout=60
+        )
+
+    def send_msgpack(index: int) -> requests.Response:
+        ids = prompt_ids[index % len(PROMPTS)]
+        return session.post(
+            f"{base_url}/generate/binary",
+            data=binary.msgpack.packb({'input_ids': ids, 'max_length': len(ids) + new_tokens}),
+            headers={'Content-Type': binary.MSGPACK_TYPES[0]}, timeout=60
+        )
+
+    def send_wav(index: int) -> requests.Response:
+        return session.post(f"{base_url}/generate/audio", files={'audio': ("speech.wav", wav)}, timeout=60)
+
+    def send_pcm(index: int) -> requests.Response:
+        return session.post(
+            f"{base_url}/generate/binary", data=pcm, headers={'Content-Type': binary.PCM_TYPE}, timeout=60
+        )
+
+    routes = {'json': send_json, 'tokens': send_tokens, 'audio_multipart': send_wav, 'pcm': send_pcm}
+    if binary.msgpack is not None:
+        routes['msgpack'] = send_msgpack
+    try:
+        results = {name: time_requests(send, count, warmup) for name, send in routes.items()}
+        # Greedy outputs must match: JSON decodes prompt and output together
+        matches = []
+        for index in range(len(PROMPTS)):
+            text = send_json(index).json()['output']
+            output_ids = binary.parse_tokens(send_tokens(index).content).tolist()
+            matches.append(tokenizer.decode(prompt_ids[index] + output_ids, skip_special_tokens=True) == text)
+    finally:
+        stop()
+
+    def overhead(slow: str, fast: str) -> float:
+        return results[slow]['latency_ms']['p50'] - results[fast]['latency_ms']['p50']
+
+    results['json_overhead_vs_tokens_ms'] = overhead('json', 'tokens')
+    if 'msgpack' in results:
+        results['json_overhead_vs_msgpack_ms'] = overhead('json', 'msgpack')
+    results['multipart_overhead_vs_pcm_ms'] = overhead('audio_multipart', 'pcm')
+    results['identical_greedy_outputs'] = sum(matches) / len(matches)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Per-request overhead of the JSON vs binary routes")
+    parser.add_argument("--new-tokens", type=int, default=1, help="Greedy tokens per text request")
+    parser.add_argument("--prompt-repeat", type=int, default=1, help="Times each prompt is repeated (longer prompts)")
+    parser.add_argument("--requests", type=int, default=200, help="Timed requests per route")
+    parser.add_argument("--warmup", type=int, default=10, help="Untimed requests per route")
+    parser.add_argument("--audio-seconds", type=float, default=1.0, help="Length of the audio requests")
+    parser.add_argument("--output", default="benchmark_results/binary.json", help="Results JSON path")
+
+    args = parser.parse_args()
+
+    parameters = vars(args).copy()
+    results = run_report(args.new_tokens, args.requests, args.warmup, args.audio_seconds, args.prompt_repeat)
+    write_results(args.output, 'binary', parameters, results)
+
+    for name, result in results.items():
+        if isinstance(result, dict):
+            latency = result['latency_ms']
+            print(f"{name:>15}: p50 {latency['p50']:.2f} / p95 {latency['p95']:.2f} ms")
+    print(
+        f"JSON overhead vs packed tokens: {results['json_overhead_vs_tokens_ms']:.2f} ms, "
+        f"multipart vs PCM: {results['multipart_overhead_vs_pcm_ms']:.2f} ms, "
+        f"identical greedy outputs: {results['identical_greedy_outputs']:.0%}"
+    )
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Eager-vs-compiled report for length-bucketed torch.compile
+Serves prompts of varied lengths with and without performance.compile_model,
+checks that no graphs are compiled after warmup, and reports per-bucket
+latency and whether greedy outputs match
+"""
+
+import sys
+import time
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
+
+from src.model_handler import PersonaPlexModelHandler
+from create_tiny_model import create_tiny_model, write_config
+from benchmarks.micro import make_prompt
+from benchmarks.results import summarize, write_results
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def prompt_lengths(buckets: List[int]) -> List[int]:
+    """Several prompt lengths falling into each bucket"""
+    lengths = []
+    lower = 1
+    for bucket in buckets:
+        # Leave room for special tokens the tokenizer adds
+        lengths.extend(sorted({lower, (lower + bucket) // 2, bucket - 2}))
+        lower = bucket + 1
+    return lengths
+
+
+def run_mode(config_path: str, workdir: str, compiled: bool, backend: str, buckets: List[int],
+             lengths: List[int], output_tokens: int, repeats: int) -> Dict[str, Any]:
+    """Latency per prompt length, outputs and compile stats of one mode"""
+    handler = PersonaPlexModelHandler(config_path=_mode_config(config_path, workdir, compiled, backend, buckets))
+    handler.load_model()
+
+    latencies: Dict[int, List[float]] = {}
+    outputs: Dict[int, str] = {}
+    for _ in range(repeats):
+        for length in lengths:
+            prompt = make_prompt(handler.tokenizer, length)
+            start = time.perf_counter()
+            result = handler.generate(
+                input_text=prompt, max_new_tokens=output_tokens, min_new_tokens=output_tokens, do_sample=False
+            )
+            latencies.setdefault(length, []).append((time.perf_counter() - start) * 1000)
+            if not result['success']:
+                raise RuntimeError(result['error'])
+            outputs[length] = result['output']
+    return {
+        'name': 'compiled' if compiled else 'eager',
+        'startup_timings_ms': handler.startup_timings,
+        'latency_ms': {str(length): summarize(samples) for length, samples in latencies.items()},
+        'compile': handler.compiled.get_stats(),
+        'outputs': outputs
+    }
+
+
+def run_report(backend: str = 'inductor', buckets: Optional[List[int]] = None,
+               config_path: Optional[str] = None, output_tokens: int = 16,
+               repeats: int = 3) -> Dict[str, Any]:
+    """Compiled and eager serving of the same prompts"""
+    buckets = sorted(buckets or [32, 64, 128])
+    workdir = tempfile.mkdtemp(prefix="personaplex-compile-")
+    if config_path is None:
+        model_dir = create_tiny_model(str(Path(workdir) / "model"))
+        config_path = write_config(model_dir, str(Path(workdir) / "base.yaml"))
+
+    lengths = prompt_lengths(buckets)
+    eager = run_mode(config_path, workdir, False, backend, buckets, lengths, output_tokens, repeats)
+    compiled = run_mode(config_path, workdir, True, backend, buckets, lengths, output_tokens, repeats)
+
+    matching = [length for length in lengths if eager['outputs'][length] == compiled['outputs'][length]]
+    speedups = {}
+    for length in map(str, lengths):
+        eager_ms = eager['latency_ms'][length]['p50']
+        compiled_ms = compiled['latency_ms'][length]['p50']
+        speedups[length] = eager_ms / compiled_ms if compiled_ms else 0.0
+    for mode in (eager, compiled):
+        del mode['outputs']
+    return {
+        'prompt_lengths': lengths,
+        'modes': [eager, compiled],
+        'speedup_by_length': speedups,
+        'greedy_outputs_matching': len(matching) / len(lengths)
+    }
+
+
+def _mode_config(config_path: str, workdir: str, compiled: bool, backend: str, buckets: List[int]) -> str:
+    """Copy of config_path serving with or without compilation"""
+    import yaml
+
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    performance = config.setdefault('performance', {})
+    performance['compile_model'] = compiled
+    performance['compile'] = {
+        **(performance.get('compile') or {}),
+        'backend': backend,
+        'buckets': buckets,
+        'max_cache_len': max(buckets) * 2
+    }
+    # Prefix reuse would hide prefill cost across repeats
+    performance.setdefault('prefix_cache', {})['enabled'] = False
+    path = str(Path(workdir) / f"{'compiled' if compiled else 'eager'}.yaml")
+    with open(path, 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Eager vs length-bucketed compiled generation")
+    parser.add_argument("--backend", default="inductor",
+                        help="torch.compile backend (\"eager\" or \"aot_eager\" check graph reuse quickly)")
+    parser.add_argument("--buckets", type=int, nargs="+", default=[32, 64, 128], help="Prompt length buckets")
+    parser.add_argument("--config", default=None,
+                        help="Server config to benchmark (default: a fresh tiny model)")
+    parser.add_argument("--output-tokens", type=int, default=16, help="Generated tokens per request")
+    parser.add_argument("--repeats", type=int, default=3, help="Passes over the prompt lengths")
+    parser.add_argument("--output", default="benchmark_results/compile.json", help="Results JSON path")
+
+    args = parser.parse_args()
+
+    parameters = vars(args).copy()
+    results = run_report(args.backend, args.buckets, args.config, args.output_tokens, args.repeats)
+    write_results(args.output, 'compile', parameters, results)
+
+    eager, compiled = results['modes']
+    stats = compiled['compile']
+    print(f"warmup: {compiled['startup_timings_ms'].get('warmup', 0):.0f} ms for buckets {stats['buckets']}")
+    for length in map(str, results['prompt_lengths']):
+        print(
+            f"prompt {length:>5}: eager {eager['latency_ms'][length]['p50']:.1f} ms, "
+            f"compiled {compiled['latency_ms'][length]['p50']:.1f} ms "
+            f"({results['speedup_by_length'][length]:.2f}x)"
+        )
+    for bucket, entry in stats['per_bucket'].items():
+        print(f"bucket {bucket:>5}: {entry['requests']} requests, p50 {entry.get('p50_ms', 0):.1f} ms")
+    print(f"recompiles after warmup: {stats['recompiles_after_warmup']}, "
+          f"identical greedy outputs: {results['greedy_outputs_matching']:.0%}")
+    if not stats['active'] or stats['recompiles_after_warmup']:
+        logger.error("Compiled serving recompiled after warmup (or fell back to eager)")
+        sys.exit(1)
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+HTTP load generator for the PersonaPlex server
+Closed-loop (fixed concurrency) and open-loop (Poisson arrivals) load
+against /generate, /generate/stream and /generate/audio, reporting
+p50/p95/p99 latency, TTFT and throughput
+"""
+
+import io
+import sys
+import math
+import time
+import wave
+import random
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Callable
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
+
+from create_tiny_model import create_tiny_model, write_config
+from benchmarks.results import summarize, write_results
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+PROMPTS = [
+    "Hello, how are you today?",
+    "Please tell me about the weather in Santa Clara.",
+    "What can I help you with?",
+    "Thank you for calling, have a great day!",
+]
+
+TARGETS = ('generate', 'stream', 'audio')
+
+
+def make_wav(seconds: float = 1.0, sample_rate: int = 16000, frequency: float = 440.0) -> bytes:
+    """A mono 16-bit PCM sine tone as WAV bytes"""
+    frames = bytearray()
+    for index in range(int(seconds * sample_rate)):
+        sample = int(0.3 * 32767 * math.sin(2 * math.pi * frequency * index / sample_rate))
+        frames += sample.to_bytes(2, 'little', signed=True)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+class _Recorder:
+    """Thread-safe collection of per-request samples"""
+
+    def __init__(self):
+        self.latencies_ms: List[float] = []
+        self.ttfts_ms: List[float] = []
+        self.statuses: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, status: str, latency_ms: float, ttft_ms: Optional[float] = None):
+        with self._lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if status == '200':
+                self.latencies_ms.append(latency_ms)
+                if ttft_ms is not None:
+                    self.ttfts_ms.append(ttft_ms)
+
+
+def make_request_fn(base_url: str, target: str, max_length: int,
+                    audio_bytes: bytes) -> Callable[[int, float, _Recorder], None]:
+    """Build the function that sends one request of the given target
+
+    The function takes (index, start time, recorder); start time is when the
+    request was due, so open-loop latency includes any client-side delay.
+    """
+    session = requests.Session()
+
+    def send_generate(index: int, started: float, recorder: _Recorder):
+        response = session.post(
+            f"{base_url}/generate",
+            json={'text': PROMPTS[index % len(PROMPTS)], 'max_length': max_length},
+            timeout=600
+        )
+        recorder.record(str(response.status_code), (time.perf_counter() - started) * 1000)
+
+    def send_stream(index: int, started: float, recorder: _Recorder):
+        ttft = None
+        with session.post(
+            f"{base_url}/generate/stream",
+            json={'text': PROMPTS[index % len(PROMPTS)], 'max_length': max_length},
+            stream=True, timeout=600
+        ) as response:
+            for line in response.iter_lines():
+                if ttft is None and line.startswith(b"data:") and b'"text"' in line:
+                    ttft = (time.perf_counter() - started) * 1000
+            status = response.status_code
+        recorder.record(str(status), (time.perf_counter() - started) * 1000, ttft)
+
+    def send_audio(index: int, started: float, recorder: _Recorder):
+        response = session.post(
+            f"{base_url}/generate/audio",
+            files={'audio': ('input.wav', audio_bytes, 'audio/wav')},
+            timeout=600
+        )
+        recorder.record(str(response.status_code), (time.perf_counter() - started) * 1000)
+
+    send = {'generate': send_generate, 'stream': send_stream, 'audio': send_audio}[target]
+
+    def guarded(index: int, started: float, recorder: _Recorder):
+        try:
+            send(index, started, recorder)
+        except requests.RequestException as e:
+            recorder.record(type(e).__name__, (time.perf_counter() - started) * 1000)
+
+    return guarded
+
+
+def run_closed_loop(send: Callable, concurrency: int, num_requests: int) -> Dict[str, Any]:
+    """concurrency clients each sending back-to-back until num_requests are done"""
+    recorder = _Recorder()
+    counter = iter(range(num_requests))
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            send(index, time.perf_counter(), recorder)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    return _summarize(recorder, time.perf_counter() - start)
+
+
+def run_open_loop(send: Callable, rate: float, duration: float, seed: int = 0,
+                  max_outstanding: int = 256) -> Dict[str, Any]:
+    """Poisson arrivals at rate req/s for duration seconds
+
+    Requests are sent at their scheduled times regardless of how many are
+    still outstanding (up to max_outstanding threads), so slow responses do
+    not throttle the offered load.
+    """
+    recorder = _Recorder()
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    due = start
+    index = 0
+    with ThreadPoolExecutor(max_workers=max_outstanding) as pool:
+        while True:
+            due += rng.expovariate(rate)
+            if due - start > duration:
+                break
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, index, due, recorder)
+            index += 1
+    return _summarize(recorder, time.perf_counter() - start)
+
+
+def _summarize(recorder: _Recorder, seconds: float) -> Dict[str, Any]:
+    """Latency, TTFT and throughput of one run"""
+    completed = len(recorder.latencies_ms)
+    result = {
+        'duration_seconds': seconds,
+        'status_counts': dict(recorder.statuses),
+        'throughput_rps': completed / seconds if seconds else 0.0,
+        'latency_ms': summarize(recorder.latencies_ms)
+    }
+    if recorder.ttfts_ms:
+        result['ttft_ms'] = summarize(recorder.ttfts_ms)
+    return result
+
+
+def start_local_server(max_length: int, hidden_size: int):
+    """Start the server on a fresh tiny model; returns (base_url, stop)"""
+    from load_test_saturation import start_server
+
+    workdir = tempfile.mkdtemp(prefix="personaplex-load-")
+    model_dir = create_tiny_model(str(Path(workdir) / "model"), hidden_size=hidden_size)
+    config_path = write_config(
+        model_dir, str(Path(workdir) / "config.yaml"),
+        overrides={'server': {'max_queue_size': 1024, 'timeout': 600}}
+    )
+    return start_server(config_path)
+
+
+def run_load(base_url: str, targets: List[str], mode: str, concurrency: int,
+             num_requests: int, rate: float, duration: float, max_length: int,
+             seed: int = 0) -> Dict[str, Any]:
+    """Run the selected load pattern against each target"""
+    audio_bytes = make_wav()
+    results = {}
+    for target in targets:
+        send = make_request_fn(base_url, target, max_length, audio_bytes)
+        # Warmup
+        send(0, time.perf_counter(), _Recorder())
+        if mode == 'closed':
+            results[target] = run_closed_loop(send, concurrency, num_requests)
+        else:
+            results[target] = run_open_loop(send, rate, duration, seed)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="HTTP load generator")
+    parser.add_argument("--url", default=None,
+                        help="Server base URL (default: start a local server on a tiny model)")
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=['generate', 'stream'],
+                        help="Endpoints to load")
+    parser.add_argument("--mode", choices=('closed', 'open'), default='closed', help="Load pattern")
+    parser.add_argument("--concurrency", type=int, default=8, help="Closed loop: concurrent clients")
+    parser.add_argument("--requests", type=int, default=64, help="Closed loop: total requests per target")
+    parser.add_argument("--rate", type=float, default=10.0, help="Open loop: arrivals per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="Open loop: seconds per target")
+    parser.add_argument("--max-length", type=int, default=64, help="max_length per request")
+    parser.add_argument("--hidden-size", type=int, default=64, help="Local tiny model hidden size")
+    parser.add_argument("--seed", type=int, default=0, help="Open loop arrival seed")
+    parser.add_argument("--output", default="benchmark_results/load.json", help="Results JSON path")
+
+    args = parser.parse_args()
+
+    stop = None
+    base_url = args.url
+    if base_url is None:
+        base_url, stop = start_local_server(args.max_length, args.hidden_size)
+    try:
+        results = run_load(
+            base_url, args.targets, args.mode, args.concurrency, args.requests,
+            args.rate, args.duration, args.max_length, args.seed
+        )
+    finally:
+        if stop:
+            stop()
+
+    parameters = vars(args).copy()
+    write_results(args.output, f"load-{args.mode}", parameters, results)
+    for target, result in results.items():
+        latency = result['latency_ms']
+        line = (
+            f"{target:>9}: {result['throughput_rps']:.1f} req/s, "
+            f"p50 {latency['p50']:.1f} / p95 {latency['p95']:.1f} / p99 {latency['p99']:.1f} ms"
+        )
+        if 'ttft_ms' in result:
+            line += f", TTFT p50 {result['ttft_ms']['p50']:.1f} ms"
+        print(f"{line}, statuses {result['status_counts']}")
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Offline micro-benchmark of PersonaPlexModelHandler generation phases
+Times tokenize, prefill, decode and detokenize separately across prompt
+and output lengths, plus handler.generate end to end
+"""
+
+import sys
+import time
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import torch
+from transformers import StoppingCriteriaList
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
+
+from src.model_handler import PersonaPlexModelHandler
+from src.metrics import GenerationTimer
+from create_tiny_model import CORPUS, create_tiny_model, write_config
+from benchmarks.results import summarize, write_results
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def make_prompt(tokenizer, num_tokens: int) -> str:
+    """Text that tokenizes to roughly num_tokens tokens"""
+    text = ""
+    while len(tokenizer(text, add_special_tokens=False)['input_ids']) < num_tokens:
+        text += " ".join(CORPUS) + " "
+    ids = tokenizer(text, add_special_tokens=False)['input_ids'][:num_tokens]
+    return tokenizer.decode(ids)
+
+
+def time_phases(handler: PersonaPlexModelHandler, prompt: str, output_tokens: int) -> Dict[str, float]:
+    """One greedy generation, timed per phase in milliseconds"""
+    timer = GenerationTimer('benchmark')
+    inputs = handler.tokenizer(prompt, return_tensors="pt")
+    inputs = {k: v.to(handler.device) for k, v in inputs.items()}
+    timer.tokenized()
+    with torch.no_grad():
+        timer.generating()
+        outputs = handler.model.generate(
+            **inputs,
+            max_new_tokens=output_tokens,
+            min_new_tokens=output_tokens,
+            do_sample=False,
+            stopping_criteria=StoppingCriteriaList([timer.criteria])
+        )
+        timer.generated()
+    prompt_tokens = inputs['input_ids'].shape[1]
+    handler.tokenizer.decode(outputs[0][prompt_tokens:], skip_special_tokens=True)
+    detokenized_at = time.perf_counter()
+    generated = outputs.shape[1] - prompt_tokens
+    timer.finish(prompt_tokens, generated)
+
+    first_step = timer.criteria.first_step_at
+    decode_ms = (timer.generated_at - first_step) * 1000
+    return {
+        'tokenize_ms': (timer.tokenized_at - timer.start) * 1000,
+        'prefill_ms': (first_step - timer.generate_start) * 1000,
+        'decode_ms': decode_ms,
+        'decode_ms_per_token': decode_ms / max(generated - 1, 1),
+        'detokenize_ms': (detokenized_at - timer.generated_at) * 1000,
+        'prompt_tokens': prompt_tokens,
+        'generated_tokens': generated
+    }
+
+
+def run_case(handler: PersonaPlexModelHandler, prompt_tokens: int, output_tokens: int,
+             repeats: int) -> Dict[str, Any]:
+    """Benchmark one (prompt length, output length) case"""
+    prompt = make_prompt(handler.tokenizer, prompt_tokens)
+    # Warmup
+    time_phases(handler, prompt, output_tokens)
+
+    samples: List[Dict[str, float]] = [time_phases(handler, prompt, output_tokens) for _ in range(repeats)]
+    end_to_end = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        handler.generate(
+            input_text=prompt, max_length=samples[0]['prompt_tokens'] + output_tokens,
+            do_sample=False
+        )
+        end_to_end.append((time.perf_counter() - start) * 1000)
+
+    case = {
+        'name': f"prompt{prompt_tokens}_out{output_tokens}",
+        'prompt_tokens': samples[0]['prompt_tokens'],
+        'output_tokens': output_tokens
+    }
+    for phase in ('tokenize_ms', 'prefill_ms', 'decode_ms', 'decode_ms_per_token', 'detokenize_ms'):
+        case[phase] = summarize([sample[phase] for sample in samples])
+    case['generate_ms'] = summarize(end_to_end)
+    case['decode_tokens_per_second'] = 1000 / case['decode_ms_per_token']['p50'] if case['decode_ms_per_token']['p50'] else 0.0
+    return case
+
+
+def run_micro(prompt_lengths: List[int], output_lengths: List[int], repeats: int = 5,
+              config_path: Optional[str] = None, hidden_size: int = 64,
+              num_layers: int = 2) -> Dict[str, Any]:
+    """Run every case against config_path, or a fresh tiny model"""
+    if config_path is None:
+        workdir = tempfile.mkdtemp(prefix="personaplex-micro-")
+        model_dir = create_tiny_model(
+            str(Path(workdir) / "model"), hidden_size=hidden_size, num_layers=num_layers
+        )
+        config_path = write_config(
+            model_dir, str(Path(workdir) / "config.yaml"),
+            # Prefix reuse would hide prefill cost across repeats
+            overrides={'performance': {'prefix_cache': {'enabled': False}}}
+        )
+    handler = PersonaPlexModelHandler(config_path=config_path)
+    handler.load_model()
+    return {
+        'cases': [
+            run_case(handler, prompt_tokens, output_tokens, repeats)
+            for prompt_tokens in prompt_lengths
+            for output_tokens in output_lengths
+        ]
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Micro-benchmark generation phases")
+    parser.add_argument("--prompt-lengths", type=int, nargs="+", default=[16, 64, 256],
+                        help="Prompt lengths in tokens")
+    parser.add_argument("--output-lengths", type=int, nargs="+", default=[16, 64],
+                        help="Generated tokens per request")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed repetitions per case")
+    parser.add_argument("--config", default=None,
+                        help="Server config to benchmark (default: a fresh tiny model)")
+    parser.add_argument("--hidden-size", type=int, default=64, help="Tiny model hidden size")
+    parser.add_argument("--num-layers", type=int, default=2, help="Tiny model layers")
+    parser.add_argument("--output", default="benchmark_results/micro.json", help="Results JSON path")
+
+    args = parser.parse_args()
+
+    parameters = vars(args).copy()
+    results = run_micro(
+        args.prompt_lengths, args.output_lengths, args.repeats,
+        args.config, args.hidden_size, args.num_layers
+    )
+    write_results(args.output, 'micro', parameters, results)
+    for case in results['cases']:
+        print(
+            f"{case['name']:>20}: tokenize {case['tokenize_ms']['p50']:.2f} ms, "
+            f"prefill {case['prefill_ms']['p50']:.2f} ms, "
+            f"decode {case['decode_ms_per_token']['p50']:.2f} ms/token, "
+            f"generate {case['generate_ms']['p50']:.1f} ms"
+        )
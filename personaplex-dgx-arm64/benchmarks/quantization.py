@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Accuracy-vs-speed report for quantized CPU inference
+Loads the model once per quantization mode, compares next-token logits on a
+fixed prompt set against the unquantized model, and times prefill and decode
+"""
+
+import sys
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import torch
+import torch.nn.functional as F
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
+
+from src.model_handler import PersonaPlexModelHandler
+from create_tiny_model import create_tiny_model, write_config
+from benchmarks.micro import make_prompt, time_phases
+from benchmarks.results import summarize, write_results
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+PROMPTS = [
+    "Hello, how are you today?",
+    "Please tell me about the weather in Santa Clara.",
+    "You are PersonaPlex, a friendly speech-to-speech agent.",
+    "What can I help you with?",
+    "Thank you for calling, have a great day!",
+    "The quick brown fox jumps over the lazy dog.",
+    "I am a helpful conversational assistant.",
+    "Could you repeat that more slowly, please?",
+]
+
+
+def prompt_logits(handler: PersonaPlexModelHandler, prompts: List[str]) -> List[torch.Tensor]:
+    """Float32 logits at every position of each prompt"""
+    logits = []
+    with torch.no_grad():
+        for prompt in prompts:
+            inputs = handler.tokenizer(prompt, return_tensors="pt")
+            inputs = {k: v.to(handler.device) for k, v in inputs.items()}
+            logits.append(handler.model(**inputs).logits[0].float().cpu())
+    return logits
+
+
+def greedy_tokens(handler: PersonaPlexModelHandler, prompts: List[str], new_tokens: int) -> List[List[int]]:
+    """Greedy continuation of each prompt"""
+    outputs = []
+    with torch.no_grad():
+        for prompt in prompts:
+            inputs = handler.tokenizer(prompt, return_tensors="pt")
+            inputs = {k: v.to(handler.device) for k, v in inputs.items()}
+            generated = handler.model.generate(
+                **inputs, max_new_tokens=new_tokens, min_new_tokens=new_tokens, do_sample=False
+            )
+            outputs.append(generated[0, inputs['input_ids'].shape[1]:].tolist())
+    return outputs
+
+
+def compare_logits(reference: List[torch.Tensor], candidate: List[torch.Tensor]) -> Dict[str, float]:
+    """Error of candidate logits relative to the reference, over all positions"""
+    ref = torch.cat(reference)
+    cand = torch.cat(candidate)
+    kl = F.kl_div(F.log_softmax(cand, dim=-1), F.log_softmax(ref, dim=-1),
+                  log_target=True, reduction='none').sum(dim=-1)
+    return {
+        'max_abs_diff': float((cand - ref).abs().max()),
+        'relative_rmse': float((cand - ref).pow(2).mean().sqrt() / ref.pow(2).mean().sqrt()),
+        'mean_kl': float(kl.mean()),
+        'max_kl': float(kl.max()),
+        'top1_agreement': float((cand.argmax(-1) == ref.argmax(-1)).float().mean())
+    }
+
+
+def greedy_agreement(reference: List[List[int]], candidate: List[List[int]]) -> Dict[str, float]:
+    """How long greedy outputs stay identical to the reference"""
+    prefixes = []
+    for ref, cand in zip(reference, candidate):
+        length = 0
+        while length < min(len(ref), len(cand)) and ref[length] == cand[length]:
+            length += 1
+        prefixes.append(length / max(len(ref), 1))
+    return {
+        'identical_outputs': sum(prefix == 1.0 for prefix in prefixes) / len(prefixes),
+        'mean_matching_prefix': sum(prefixes) / len(prefixes)
+    }
+
+
+def time_mode(handler: PersonaPlexModelHandler, prompt_tokens: int, output_tokens: int,
+              repeats: int) -> Dict[str, Any]:
+    """Prefill and decode latency of one mode"""
+    prompt = make_prompt(handler.tokenizer, prompt_tokens)
+    time_phases(handler, prompt, output_tokens)
+    samples = [time_phases(handler, prompt, output_tokens) for _ in range(repeats)]
+    timing = {
+        'prefill_ms': summarize([sample['prefill_ms'] for sample in samples]),
+        'decode_ms_per_token': summarize([sample['decode_ms_per_token'] for sample in samples])
+    }
+    per_token = timing['decode_ms_per_token']['p50']
+    timing['decode_tokens_per_second'] = 1000 / per_token if per_token else 0.0
+    return timing
+
+
+def run_report(modes: List[str], config_path: Optional[str] = None, hidden_size: int = 512,
+               num_layers: int = 4, prompt_tokens: int = 128, output_tokens: int = 32,
+               new_tokens: int = 16, repeats: int = 5) -> Dict[str, Any]:
+    """Accuracy and speed of each mode against the unquantized model"""
+    workdir = tempfile.mkdtemp(prefix="personaplex-quant-")
+    if config_path is None:
+        model_dir = create_tiny_model(
+            str(Path(workdir) / "model"), hidden_size=hidden_size, num_layers=num_layers, num_heads=8
+        )
+        config_path = write_config(model_dir, str(Path(workdir) / "base.yaml"))
+
+    results = {'modes': []}
+    reference_logits = reference_tokens = None
+    for mode in ['none'] + [mode for mode in modes if mode != 'none']:
+        handler = PersonaPlexModelHandler(config_path=_mode_config(config_path, workdir, mode))
+        handler.load_model()
+
+        logits = prompt_logits(handler, PROMPTS)
+        tokens = greedy_tokens(handler, PROMPTS, new_tokens)
+        entry = {
+            'name': mode,
+            'quantization': handler.quantization_info,
+            'load_ms': handler.startup_timings.get('total'),
+            **time_mode(handler, prompt_tokens, output_tokens, repeats)
+        }
+        if reference_logits is None:
+            reference_logits, reference_tokens = logits, tokens
+        else:
+            entry['accuracy'] = {
+                **compare_logits(reference_logits, logits),
+                **greedy_agreement(reference_tokens, tokens)
+            }
+            baseline = results['modes'][0]
+            entry['decode_speedup'] = (
+                entry['decode_tokens_per_second'] / baseline['decode_tokens_per_second']
+                if baseline['decode_tokens_per_second'] else 0.0
+            )
+            entry['prefill_speedup'] = (
+                baseline['prefill_ms']['p50'] / entry['prefill_ms']['p50']
+                if entry['prefill_ms']['p50'] else 0.0
+            )
+        results['modes'].append(entry)
+        del handler
+    return results
+
+
+def _mode_config(config_path: str, workdir: str, mode: str) -> str:
+    """Copy of config_path serving with the given quantization mode"""
+    import yaml
+
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    config['model']['quantization'] = mode
+    # Prefix reuse would hide prefill cost across repeats
+    config.setdefault('performance', {}).setdefault('prefix_cache', {})['enabled'] = False
+    path = str(Path(workdir) / f"{mode}.yaml")
+    with open(path, 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Quantization accuracy-vs-speed report")
+    parser.add_argument("--modes", nargs="+", choices=('int8', 'int4'), default=['int8', 'int4'],
+                        help="Modes compared against the unquantized model")
+    parser.add_argument("--config", default=None,
+                        help="Server config to benchmark (default: a fresh tiny model)")
+    parser.add_argument("--hidden-size", type=int, default=512, help="Tiny model hidden size")
+    parser.add_argument("--num-layers", type=int, default=4, help="Tiny model layers")
+    parser.add_argument("--prompt-tokens", type=int, default=128, help="Prompt length for timing")
+    parser.add_argument("--output-tokens", type=int, default=32, help="Generated tokens for timing")
+    parser.add_argument("--new-tokens", type=int, default=16, help="Greedy tokens compared per prompt")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed repetitions")
+    parser.add_argument("--output", default="benchmark_results/quantization.json", help="Results JSON path")
+
+    args = parser.parse_args()
+
+    parameters = vars(args).copy()
+    results = run_report(
+        args.modes, args.config, args.hidden_size, args.num_layers,
+        args.prompt_tokens, args.output_tokens, args.new_tokens, args.repeats
+    )
+    write_results(args.output, 'quantization', parameters, results)
+    for entry in results['modes']:
+        line = (
+            f"{entry['name']:>5}: prefill {entry['prefill_ms']['p50']:.1f} ms, "
+            f"decode {entry['decode_tokens_per_second']:.1f} tok/s"
+        )
+        if 'accuracy' in entry:
+            accuracy = entry['accuracy']
+            quantization = entry['quantization']
+            line += (
+                f", linear weights {quantization['linear_bytes_before'] / 2**20:.1f} -> "
+                f"{quantization['linear_bytes_after'] / 2**20:.1f} MiB"
+                f", speedup {entry['decode_speedup']:.2f}x, KL {accuracy['mean_kl']:.2e}, "
+                f"top-1 {accuracy['top1_agreement']:.1%}, identical greedy {accuracy['identical_outputs']:.0%}"
+            )
+        print(line)
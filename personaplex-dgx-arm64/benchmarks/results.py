@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Benchmark result files for PersonaPlex
+Writes JSON results with environment details and compares them to a baseline
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+import logging
+from pathlib import Path
+from typing import Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Metric name fragments where higher is better; everything else timed is lower-is-better
+HIGHER_IS_BETTER = ('rps', 'per_second', 'throughput', 'speedup')
+LOWER_IS_BETTER = ('_ms', '_seconds', 'latency')
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/mean/max of a list of samples"""
+    return {
+        'count': len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'mean': sum(values) / len(values) if values else 0.0,
+        'max': max(values) if values else 0.0
+    }
+
+
+def environment() -> Dict[str, Any]:
+    """Details that make results comparable (or explain why they are not)"""
+    import torch
+
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, cwd=Path(__file__).parent, timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        'timestamp': time.time(),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count(),
+        'torch_threads': torch.get_num_threads(),
+        'cuda': torch.cuda.is_available()
+    }
+
+
+def write_results(path: str, benchmark: str, parameters: Dict[str, Any],
+                  results: Dict[str, Any]) -> Dict[str, Any]:
+    """Write a result document to path and return it"""
+    document = {
+        'benchmark': benchmark,
+        'environment': environment(),
+        'parameters': parameters,
+        'results': results
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2)
+    logger.info(f"Results written to: {path}")
+    return document
+
+
+def flatten(value: Any, prefix: str = "") -> Dict[str, float]:
+    """Flatten nested results into dotted-name numeric metrics"""
+    metrics = {}
+    if isinstance(value, dict):
+        for key, item in value.items():
+            metrics.update(flatten(item, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            # Lists of cases are keyed by their 'name' when they have one
+            key = item.get('name', index) if isinstance(item, dict) else index
+            metrics.update(flatten(item, f"{prefix}[{key}]"))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        metrics[prefix] = float(value)
+    return metrics
+
+
+def direction(metric: str) -> int:
+    """+1 if higher is better, -1 if lower is better, 0 if not compared"""
+    leaf = metric.rsplit('.', 1)[-1]
+    if leaf == 'count':
+        return 0
+    if any(fragment in metric for fragment in HIGHER_IS_BETTER):
+        return 1
+    if any(fragment in metric for fragment in LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any],
+            threshold: float = 0.10) -> List[Tuple[str, float, float, float]]:
+    """Return (metric, baseline, current, relative change) for regressions
+
+    A metric regresses when it moves in its bad direction by more than
+    threshold (relative). Metrics missing from either side are skipped.
+    """
+    base_metrics = flatten(baseline.get('results', {}))
+    current_metrics = flatten(current.get('results', {}))
+    regressions = []
+    for metric, base_value in sorted(base_metrics.items()):
+        sign = direction(metric)
+        if not sign or metric not in current_metrics or base_value == 0:
+            continue
+        change = (current_metrics[metric] - base_value) / abs(base_value)
+        if change * sign < -threshold:
+            regressions.append((metric, base_value, current_metrics[metric], change))
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Compare benchmark results against a baseline")
+    parser.add_argument("baseline", help="Baseline results JSON")
+    parser.add_argument("current", help="Current results JSON")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative change treated as a regression")
+
+    args = parser.parse_args()
+
+    with open(args.baseline, 'r') as f:
+        baseline_doc = json.load(f)
+    with open(args.current, 'r') as f:
+        current_doc = json.load(f)
+    if baseline_doc.get('benchmark') != current_doc.get('benchmark'):
+        logger.error("Results come from different benchmarks")
+        sys.exit(2)
+
+    found = compare(baseline_doc, current_doc, args.threshold)
+    for metric, base_value, current_value, change in found:
+        print(f"REGRESSION {metric}: {base_value:.4g} -> {current_value:.4g} ({change:+.1%})")
+    if found:
+        sys.exit(1)
+    print("No regressions")
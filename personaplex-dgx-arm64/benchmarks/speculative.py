@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Speculative decoding report
+Serves the same greedy prompts with and without a draft model, checks the
+outputs are identical, and reports acceptance rate, tokens per main-model
+step and decode speedup; also checks that a draft which never agrees with
+the main model triggers the fallback to plain decoding
+"""
+
+import sys
+import time
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import torch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
+
+from src.model_handler import PersonaPlexModelHandler
+from create_tiny_model import create_tiny_model, create_draft_model, write_config
+from benchmarks.quantization import PROMPTS
+from benchmarks.results import summarize, write_results
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def make_models(workdir: str, hidden_size: int, num_layers: int, draft_layers: int,
+                damping: float) -> Dict[str, str]:
+    """Main model, a matching draft and an unrelated draft
+
+    Random weights give a layer-truncated draft little to agree on, so the
+    main model's layers past draft_layers have their residual outputs
+    scaled by damping: the draft then behaves like a well-matched one,
+    predicting most (not all) of the main model's tokens.
+    """
+    from transformers import AutoModelForCausalLM
+
+    main_dir = create_tiny_model(
+        str(Path(workdir) / "main"), hidden_size=hidden_size, num_layers=num_layers, num_heads=8
+    )
+    model = AutoModelForCausalLM.from_pretrained(main_dir)
+    with torch.no_grad():
+        for layer in model.model.layers[draft_layers:]:
+            layer.self_attn.o_proj.weight.mul_(damping)
+            layer.mlp.down_proj.weight.mul_(damping)
+    model.save_pretrained(main_dir)
+    return {
+        'main': main_dir,
+        'draft': create_draft_model(main_dir, str(Path(workdir) / "draft"), draft_layers),
+        # Same tokenizer and shape, different random weights
+        'unrelated': create_tiny_model(
+            str(Path(workdir) / "unrelated"), hidden_size=hidden_size, num_layers=draft_layers,
+            num_heads=8, seed=1
+        )
+    }
+
+
+def serve(config_path: str, prompts: List[str], new_tokens: int, repeats: int) -> Dict[str, Any]:
+    """Greedy outputs, latency and speculative stats of one configuration"""
+    handler = PersonaPlexModelHandler(config_path=config_path)
+    handler.load_model()
+    outputs, latencies = [], []
+    for _ in range(repeats):
+        outputs = []
+        for prompt in prompts:
+            start = time.perf_counter()
+            result = handler.generate(
+                input_text=prompt, max_new_tokens=new_tokens, min_new_tokens=new_tokens, do_sample=False
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not result['success']:
+                raise RuntimeError(result['error'])
+            outputs.append(result['output'])
+    return {
+        'outputs': outputs,
+        'latency_ms': summarize(latencies),
+        'tokens_per_second': new_tokens * len(latencies) / (sum(latencies) / 1000),
+        'speculative': handler.speculative.get_stats()
+    }
+
+
+def run_report(hidden_size: int = 512, num_layers: int = 8, draft_layers: int = 1,
+               damping: float = 0.02, num_draft_tokens: int = 5, new_tokens: int = 64,
+               repeats: int = 2, window: int = 4) -> Dict[str, Any]:
+    """Plain, speculative and mismatched-draft serving of the same prompts"""
+    workdir = tempfile.mkdtemp(prefix="personaplex-speculative-")
+    models = make_models(workdir, hidden_size, num_layers, draft_layers, damping)
+
+    def config(name: str, draft: Optional[str]) -> str:
+        speculative = {
+            'enabled': draft is not None,
+            'draft_model': draft,
+            'num_draft_tokens': num_draft_tokens,
+            # Random weights give low-confidence drafts; propose the full length
+            'confidence_threshold': 0.0,
+            'window': window,
+            'retry_after': len(PROMPTS)
+        }
+        return write_config(models['main'], str(Path(workdir) / f"{name}.yaml"), overrides={
+            'performance': {'speculative': speculative, 'prefix_cache': {'enabled': False}}
+        })
+
+    plain = serve(config('plain', None), PROMPTS, new_tokens, repeats)
+    speculative = serve(config('speculative', models['draft']), PROMPTS, new_tokens, repeats)
+    unrelated = serve(config('unrelated', models['unrelated']), PROMPTS, new_tokens, 1)
+    return {
+        'models': models,
+        'plain': {k: v for k, v in plain.items() if k != 'outputs'},
+        'speculative': {k: v for k, v in speculative.items() if k != 'outputs'},
+        'unrelated_draft': {k: v for k, v in unrelated.items() if k != 'outputs'},
+        'identical_greedy_outputs': (
+            sum(a == b for a, b in zip(plain['outputs'], speculative['outputs'])) / len(PROMPTS)
+        ),
+        'unrelated_identical_greedy_outputs': (
+            sum(a == b for a, b in zip(plain['outputs'], unrelated['outputs'])) / len(PROMPTS)
+        ),
+        'speedup': speculative['tokens_per_second'] / plain['tokens_per_second']
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Speculative decoding acceptance, speedup and equivalence")
+    parser.add_argument("--hidden-size", type=int, default=512, help="Tiny model hidden size")
+    parser.add_argument("--num-layers", type=int, default=8, help="Main model layers")
+    parser.add_argument("--draft-layers", type=int, default=1, help="Draft model layers")
+    parser.add_argument("--damping", type=float, default=0.02,
+                        help="Residual scale of main-model layers the draft lacks (1.0 = untouched)")
+    parser.add_argument("--num-draft-tokens", type=int, default=5, help="Tokens proposed per step")
+    parser.add_argument("--new-tokens", type=int, default=64, help="Greedy tokens per prompt")
+    parser.add_argument("--repeats", type=int, default=2, help="Passes over the prompt set")
+    parser.add_argument("--output", default="benchmark_results/speculative.json", help="Results JSON path")
+
+    args = parser.parse_args()
+
+    parameters = vars(args).copy()
+    results = run_report(
+        args.hidden_size, args.num_layers, args.draft_layers, args.damping,
+        args.num_draft_tokens, args.new_tokens, args.repeats
+    )
+    write_results(args.output, 'speculative', parameters, results)
+
+    stats = results['speculative']['speculative']
+    unrelated = results['unrelated_draft']['speculative']
+    print(
+        f"plain {results['plain']['tokens_per_second']:.1f} tok/s, "
+        f"speculative {results['speculative']['tokens_per_second']:.1f} tok/s ({results['speedup']:.2f}x)"
+    )
+    print(
+        f"acceptance {stats['acceptance_rate']:.1%}, {stats['tokens_per_step']:.2f} tokens per step, "
+        f"identical greedy outputs {results['identical_greedy_outputs']:.0%}"
+    )
+    print(
+        f"unrelated draft: acceptance {unrelated['acceptance_rate']:.1%}, fallbacks {unrelated['fallbacks']}, "
+        f"{unrelated['fallback_requests']} requests decoded without it, "
+        f"identical greedy outputs {results['unrelated_identical_greedy_outputs']:.0%}"
+    )
+    failures = []
+    if results['identical_greedy_outputs'] < 1 or results['unrelated_identical_greedy_outputs'] < 1:
+        failures.append("speculative greedy outputs differ from plain decoding")
+    if not unrelated['fallbacks']:
+        failures.append("a draft that never agrees did not trigger the fallback")
+    if failures:
+        for failure in failures:
+            logger.error(failure)
+        sys.exit(1)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Tokenizer layer report
+Compares the per-call tokenizer path generate() used to take against the
+TokenizerService: concurrent encodes one call each vs batched and cached,
+and streaming detokenization that re-decodes the whole sequence every step
+vs the incremental detokenizer; also checks both give the same IDs and text
+"""
+
+import sys
+import time
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Callable
+
+import torch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
+
+from src.tokenization import TokenizerService, IncrementalDetokenizer
+from create_tiny_model import create_tiny_model
+from benchmarks.load import PROMPTS
+from benchmarks.results import summarize, write_results
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+PERSONA = (
+    "You are PersonaPlex, a friendly and concise voice assistant. Answer in one or two "
+    "sentences, avoid lists, and ask a clarifying question when the request is ambiguous. "
+)
+
+
+def run_concurrent(encode: Callable[[str], Any], texts: List[str], clients: int) -> Dict[str, Any]:
+    """Per-call latency and throughput of clients threads encoding texts between them"""
+    latencies: List[float] = []
+    lock = threading.Lock()
+    start_gate = threading.Barrier(clients + 1)
+
+    def client(offset: int):
+        start_gate.wait()
+        for text in texts[offset::clients]:
+            start = time.perf_counter()
+            encode(text)
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client, args=(offset,)) for offset in range(clients)]
+    for thread in threads:
+        thread.start()
+    start_gate.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    return {'latency_ms': summarize(latencies), 'encodes_per_s': len(texts) / wall}
+
+
+def encode_report(tokenizer, texts: List[str], clients: int) -> Dict[str, Any]:
+    """Concurrent encodes: per-call vs batched vs batched and cached"""
+    def per_call(text: str):
+        return tokenizer(text, return_tensors="pt")
+
+    results = {'per_call': run_concurrent(per_call, texts, clients)}
+    for name, overrides in (('batched', {'cache_size': 0}), ('batched_cached', {})):
+        service = TokenizerService({'performance': {'tokenizer': overrides}})
+        service.attach(tokenizer)
+
+        def batched(text: str):
+            return service.to_inputs([service.encode(text)])
+
+        results[name] = run_concurrent(batched, texts, clients)
+        results[name]['stats'] = service.get_stats()
+
+    service = TokenizerService({'performance': {'tokenizer': {'cache_size': 0}}})
+    service.attach(tokenizer)
+    unique = list(dict.fromkeys(texts))
+    results['identical_ids'] = all(
+        service.encode(text) == tokenizer(text)['input_ids'] for text in unique
+    ) and service.encode_batch(unique) == [tokenizer(text)['input_ids'] for text in unique]
+    return results
+
+
+def detokenize_report(tokenizer, token_ids: List[int], lengths: List[int], repeats: int) -> Dict[str, Any]:
+    """Streaming detokenization of growing sequences: full re-decode vs incremental"""
+    def full(ids: List[int]) -> str:
+        # The TextStreamer logic the handler streamed with before: re-decode
+        # everything since the last newline on every token
+        from transformers import TextStreamer
+
+        pieces: List[str] = []
+        streamer = TextStreamer(tokenizer, skip_special_tokens=True)
+        streamer.on_finalized_text = lambda text, stream_end=False: pieces.append(text)
+        for token in ids:
+            streamer.put(torch.tensor([token]))
+        streamer.end()
+        return "".join(pieces)
+
+    def incremental(ids: List[int]) -> str:
+        detokenizer = IncrementalDetokenizer(tokenizer)
+        return "".join(detokenizer.push([token]) for token in ids) + detokenizer.flush()
+
+    results: Dict[str, Any] = {}
+    identical = True
+    for length in lengths:
+        ids = token_ids[:length]
+        row = {}
+        for name, run in (('full_redecode', full), ('incremental', incremental)):
+            times = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                text = run(ids)
+                times.append((time.perf_counter() - start) * 1000)
+            identical &= text == tokenizer.decode(ids, skip_special_tokens=True)
+            row[name] = {'sequence_ms': summarize(times), 'per_token_us': summarize(times)['p50'] / length * 1000}
+        row['speedup'] = row['full_redecode']['sequence_ms']['p50'] / row['incremental']['sequence_ms']['p50']
+        results[str(length)] = row
+    results['identical_text'] = identical
+    return results
+
+
+def run_report(clients: int = 8, requests: int = 2000, lengths: List[int] = None,
+               repeats: int = 5) -> Dict[str, Any]:
+    """Encode and detokenize comparisons on the tiny model's tokenizer"""
+    from transformers import AutoTokenizer
+
+    workdir = tempfile.mkdtemp(prefix="personaplex-tokenizer-")
+    model_dir = create_tiny_model(str(Path(workdir) / "model"))
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+    # Every request repeats the persona prompt in front of one of a few user
+    # turns, so hot strings recur as they do behind a persona deployment
+    texts = [PERSONA + PROMPTS[index % len(PROMPTS)] for index in range(requests)]
+    stream_text = " ".join(PROMPTS) + " Ünïcödé 日本語 😀 "
+    token_ids = tokenizer(stream_text * 64, add_special_tokens=False)['input_ids']
+    lengths = lengths or [64, 256, 1024]
+    return {
+        'encode': encode_report(tokenizer, texts, clients),
+        'detokenize': detokenize_report(tokenizer, token_ids, lengths, repeats)
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Per-call vs batched/cached tokenization and streaming detokenization")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent encoding threads")
+    parser.add_argument("--requests", type=int, default=2000, help="Encodes across all clients")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[64, 256, 1024], help="Streamed sequence lengths")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per sequence length")
+    parser.add_argument("--output", default="benchmark_results/tokenizer.json", help="Results JSON path")
+
+    args = parser.parse_args()
+
+    parameters = vars(args).copy()
+    results = run_report(args.clients, args.requests, args.lengths, args.repeats)
+    write_results(args.output, 'tokenizer', parameters, results)
+
+    encode = results['encode']
+    for name in ('per_call', 'batched', 'batched_cached'):
+        latency = encode[name]['latency_ms']
+        print(
+            f"{name:>15}: p50 {latency['p50']:.3f} / p95 {latency['p95']:.3f} ms, "
+            f"{encode[name]['encodes_per_s']:.0f} encodes/s"
+        )
+    for length, row in results['detokenize'].items():
+        if isinstance(row, dict):
+            print(
+                f"{length:>5} tokens: full re-decode {row['full_redecode']['sequence_ms']['p50']:.1f} ms, "
+                f"incremental {row['incremental']['sequence_ms']['p50']:.1f} ms ({row['speedup']:.1f}x)"
+            )
+    print(
+        f"identical IDs: {encode['identical_ids']}, "
+        f"identical streamed text: {results['detokenize']['identical_text']}"
+    )
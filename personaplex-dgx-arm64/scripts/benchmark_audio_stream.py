@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Measure response latency of streaming audio input
+Plays a WAV file (or a generated tone) to /ws/audio in real time, chunk by
+chunk, and compares latency from the last audio frame to the first response
+message with the one-shot /generate/audio upload of the same audio.
+Without --url it starts its own server on a tiny CPU model with a
+stand-in audio processor.
+"""
+
+import io
+import sys
+import json
+import time
+import wave
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+import numpy as np
+import requests
+from websockets.sync.client import connect
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmarks.results import summarize, write_results
+from create_tiny_model import create_tiny_model, write_config
+from benchmark_vad import SAMPLE_RATE, make_speech
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def load_audio(path: Optional[str], seconds: float = 3.0) -> Dict[str, Any]:
+    """16-bit PCM frames and layout of a WAV file, or of generated speech-like audio"""
+    if path:
+        with wave.open(path, 'rb') as wav:
+            if wav.getsampwidth() != 2:
+                raise ValueError("Only 16-bit WAV files are supported")
+            return {
+                'pcm': wav.readframes(wav.getnframes()),
+                'sample_rate': wav.getframerate(),
+                'channels': wav.getnchannels()
+            }
+    # Speech-like with quiet lead-in and tail: the upload route's VAD rejects
+    # a pure tone and needs some background to measure speech against
+    rng = np.random.default_rng(0)
+    pause = np.zeros(int(0.3 * SAMPLE_RATE), dtype=np.float32)
+    speech = np.concatenate([pause, make_speech(seconds, rng), pause])
+    speech += (0.001 * rng.standard_normal(len(speech))).astype(np.float32)
+    pcm = (np.clip(speech, -1, 1) * 32767).astype('<i2')
+    return {'pcm': pcm.tobytes(), 'sample_rate': SAMPLE_RATE, 'channels': 1}
+
+
+def to_wav(audio: Dict[str, Any]) -> bytes:
+    """Wrap PCM frames in a WAV container"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(audio['channels'])
+        wav.setsampwidth(2)
+        wav.setframerate(audio['sample_rate'])
+        wav.writeframes(audio['pcm'])
+    return buffer.getvalue()
+
+
+def stream_utterance(ws_url: str, audio: Dict[str, Any], message_ms: float,
+                     max_length: int) -> Dict[str, Any]:
+    """Send one utterance in real time; returns latency and response counts"""
+    frame_bytes = 2 * audio['channels']
+    step = int(audio['sample_rate'] * message_ms / 1000) * frame_bytes
+    pcm = audio['pcm']
+    with connect(ws_url, max_size=None) as ws:
+        json.loads(ws.recv())
+        ws.send(json.dumps({
+            'type': 'start', 'sample_rate': audio['sample_rate'],
+            'channels': audio['channels'], 'dtype': 'int16', 'max_length': max_length
+        }))
+        json.loads(ws.recv())
+
+        start = time.perf_counter()
+        for offset in range(0, len(pcm), step):
+            # Pace the upload like a live microphone
+            delay = start + offset / frame_bytes / audio['sample_rate'] - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            ws.send(pcm[offset:offset + step])
+        ws.send(json.dumps({'type': 'end'}))
+        ended_at = time.perf_counter()
+
+        first_final_at = None
+        partial_responses = set()
+        while True:
+            message = json.loads(ws.recv())
+            if message.get('type') == 'error':
+                raise RuntimeError(message['error'])
+            if not message.get('final'):
+                partial_responses.add(message.get('response'))
+                continue
+            if first_final_at is None:
+                first_final_at = time.perf_counter()
+            if message.get('type') == 'done':
+                return {
+                    'client_latency_ms': (first_final_at - ended_at) * 1000,
+                    'server_latency_ms': message['latency_ms'],
+                    'partial_responses': len(partial_responses),
+                    'total_ms': (time.perf_counter() - start) * 1000
+                }
+
+
+def upload_utterance(base_url: str, wav_bytes: bytes) -> float:
+    """Latency of the one-shot upload, sent once the utterance is over"""
+    start = time.perf_counter()
+    response = requests.post(
+        f"{base_url}/generate/audio",
+        files={'audio': ('input.wav', wav_bytes, 'audio/wav')},
+        timeout=600
+    )
+    response.raise_for_status()
+    return (time.perf_counter() - start) * 1000
+
+
+def start_local_server():
+    """Start the server on a fresh tiny model that accepts audio; returns (base_url, stop)"""
+    from load_test_saturation import start_server
+
+    workdir = tempfile.mkdtemp(prefix="personaplex-audio-stream-")
+    model_dir = create_tiny_model(str(Path(workdir) / "model"), audio=True)
+    config_path = write_config(model_dir, str(Path(workdir) / "config.yaml"))
+    return start_server(config_path)
+
+
+def run_benchmark(base_url: str, audio: Dict[str, Any], repeats: int, message_ms: float,
+                  max_length: int) -> Dict[str, Any]:
+    """Streaming vs upload latency over repeats utterances"""
+    ws_url = base_url.replace('http', 'ws', 1) + "/ws/audio"
+    streamed = [stream_utterance(ws_url, audio, message_ms, max_length) for _ in range(repeats)]
+    wav_bytes = to_wav(audio)
+    uploaded = [upload_utterance(base_url, wav_bytes) for _ in range(repeats)]
+    return {
+        'audio_seconds': len(audio['pcm']) / (2 * audio['channels']) / audio['sample_rate'],
+        'stream_last_frame_to_first_response_ms': summarize([r['client_latency_ms'] for r in streamed]),
+        'stream_server_reported_ms': summarize([r['server_latency_ms'] for r in streamed]),
+        'stream_partial_responses': sum(r['partial_responses'] for r in streamed) / repeats,
+        'upload_end_of_speech_to_response_ms': summarize(uploaded)
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark streaming audio latency")
+    parser.add_argument("--url", default=None,
+                        help="Server base URL (default: start a local server on a tiny model)")
+    parser.add_argument("--wav", default=None, help="16-bit WAV to play (default: 3 s of speech-like audio)")
+    parser.add_argument("--repeats", type=int, default=5, help="Utterances per mode")
+    parser.add_argument("--message-ms", type=float, default=100.0, help="Audio per WebSocket message")
+    parser.add_argument("--max-length", type=int, default=64, help="max_length per response")
+    parser.add_argument("--output", default=None, help="Results JSON path")
+
+    args = parser.parse_args()
+
+    stop = None
+    base_url = args.url
+    if base_url is None:
+        base_url, stop = start_local_server()
+    try:
+        results = run_benchmark(
+            base_url, load_audio(args.wav), args.repeats, args.message_ms, args.max_length
+        )
+    finally:
+        if stop:
+            stop()
+    if args.output:
+        write_results(args.output, 'audio_stream', vars(args).copy(), results)
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Measure /generate micro-batching throughput with a tiny stand-in model
+Compares sequential batch-size-1 generation against the BatchScheduler
+"""
+
+import sys
+import time
+import json
+import logging
+import tempfile
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.model_handler import PersonaPlexModelHandler
+from src.batching import BatchScheduler
+from create_tiny_model import create_tiny_model, write_config
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+PROMPTS = [
+    "Hello, how are you today?",
+    "Please tell me about the weather.",
+    "What can I help you with?",
+    "Thank you for calling!",
+]
+
+
+def run_benchmark(num_requests: int = 64, batch_size: int = 8,
+                  max_wait_ms: float = 10, max_length: int = 64) -> dict:
+    """Run the sequential and batched passes and return throughput numbers"""
+    workdir = tempfile.mkdtemp(prefix="personaplex-bench-")
+    model_dir = create_tiny_model(str(Path(workdir) / "model"))
+    config_path = write_config(model_dir, str(Path(workdir) / "config.yaml"))
+
+    handler = PersonaPlexModelHandler(config_path=config_path)
+    handler.load_model()
+    prompts = [PROMPTS[i % len(PROMPTS)] for i in range(num_requests)]
+
+    # Warmup
+    handler.generate(input_text=prompts[0], max_length=max_length)
+
+    start = time.perf_counter()
+    for prompt in prompts:
+        handler.generate(input_text=prompt, max_length=max_length)
+    sequential_seconds = time.perf_counter() - start
+
+    scheduler = BatchScheduler(handler, max_batch_size=batch_size, max_wait_ms=max_wait_ms)
+    scheduler.start()
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=num_requests) as pool:
+            futures = list(pool.map(
+                lambda prompt: scheduler.submit(prompt, max_length=max_length),
+                prompts
+            ))
+            for future in futures:
+                future.result()
+        batched_seconds = time.perf_counter() - start
+        stats = scheduler.get_stats()
+    finally:
+        scheduler.stop()
+
+    return {
+        'num_requests': num_requests,
+        'batch_size': batch_size,
+        'sequential_rps': num_requests / sequential_seconds,
+        'batched_rps': num_requests / batched_seconds,
+        'speedup': sequential_seconds / batched_seconds,
+        'avg_batch_size': stats['avg_batch_size']
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark micro-batching throughput")
+    parser.add_argument("--requests", type=int, default=64, help="Number of requests")
+    parser.add_argument("--batch-size", type=int, default=8, help="Max batch size")
+    parser.add_argument("--max-wait-ms", type=float, default=10, help="Batching window")
+    parser.add_argument("--max-length", type=int, default=64, help="max_length per request")
+
+    args = parser.parse_args()
+
+    results = run_benchmark(args.requests, args.batch_size, args.max_wait_ms, args.max_length)
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Measure replica-pool throughput scaling with a tiny stand-in model on CPU
+Runs the same request load through pools of 1..N CPU replicas
+"""
+
+import os
+import sys
+import time
+import json
+import logging
+import tempfile
+from pathlib import Path
+from concurrent.futures import wait
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.model_handler import PersonaPlexModelHandler
+from src.replicas import ReplicaPool
+from create_tiny_model import create_tiny_model, write_config
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+PROMPTS = [
+    "Hello, how are you today?",
+    "Please tell me about the weather.",
+    "What can I help you with?",
+    "Thank you for calling!",
+]
+
+
+def measure_pool(config_path: str, num_requests: int, max_length: int) -> dict:
+    """Push num_requests through a replica pool and return its throughput"""
+    handler = PersonaPlexModelHandler(config_path=config_path)
+    handler.load_model()
+    pool = ReplicaPool(handler)
+    pool.start()
+    try:
+        # Warmup every replica
+        wait([pool.submit(PROMPTS[0], max_length=max_length) for _ in pool.replicas])
+
+        start = time.perf_counter()
+        futures = [
+            pool.submit(PROMPTS[i % len(PROMPTS)], max_length=max_length)
+            for i in range(num_requests)
+        ]
+        for future in futures:
+            future.result()
+        seconds = time.perf_counter() - start
+        stats = pool.get_stats()
+    finally:
+        pool.stop()
+
+    return {
+        'replicas': len(stats['replicas']),
+        'rps': num_requests / seconds,
+        'per_replica_completed': [replica['completed'] for replica in stats['replicas']]
+    }
+
+
+def run_benchmark(max_replicas: int = 2, num_requests: int = 48,
+                  max_length: int = 64, hidden_size: int = 256) -> dict:
+    """Measure throughput for 1..max_replicas CPU replicas"""
+    workdir = tempfile.mkdtemp(prefix="personaplex-replicas-")
+    model_dir = create_tiny_model(str(Path(workdir) / "model"), hidden_size=hidden_size)
+
+    runs = []
+    for num_replicas in range(1, max_replicas + 1):
+        config_path = write_config(
+            model_dir, str(Path(workdir) / f"config_{num_replicas}.yaml"),
+            overrides={
+                'gpu': {'cpu_replicas': num_replicas},
+                # batch_size 1 keeps each replica compute-bound
+                'performance': {'batch_size': 1, 'prefix_cache': {'enabled': False}}
+            }
+        )
+        runs.append(measure_pool(config_path, num_requests, max_length))
+
+    baseline = runs[0]['rps']
+    for run in runs:
+        run['scaling'] = run['rps'] / baseline
+    return {
+        'cpus': len(os.sched_getaffinity(0)),
+        'num_requests': num_requests,
+        'runs': runs
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark replica-pool throughput scaling")
+    parser.add_argument("--max-replicas", type=int, default=2, help="Largest pool to measure")
+    parser.add_argument("--requests", type=int, default=48, help="Requests per pool")
+    parser.add_argument("--max-length", type=int, default=64, help="max_length per request")
+    parser.add_argument("--hidden-size", type=int, default=256, help="Tiny model hidden size")
+
+    args = parser.parse_args()
+
+    results = run_benchmark(args.max_replicas, args.requests, args.max_length, args.hidden_size)
+    print(json.dumps(results, indent=2))
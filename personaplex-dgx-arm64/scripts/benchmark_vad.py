@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Benchmark and sanity-check voice-activity detection
+Builds call-like audio (noise floor, speech bursts, a long pause) and checks
+that silence is trimmed, long pauses split, and silent input is detected;
+reports VAD cost and how much audio no longer reaches the model
+"""
+
+import io
+import sys
+import json
+import math
+import time
+import wave
+import logging
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.audio import AudioPreprocessor
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+# (kind, seconds): leading noise, speech, long pause, speech, trailing noise
+LAYOUT = [('noise', 2.0), ('speech', 3.0), ('noise', 2.5), ('speech', 2.0), ('noise', 3.0)]
+
+
+def make_speech(seconds: float, rng: np.random.Generator) -> np.ndarray:
+    """Voiced harmonics with a syllable-rate envelope plus quiet fricative bursts"""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 120 + 20 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t) ** 2
+    fricative = rng.standard_normal(len(t)) * (np.sin(2 * np.pi * 1.5 * t) > 0.8)
+    return (0.2 * voiced * envelope + 0.02 * fricative).astype(np.float32)
+
+
+def make_call(rng: np.random.Generator, noise_rms: float = 0.001):
+    """Call-like audio and the (start, end) seconds of each speech burst"""
+    parts, speech_spans, position = [], [], 0.0
+    for kind, seconds in LAYOUT:
+        if kind == 'speech':
+            parts.append(make_speech(seconds, rng))
+            speech_spans.append((position, position + seconds))
+        else:
+            parts.append(np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32))
+        position += seconds
+    audio = np.concatenate(parts)
+    audio += (noise_rms * rng.standard_normal(len(audio))).astype(np.float32)
+    return audio, speech_spans
+
+
+def to_wav(samples: np.ndarray) -> bytes:
+    """Mono 16-bit WAV bytes"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes((np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes())
+    return buffer.getvalue()
+
+
+def run_benchmark(repeats: int = 20, chunk_size: int = 4096) -> dict:
+    """VAD cost, trimming and split results"""
+    rng = np.random.default_rng(0)
+    call, speech_spans = make_call(rng)
+    call_wav = to_wav(call)
+    config = {'audio': {'sample_rate': SAMPLE_RATE, 'chunk_size': chunk_size}}
+    trim = AudioPreprocessor(config)
+    split = AudioPreprocessor({'audio': {**config['audio'], 'vad': {'split_silence_ms': 1500}}})
+    plain = AudioPreprocessor({'audio': {**config['audio'], 'vad': {'enabled': False}}})
+
+    def best_ms(preprocessor, method, data):
+        getattr(preprocessor, method)(data)
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            getattr(preprocessor, method)(data)
+            timings.append(time.perf_counter() - start)
+        return min(timings) * 1000
+
+    segments, result = trim.process_speech(call_wav)
+    split_segments, split_result = split.process_speech(call_wav)
+    noise = (0.001 * rng.standard_normal(len(call))).astype(np.float32)
+    noise_segments, noise_result = trim.process_speech(to_wav(noise))
+    digital_segments, _ = trim.process_speech(to_wav(np.zeros(SAMPLE_RATE, dtype=np.float32)))
+
+    audio_seconds = len(call) / SAMPLE_RATE
+    plain_ms = best_ms(plain, 'process', call_wav)
+    vad_ms = best_ms(trim, 'process_speech', call_wav)
+    return {
+        'audio_seconds': audio_seconds,
+        'speech_spans_seconds': speech_spans,
+        'trim': {
+            **result.to_dict(),
+            'spans_seconds': [(start / SAMPLE_RATE, end / SAMPLE_RATE) for start, end in result.spans]
+        },
+        'split': {
+            **split_result.to_dict(),
+            'spans_seconds': [(start / SAMPLE_RATE, end / SAMPLE_RATE) for start, end in split_result.spans]
+        },
+        'noise_only_segments': len(noise_segments),
+        'noise_only_removed_seconds': noise_result.removed_seconds,
+        'digital_silence_segments': len(digital_segments),
+        'ingest_ms': plain_ms,
+        'ingest_with_vad_ms': vad_ms,
+        'vad_ms_per_audio_second': (vad_ms - plain_ms) / audio_seconds,
+        'model_audio_fraction': result.speech_seconds / audio_seconds,
+        'split_segment_lengths': [len(segment) for segment in split_segments]
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark voice-activity detection")
+    parser.add_argument("--repeats", type=int, default=20, help="Timed repetitions (best is reported)")
+    parser.add_argument("--chunk-size", type=int, default=4096, help="VAD frame size in samples")
+
+    args = parser.parse_args()
+
+    results = run_benchmark(args.repeats, args.chunk_size)
+    print(json.dumps(results, indent=2))
+
+    # Spans may extend past speech by the padding (in whole frames) plus one frame
+    frame_seconds = args.chunk_size / SAMPLE_RATE
+    slack = (math.ceil(0.2 / frame_seconds) + 1) * frame_seconds
+    first, last = results['speech_spans_seconds'][0], results['speech_spans_seconds'][-1]
+    failures = []
+    (trim_start, trim_end), = results['trim']['spans_seconds']
+    if not (first[0] - slack <= trim_start <= first[0] and last[1] <= trim_end <= last[1] + slack):
+        failures.append(f"trimmed span {trim_start:.2f}-{trim_end:.2f}s does not bound the speech tightly")
+    if results['split']['segments'] != 2:
+        failures.append(f"expected 2 segments with split_silence_ms, got {results['split']['segments']}")
+    if results['noise_only_segments'] or results['digital_silence_segments']:
+        failures.append("silent input was not recognized as silence")
+    if failures:
+        for failure in failures:
+            logger.error(failure)
+        sys.exit(1)
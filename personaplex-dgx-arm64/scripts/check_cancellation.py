@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Check request cancellation against a server on a tiny stand-in model
+Aborts long /generate and /generate/stream requests mid-generation and
+lets one pass its deadline, verifying that the worker is free again almost
+immediately and that the cancellations and tokens saved are recorded
+"""
+
+import sys
+import json
+import time
+import logging
+import tempfile
+import http.client
+from pathlib import Path
+from typing import Dict, Any, Optional
+from urllib.parse import urlparse
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from create_tiny_model import create_tiny_model, write_config
+from load_test_saturation import start_server
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def abort_after(base_url: str, path: str, payload: Dict[str, Any], seconds: float,
+                events: int = 0) -> float:
+    """Send a request, then close the connection after seconds (or events SSE events)
+
+    Returns when the connection was closed (perf_counter).
+    """
+    url = urlparse(base_url)
+    conn = http.client.HTTPConnection(url.hostname, url.port)
+    conn.request("POST", path, body=json.dumps(payload), headers={"Content-Type": "application/json"})
+    if events:
+        response = conn.getresponse()
+        while events:
+            if response.fp.readline().startswith(b"data:"):
+                events -= 1
+    else:
+        time.sleep(seconds)
+    conn.close()
+    return time.perf_counter()
+
+
+def timed_generate(base_url: str, max_length: int, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """POST /generate and return its status and latency"""
+    payload = {'text': "Hello, how are you today?", 'max_length': max_length}
+    if timeout is not None:
+        payload['timeout'] = timeout
+    start = time.perf_counter()
+    response = requests.post(f"{base_url}/generate", json=payload, timeout=600)
+    return {'status': response.status_code, 'ms': (time.perf_counter() - start) * 1000}
+
+
+def run_checks(long_max_length: int = 3000, short_max_length: int = 32) -> Dict[str, Any]:
+    """Run the cancellation checks and return the measurements"""
+    workdir = tempfile.mkdtemp(prefix="personaplex-cancel-")
+    model_dir = create_tiny_model(str(Path(workdir) / "model"))
+    # Without the prefix cache single prompts run through the batched path
+    config_path = write_config(model_dir, str(Path(workdir) / "config.yaml"), overrides={
+        'performance': {'prefix_cache': {'enabled': False}}
+    })
+    base_url, stop = start_server(config_path)
+    try:
+        short = timed_generate(base_url, short_max_length)
+        full = timed_generate(base_url, long_max_length)
+        assert full['status'] == 200, f"long request failed ({full['status']})"
+
+        # Client disconnect on the JSON route: the next request must not
+        # wait for the abandoned generation to finish
+        closed_at = abort_after(base_url, "/generate", {
+            'text': "Tell me a very long story.", 'max_length': long_max_length
+        }, seconds=full['ms'] / 4000)
+        after_disconnect = timed_generate(base_url, short_max_length)
+        disconnect_free_ms = (time.perf_counter() - closed_at) * 1000
+
+        # Client disconnect on the streaming route
+        closed_at = abort_after(base_url, "/generate/stream", {
+            'text': "Tell me a very long story.", 'max_length': long_max_length
+        }, seconds=0, events=2)
+        after_stream = timed_generate(base_url, short_max_length)
+        stream_free_ms = (time.perf_counter() - closed_at) * 1000
+
+        # Per-request deadline
+        deadline = timed_generate(base_url, long_max_length, timeout=full['ms'] / 4000)
+        after_deadline = timed_generate(base_url, short_max_length)
+
+        cancellation = requests.get(f"{base_url}/info", timeout=10).json()['cancellation']
+    finally:
+        stop()
+
+    budget_ms = full['ms'] / 2
+    assert after_disconnect['status'] == 200 and after_stream['status'] == 200, "follow-up request failed"
+    assert disconnect_free_ms < budget_ms, (
+        f"worker busy {disconnect_free_ms:.0f}ms after a /generate client disconnected "
+        f"(full generation takes {full['ms']:.0f}ms)"
+    )
+    assert stream_free_ms < budget_ms, f"worker busy {stream_free_ms:.0f}ms after a stream client disconnected"
+    assert deadline['status'] == 504, f"request past its deadline returned {deadline['status']}"
+    assert deadline['ms'] < budget_ms, f"deadline enforced after {deadline['ms']:.0f}ms"
+    requests_cancelled = cancellation['requests']
+    assert requests_cancelled.get('client_disconnect/running', 0) >= 2, f"disconnects not recorded: {cancellation}"
+    assert requests_cancelled.get('deadline/running', 0) >= 1, f"deadline not recorded: {cancellation}"
+    assert cancellation['tokens_saved'] > 0, "no tokens saved recorded"
+
+    return {
+        'short_request_ms': short['ms'],
+        'full_long_request_ms': full['ms'],
+        'disconnect_to_next_response_ms': disconnect_free_ms,
+        'stream_disconnect_to_next_response_ms': stream_free_ms,
+        'deadline_response_ms': deadline['ms'],
+        'after_deadline_ms': after_deadline['ms'],
+        'cancellation': cancellation
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check request cancellation behaviour")
+    parser.add_argument("--long-max-length", type=int, default=3000, help="max_length of the aborted requests")
+
+    args = parser.parse_args()
+
+    try:
+        results = run_checks(args.long_max_length)
+    except AssertionError as e:
+        logger.error(f"Cancellation check failed: {e}")
+        sys.exit(1)
+    print(json.dumps(results, indent=2))
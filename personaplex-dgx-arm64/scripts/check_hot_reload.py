@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Check zero-downtime model hot reload against a server on tiny stand-in models
+Keeps /generate and /health busy while /admin/models swaps in a new model,
+reloads it with another dtype and loads a second resident model, verifying
+that no request fails, /health never leaves 200, requests can pick a model
+by name and the least recently used model is evicted past max_resident
+"""
+
+import sys
+import json
+import time
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Any, List
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from create_tiny_model import create_tiny_model, write_config
+from load_test_saturation import start_server
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+class Traffic:
+    """Background /generate and /health requests recording every status"""
+
+    def __init__(self, base_url: str, clients: int = 2):
+        self.base_url = base_url
+        self.clients = clients
+        self.generate: List[int] = []
+        self.health: List[int] = []
+        self.served_by: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        for _ in range(self.clients):
+            self._threads.append(threading.Thread(target=self._generate, daemon=True))
+        self._threads.append(threading.Thread(target=self._health, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+    def _generate(self):
+        while not self._stop.is_set():
+            response = requests.post(
+                f"{self.base_url}/generate", json={'text': "Hello there", 'max_length': 24}, timeout=120
+            )
+            self.generate.append(response.status_code)
+            if response.status_code == 200:
+                model = response.json().get('model')
+                self.served_by[model] = self.served_by.get(model, 0) + 1
+
+    def _health(self):
+        while not self._stop.is_set():
+            self.health.append(requests.get(f"{self.base_url}/health", timeout=10).status_code)
+            time.sleep(0.05)
+
+
+def wait_for_load(base_url: str, name: str, timeout: float = 300) -> Dict[str, Any]:
+    """Poll a background load until it leaves the loading state"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        state = requests.get(f"{base_url}/admin/models/{name}", timeout=10).json()
+        if state['state'] != 'loading':
+            return state
+        time.sleep(0.2)
+    raise AssertionError(f"{name} still loading after {timeout}s")
+
+
+def load(base_url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """POST /admin/models and wait for the model to serve"""
+    response = requests.post(f"{base_url}/admin/models", json=payload, timeout=10)
+    assert response.status_code == 202, f"load rejected ({response.status_code}): {response.text}"
+    state = wait_for_load(base_url, response.json()['name'])
+    assert state['state'] == 'ready', f"load failed: {state}"
+    return state
+
+
+def run_checks(settle_seconds: float = 1.0) -> Dict[str, Any]:
+    """Run the hot-reload checks and return the measurements"""
+    workdir = tempfile.mkdtemp(prefix="personaplex-reload-")
+    first = create_tiny_model(str(Path(workdir) / "first"))
+    second = create_tiny_model(str(Path(workdir) / "second"), seed=1)
+    third = create_tiny_model(str(Path(workdir) / "third"), seed=2)
+    config_path = write_config(first, str(Path(workdir) / "config.yaml"), overrides={
+        'models': {'max_resident': 2, 'drain_timeout': 30}
+    })
+    base_url, stop = start_server(config_path)
+    traffic = Traffic(base_url)
+    try:
+        traffic.start()
+        time.sleep(settle_seconds)
+
+        # Swap the default to a different model under load
+        swap = load(base_url, {'model': second})
+        time.sleep(settle_seconds)
+        default = requests.get(f"{base_url}/health", timeout=10).json()['model']
+        assert default == 'second', f"default is {default} after the swap"
+
+        # Reload the same name with another dtype: replaced in place
+        reload = load(base_url, {'model': second, 'dtype': 'bfloat16'})
+        time.sleep(settle_seconds)
+
+        # A second resident model selected by name; max_resident=2 evicts
+        # the least recently used non-default one (first)
+        extra = load(base_url, {'model': third, 'default': False})
+        by_name = requests.post(
+            f"{base_url}/generate", json={'text': "Hi", 'max_length': 16, 'model': 'third'}, timeout=60
+        ).json()
+        unknown = requests.post(
+            f"{base_url}/generate", json={'text': "Hi", 'model': 'missing'}, timeout=60
+        ).status_code
+        time.sleep(settle_seconds)
+        registry = requests.get(f"{base_url}/admin/models", timeout=10).json()
+    finally:
+        traffic.stop()
+        stop()
+
+    failures = [status for status in traffic.generate if status != 200]
+    assert not failures, f"{len(failures)} of {len(traffic.generate)} requests failed during reloads: {failures[:10]}"
+    assert all(status == 200 for status in traffic.health), "/health left 200 during a reload"
+    assert by_name.get('model') == 'third', f"request for model 'third' served by {by_name.get('model')}"
+    assert unknown == 404, f"unknown model returned {unknown}"
+    resident = sorted(model['name'] for model in registry['resident'])
+    assert resident == ['second', 'third'], f"resident models {resident}, expected second and third"
+    assert registry['unloads'] >= 2, f"replaced/evicted models not unloaded: {registry}"
+
+    return {
+        'requests': len(traffic.generate),
+        'health_checks': len(traffic.health),
+        'served_by': traffic.served_by,
+        'swap_load_ms': swap['load_ms'],
+        'reload_load_ms': reload['load_ms'],
+        'extra_load_ms': extra['load_ms'],
+        'registry': registry
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check zero-downtime model hot reload")
+    parser.add_argument("--settle-seconds", type=float, default=1.0, help="Traffic time between reload steps")
+
+    args = parser.parse_args()
+
+    try:
+        results = run_checks(args.settle_seconds)
+    except AssertionError as e:
+        logger.error(f"Hot reload check failed: {e}")
+        sys.exit(1)
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Check the memory governor on a tiny stand-in model
+Shrinks the RSS budget to a few generations' worth, then verifies that an
+oversized request is rejected, concurrent requests queue instead of
+overrunning the budget, a large batch is clamped, and a request that
+cannot get memory in time gives up with a retry hint
+"""
+
+import sys
+import json
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Any, List
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.model_handler import PersonaPlexModelHandler
+from src.memory import MB
+from create_tiny_model import create_tiny_model, write_config
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes (VmHWM)"""
+    with open('/proc/self/status', 'r') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def reset_peak_rss():
+    """Reset VmHWM to the current RSS (Linux 4.0+)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def run_checks(max_length: int = 1000, concurrent: int = 6, batch_size: int = 8,
+               fits: float = 2.5) -> Dict[str, Any]:
+    """Run the governor checks and return the measurements"""
+    workdir = tempfile.mkdtemp(prefix="personaplex-memory-")
+    model_dir = create_tiny_model(str(Path(workdir) / "model"))
+    # Without the prefix cache the baseline stays put between checks
+    config_path = write_config(model_dir, str(Path(workdir) / "config.yaml"), overrides={
+        'performance': {'prefix_cache': {'enabled': False}}
+    })
+    handler = PersonaPlexModelHandler(config_path=config_path)
+    handler.load_model()
+    governor = handler.memory
+
+    # Room for `fits` generations of max_length on top of the loaded model
+    per_request = governor.estimate(8, max_length)
+    governor.budget = governor.base + int(per_request * fits)
+
+    too_large = handler.generate(input_text="Hello", max_length=max_length * 20)
+    assert too_large.get('memory') == 'too_large', f"oversized request not rejected: {too_large}"
+
+    reset_peak_rss()
+    rss_before = peak_rss()
+    results: List[Dict[str, Any]] = []
+    threads = [
+        threading.Thread(target=lambda: results.append(
+            handler.generate(input_text="Hello", max_length=max_length)
+        ))
+        for _ in range(concurrent)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(result['success'] for result in results), f"queued requests failed: {results}"
+    stats = governor.get_stats()
+    assert stats['peak_reserved_mb'] * MB <= governor.capacity, "reservations exceeded the budget"
+    assert stats['queued'] >= 1, f"{concurrent} concurrent requests never queued: {stats}"
+    rss_growth = peak_rss() - rss_before
+
+    batch = handler.generate_batch(["Hello"] * batch_size, max_lengths=[max_length] * batch_size)
+    assert all(result['success'] for result in batch), f"clamped batch failed: {batch}"
+    assert governor.get_stats()['clamped_batches'] >= 1, "batch was not clamped to the budget"
+
+    # Hold the whole budget so the next request times out waiting
+    governor.queue_timeout = 0.5
+    with governor.reserve(governor.capacity):
+        busy = handler.generate(input_text="Hello", max_length=100)
+    assert busy.get('memory') == 'busy' and busy.get('retry_after'), f"full budget did not time out: {busy}"
+
+    stats = governor.get_stats()
+    return {
+        'per_request_estimate_mb': per_request / MB,
+        'budget_mb': stats['budget_mb'],
+        'base_mb': stats['base_mb'],
+        'peak_reserved_mb': stats['peak_reserved_mb'],
+        'peak_rss_growth_mb': rss_growth / MB,
+        'governor': stats
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check memory governor admission, queueing and clamping")
+    parser.add_argument("--max-length", type=int, default=1000, help="max_length of the checked requests")
+    parser.add_argument("--concurrent", type=int, default=6, help="Concurrent requests")
+    parser.add_argument("--batch-size", type=int, default=8, help="Rows in the clamped batch")
+
+    args = parser.parse_args()
+
+    try:
+        results = run_checks(args.max_length, args.concurrent, args.batch_size)
+    except AssertionError as e:
+        logger.error(f"Memory governor check failed: {e}")
+        sys.exit(1)
+    print(json.dumps(results, indent=2))
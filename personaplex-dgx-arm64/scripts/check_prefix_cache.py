@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Check the prefix cache with a tiny stand-in model
+Greedy generate() and generate_stream() output must be identical whether the
+prompt resumes from a registered prefix, an automatically detected prefix,
+or is prefilled in full by a handler without the prefix cache
+"""
+
+import sys
+import json
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, Any, List
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.model_handler import PersonaPlexModelHandler
+from create_tiny_model import create_tiny_model, write_config
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+PERSONA = (
+    "You are PersonaPlex, a friendly speech-to-speech agent. You are a helpful "
+    "conversational assistant. "
+)
+# Not registered: cached once auto_detect_min_hits prompts share it
+SYSTEM = (
+    "Thank you for calling, have a great day! The quick brown fox jumps over the "
+    "lazy dog. What can I help you with? "
+)
+QUESTIONS = [
+    "Hello, how are you today?",
+    "Please tell me about the weather in Santa Clara.",
+    "What can I help you with?",
+    "Thank you!",
+]
+
+
+def generate_text(handler: PersonaPlexModelHandler, prompt: str, max_length: int) -> str:
+    """Greedy generate() output"""
+    result = handler.generate(input_text=prompt, max_length=max_length, do_sample=False)
+    assert result['success'], f"generate failed: {result.get('error')}"
+    return result['output']
+
+
+def stream_text(handler: PersonaPlexModelHandler, prompt: str, max_length: int) -> str:
+    """Greedy generate_stream() output, concatenated"""
+    events = list(handler.generate_stream(prompt, max_length=max_length, do_sample=False))
+    assert events and events[-1].get('done'), "stream did not end with a done event"
+    return "".join(event.get('text', '') for event in events[:-1])
+
+
+def compare(cached: PersonaPlexModelHandler, reference: PersonaPlexModelHandler,
+            prompts: List[str], max_length: int) -> List[str]:
+    """Prompts whose output differs between the two handlers"""
+    mismatches = []
+    for prompt in prompts:
+        expected = generate_text(reference, prompt, max_length)
+        if generate_text(cached, prompt, max_length) != expected:
+            mismatches.append(f"generate: {prompt!r}")
+        if stream_text(cached, prompt, max_length) != stream_text(reference, prompt, max_length):
+            mismatches.append(f"generate_stream: {prompt!r}")
+    return mismatches
+
+
+def run_checks(max_length: int = 96) -> Dict[str, Any]:
+    """Run the prefix cache checks and return the cache statistics"""
+    workdir = tempfile.mkdtemp(prefix="personaplex-prefix-")
+    model_dir = create_tiny_model(str(Path(workdir) / "model"))
+
+    handlers = {}
+    for name, prefix_cache in (('cached', {'enabled': True, 'prefixes': [PERSONA], 'block_size': 8}),
+                               ('reference', {'enabled': False})):
+        config_path = write_config(model_dir, str(Path(workdir) / f"{name}.yaml"), overrides={
+            'performance': {'prefix_cache': prefix_cache}
+        })
+        handlers[name] = PersonaPlexModelHandler(config_path=config_path)
+        handlers[name].load_model()
+    cached, reference = handlers['cached'], handlers['reference']
+    registered = cached.prefix_cache.get_stats()
+
+    # Registered prefix; the bare prefix leaves nothing to prefill and must miss
+    mismatches = compare(cached, reference, [PERSONA + question for question in QUESTIONS] + [PERSONA], max_length)
+    after_registered = cached.prefix_cache.get_stats()
+
+    # Automatically detected prefix: the first prompts are misses that
+    # record it, later ones resume from it
+    mismatches += compare(cached, reference, [SYSTEM + question for question in QUESTIONS], max_length)
+    stats = cached.prefix_cache.get_stats()
+
+    assert registered['entries'] == 1, f"persona prefix not prefilled at startup: {registered}"
+    # Each prompt is looked up once by generate and once by generate_stream
+    assert after_registered['hits'] == 2 * len(QUESTIONS), f"registered prefix hits: {after_registered}"
+    assert stats['entries'] > after_registered['entries'], f"no prefix detected automatically: {stats}"
+    assert stats['hits'] > after_registered['hits'], f"detected prefix never reused: {stats}"
+    assert not mismatches, f"output differs with the prefix cache: {mismatches}"
+
+    return {
+        'prompts': 2 * (2 * len(QUESTIONS) + 1),
+        'prefix_cache': stats
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check prefix cache correctness")
+    parser.add_argument("--max-length", type=int, default=96, help="max_length of each generation")
+
+    args = parser.parse_args()
+
+    try:
+        results = run_checks(args.max_length)
+    except AssertionError as e:
+        logger.error(f"Prefix cache check failed: {e}")
+        sys.exit(1)
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Check on-demand profiling against a server on a tiny stand-in model
+Profiles the next N requests and a fixed duration through /admin/profile,
+verifies the downloaded Chrome trace, operator table and folded stacks,
+the error responses, and that request latency is unchanged once the
+sessions end; also times the profiling hooks while no session runs
+"""
+
+import sys
+import json
+import time
+import timeit
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, Any, List
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.profiling import PROFILER, profiled
+from create_tiny_model import create_tiny_model, write_config
+from load_test_saturation import start_server
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def idle_overhead_ns(calls: int = 200000) -> Dict[str, float]:
+    """Per-call cost of the hooks while no session runs"""
+    def plain():
+        return None
+
+    decorated = profiled('check')(plain)
+    assert PROFILER.active is None, "a profiling session is running in this process"
+    per_call = {
+        'plain_call': timeit.timeit(plain, number=calls) / calls * 1e9,
+        'profiled_call': timeit.timeit(decorated, number=calls) / calls * 1e9,
+        'capture': timeit.timeit(lambda: PROFILER.capture('check'), number=calls) / calls * 1e9
+    }
+    per_call['profiled_overhead'] = per_call['profiled_call'] - per_call['plain_call']
+    return per_call
+
+
+def generate_latencies(base_url: str, count: int) -> List[float]:
+    """Latency in ms of count sequential /generate requests"""
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = requests.post(f"{base_url}/generate", json={'text': "Hello there", 'max_length': 24}, timeout=60)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, f"/generate returned {response.status_code}"
+    return sorted(latencies)
+
+
+def wait_for_session(base_url: str, session_id: str, timeout: float = 120) -> Dict[str, Any]:
+    """Poll a session until its files are written"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        state = requests.get(f"{base_url}/admin/profile/{session_id}", timeout=10).json()
+        if state['state'] in ('done', 'failed'):
+            return state
+        time.sleep(0.2)
+    raise AssertionError(f"profiling session {session_id} still {state['state']} after {timeout}s")
+
+
+def download(base_url: str, session_id: str, name: str) -> bytes:
+    response = requests.get(f"{base_url}/admin/profile/{session_id}/{name}", timeout=60)
+    assert response.status_code == 200, f"downloading {name} returned {response.status_code}"
+    return response.content
+
+
+def run_checks(profiled_requests: int = 5, seconds: float = 1.0, latency_requests: int = 50) -> Dict[str, Any]:
+    """Run the profiling checks and return the measurements"""
+    hooks = idle_overhead_ns()
+
+    workdir = tempfile.mkdtemp(prefix="personaplex-profiling-")
+    model_dir = create_tiny_model(str(Path(workdir) / "model"))
+    config_path = write_config(model_dir, str(Path(workdir) / "config.yaml"), overrides={
+        'performance': {'response_cache': {'enabled': False}},
+        'profiling': {'enabled': True, 'output_dir': str(Path(workdir) / "profiles"), 'sample_interval_ms': 2}
+    })
+    base_url, stop = start_server(config_path)
+    try:
+        before = generate_latencies(base_url, latency_requests)
+
+        # The next N requests: torch trace and stack samples
+        response = requests.post(f"{base_url}/admin/profile", json={'requests': profiled_requests}, timeout=60)
+        assert response.status_code == 202, f"start returned {response.status_code}: {response.text}"
+        session_id = response.json()['id']
+        busy = requests.post(f"{base_url}/admin/profile", json={'seconds': 1}, timeout=60).status_code
+        generate_latencies(base_url, profiled_requests)
+        by_requests = wait_for_session(base_url, session_id)
+        assert by_requests['state'] == 'done' and by_requests['reason'] == 'requests', f"session: {by_requests}"
+        assert by_requests['requests'] == profiled_requests, f"counted {by_requests['requests']} requests"
+
+        trace = json.loads(download(base_url, session_id, 'trace.json'))
+        names = {event.get('name', '') for event in trace['traceEvents']}
+        operators = download(base_url, session_id, 'operators.txt').decode()
+        stacks = download(base_url, session_id, 'stacks.folded').decode().splitlines()
+        sampled = sum(int(line.rsplit(' ', 1)[1]) for line in stacks)
+
+        # A fixed duration with no traffic ends on its own
+        response = requests.post(f"{base_url}/admin/profile", json={'seconds': seconds}, timeout=60)
+        assert response.status_code == 202, f"start returned {response.status_code}: {response.text}"
+        by_duration = wait_for_session(base_url, response.json()['id'], timeout=seconds + 60)
+
+        # Errors
+        invalid = requests.post(f"{base_url}/admin/profile", json={'requests': 0}, timeout=10).status_code
+        missing_limits = requests.post(f"{base_url}/admin/profile", json={}, timeout=10).status_code
+        nothing_running = requests.delete(f"{base_url}/admin/profile", timeout=10).status_code
+        unknown_file = requests.get(f"{base_url}/admin/profile/{session_id}/config.yaml", timeout=10).status_code
+
+        after = generate_latencies(base_url, latency_requests)
+        listing = requests.get(f"{base_url}/admin/profile", timeout=10).json()
+    finally:
+        stop()
+
+    assert busy == 409, f"second concurrent session returned {busy}"
+    assert 'personaplex::generate' in names, "generate is not labelled in the trace"
+    assert any(name.startswith('aten::') for name in names), "no operators in the trace"
+    assert 'Self CPU' in operators, "operator table is empty"
+    assert any('generate' in line for line in stacks), "no stack samples inside generate"
+    assert by_duration['state'] == 'done' and by_duration['reason'] == 'duration', f"session: {by_duration}"
+    assert (invalid, missing_limits, nothing_running, unknown_file) == (400, 400, 404, 404), \
+        f"error statuses {invalid}, {missing_limits}, {nothing_running}, {unknown_file}"
+    assert listing['active'] is None and len(listing['sessions']) == 2, f"sessions: {listing}"
+    p50_before, p50_after = before[len(before) // 2], after[len(after) // 2]
+    # Once the sessions end nothing keeps recording
+    assert p50_after < p50_before * 1.25 + 2, f"p50 latency {p50_before:.2f} -> {p50_after:.2f} ms after profiling"
+
+    return {
+        'idle_hook_ns': hooks,
+        'p50_ms_before': p50_before,
+        'p50_ms_after': p50_after,
+        'trace_events': len(trace['traceEvents']),
+        'stack_samples': sampled,
+        'by_requests': by_requests,
+        'by_duration': by_duration
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check on-demand profiling")
+    parser.add_argument("--requests", type=int, default=5, help="Requests in the request-limited session")
+    parser.add_argument("--seconds", type=float, default=1.0, help="Length of the time-limited session")
+    parser.add_argument("--latency-requests", type=int, default=50, help="Requests timed before and after")
+
+    args = parser.parse_args()
+
+    try:
+        results = run_checks(args.requests, args.seconds, args.latency_requests)
+    except AssertionError as e:
+        logger.error(f"Profiling check failed: {e}")
+        sys.exit(1)
+    print(json.dumps(results, indent=2))
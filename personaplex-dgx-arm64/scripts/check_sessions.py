@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Check conversation sessions with a tiny stand-in model
+Each greedy turn resumed from the session KV cache must match greedy
+generation over the whole history prefilled from scratch, including the
+turns after a cancelled or failed turn, which drop the session cache
+"""
+
+import sys
+import json
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, Any, List
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.model_handler import PersonaPlexModelHandler
+from src.cancellation import CancelToken
+from create_tiny_model import create_tiny_model, write_config
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+TURNS = [
+    "Hello, how are you today?",
+    "Please tell me about the weather in Santa Clara.",
+    "What can I help you with?",
+    "Thank you for calling, have a great day!",
+]
+
+
+class CancelAfter(CancelToken):
+    """Cancel token that is set on its checks-th check, i.e. mid-generation"""
+
+    def __init__(self, checks: int):
+        super().__init__()
+        self.checks = checks
+
+    def is_set(self) -> bool:
+        self.checks -= 1
+        if self.checks <= 0:
+            self.cancel('client_disconnect')
+        return super().is_set()
+
+
+def history(handler: PersonaPlexModelHandler, session_id: str) -> List[int]:
+    """Token history of a session (empty before its first turn)"""
+    session = handler.sessions._sessions.get(session_id)
+    return list(session.token_ids) if session else []
+
+
+def expected_history(reference: PersonaPlexModelHandler, token_ids: List[int], text: str,
+                     max_length: int) -> List[int]:
+    """History after a turn, generated greedily over the full history from scratch"""
+    new_ids = reference.tokens.encode(text, add_special_tokens=not token_ids)
+    prompt_ids = token_ids + new_ids
+    # generate_turn applies max_length to the new turn only
+    result = reference.generate(
+        input_ids=prompt_ids, return_ids=True, do_sample=False,
+        max_length=len(prompt_ids) + max(max_length - len(new_ids), 1)
+    )
+    assert result['success'], f"reference generation failed: {result.get('error')}"
+    return prompt_ids + result['output_ids']
+
+
+def run_turn(handler: PersonaPlexModelHandler, reference: PersonaPlexModelHandler, session_id: str,
+             text: str, max_length: int) -> bool:
+    """Run one turn; whether the session history matches the full re-prefill"""
+    expected = expected_history(reference, history(handler, session_id), text, max_length)
+    result = handler.generate_turn(session_id, text, max_length=max_length, do_sample=False)
+    assert result['success'], f"turn failed: {result.get('error')}"
+    return history(handler, session_id) == expected
+
+
+def fail_mid_generation(handler: PersonaPlexModelHandler, steps: int = 4):
+    """Make the next model.generate extend the KV cache by steps tokens, then fail"""
+    original = handler.model.generate
+
+    def generate(*args, **kwargs):
+        handler.model.generate = original
+        kwargs['max_new_tokens'] = steps
+        original(*args, **kwargs)
+        raise RuntimeError("simulated failure mid-generation")
+
+    handler.model.generate = generate
+
+
+def run_checks(max_length: int = 48) -> Dict[str, Any]:
+    """Run the session checks and return the session statistics"""
+    workdir = tempfile.mkdtemp(prefix="personaplex-sessions-")
+    model_dir = create_tiny_model(str(Path(workdir) / "model"))
+
+    handlers = {}
+    for name, prefix_cache in (('sessions', {'enabled': True}), ('reference', {'enabled': False})):
+        config_path = write_config(model_dir, str(Path(workdir) / f"{name}.yaml"), overrides={
+            'performance': {'prefix_cache': prefix_cache}
+        })
+        handlers[name] = PersonaPlexModelHandler(config_path=config_path)
+        handlers[name].load_model()
+    handler, reference = handlers['sessions'], handlers['reference']
+
+    # Turn N resumes from the cache of turn N-1
+    matches = [run_turn(handler, reference, "resumed", text, max_length) for text in TURNS]
+    resumed = handler.sessions.get_stats()
+
+    # A turn cancelled mid-generation is not added and drops the cache
+    session_id = "cancelled"
+    run_turn(handler, reference, session_id, TURNS[0], max_length)
+    before = history(handler, session_id)
+    cancelled = handler.generate_turn(
+        session_id, TURNS[1], cancel=CancelAfter(checks=4), max_length=max_length, do_sample=False
+    )
+    cancelled_state = handler.sessions._sessions[session_id]
+    cancel_reset = cancelled_state.past_key_values is None and history(handler, session_id) == before
+    after_cancel = [run_turn(handler, reference, session_id, text, max_length) for text in TURNS[1:]]
+
+    # A turn that fails after extending the cache in place drops it too
+    session_id = "failed"
+    run_turn(handler, reference, session_id, TURNS[0], max_length)
+    before = history(handler, session_id)
+    fail_mid_generation(handler)
+    failed = handler.generate_turn(session_id, TURNS[1], max_length=max_length, do_sample=False)
+    failed_state = handler.sessions._sessions[session_id]
+    error_reset = failed_state.past_key_values is None and history(handler, session_id) == before
+    after_error = [run_turn(handler, reference, session_id, text, max_length) for text in TURNS[1:]]
+
+    assert all(matches), f"resumed turns differ from a full re-prefill: {matches}"
+    assert resumed['prefill_tokens_saved'] > 0, f"turns did not resume from the session cache: {resumed}"
+    assert cancelled.get('cancelled') == 'client_disconnect', f"turn was not cancelled: {cancelled}"
+    assert cancel_reset, "cancelled turn left its KV cache or history in the session"
+    assert all(after_cancel), f"turns after a cancelled turn differ: {after_cancel}"
+    assert not failed['success'], f"simulated failure did not fail the turn: {failed}"
+    assert error_reset, "failed turn left its KV cache or history in the session"
+    assert all(after_error), f"turns after a failed turn differ: {after_error}"
+
+    return {
+        'turns': len(TURNS) + 2 * len(TURNS),
+        'sessions': handler.sessions.get_stats()
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check session KV-cache reuse correctness")
+    parser.add_argument("--max-length", type=int, default=48, help="max_length of each turn")
+
+    args = parser.parse_args()
+
+    try:
+        results = run_checks(args.max_length)
+    except AssertionError as e:
+        logger.error(f"Session check failed: {e}")
+        sys.exit(1)
+    print(json.dumps(results, indent=2))
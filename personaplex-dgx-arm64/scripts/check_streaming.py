@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Check token streaming with a tiny stand-in model
+Reports TTFT / inter-token latency and verifies that closing a stream
+early stops generation and frees the model for the next request
+"""
+
+import sys
+import time
+import json
+import logging
+import tempfile
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.model_handler import PersonaPlexModelHandler
+from create_tiny_model import create_tiny_model, write_config
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def run_checks(max_length: int = 64, long_max_length: int = 4000) -> dict:
+    """Run the streaming checks and return the measurements"""
+    workdir = tempfile.mkdtemp(prefix="personaplex-stream-")
+    model_dir = create_tiny_model(str(Path(workdir) / "model"))
+    config_path = write_config(model_dir, str(Path(workdir) / "config.yaml"))
+
+    handler = PersonaPlexModelHandler(config_path=config_path)
+    handler.load_model()
+
+    # Latency reporting: the final event must carry TTFT and ITL
+    events = list(handler.generate_stream("Hello, how are you today?", max_length=max_length))
+    final = events[-1]
+    assert final.get('done'), "stream did not end with a done event"
+    assert final['tokens'] > 0 and final['ttft_ms'] is not None, "missing TTFT"
+    assert final['tokens'] < 2 or final['mean_itl_ms'] is not None, "missing ITL"
+
+    # Early disconnect: read a couple of chunks, then close the iterator
+    stop_event = threading.Event()
+    stream = handler.generate_stream(
+        "Tell me a very long story.", stop_event=stop_event,
+        max_length=long_max_length, min_new_tokens=long_max_length // 2
+    )
+    next(stream)
+    next(stream)
+    closed_at = time.perf_counter()
+    stream.close()
+    assert stop_event.is_set(), "closing the stream did not signal a stop"
+
+    # The generation slot must be free again almost immediately
+    acquired = handler._generation_slots.acquire(timeout=5)
+    release_ms = (time.perf_counter() - closed_at) * 1000
+    assert acquired, "generation slot was not released after early close"
+    handler._generation_slots.release()
+
+    return {
+        'tokens': final['tokens'],
+        'ttft_ms': final['ttft_ms'],
+        'mean_itl_ms': final['mean_itl_ms'],
+        'total_ms': final['total_ms'],
+        'early_close_release_ms': release_ms
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check token streaming behaviour")
+    parser.add_argument("--max-length", type=int, default=64, help="max_length for the latency check")
+
+    args = parser.parse_args()
+
+    try:
+        results = run_checks(args.max_length)
+    except AssertionError as e:
+        logger.error(f"Streaming check failed: {e}")
+        sys.exit(1)
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Check spooled, size-bounded audio uploads against a server on a tiny stand-in model
+Sends concurrent large WAV uploads to /generate/audio while tracking the
+server process's peak RSS, and verifies that bodies over
+server.max_request_size get 413 without being read: at once when
+Content-Length declares them too large, and part-way through when they
+are sent chunked
+"""
+
+import sys
+import json
+import time
+import select
+import socket
+import struct
+import logging
+import tempfile
+import threading
+import http.client
+from pathlib import Path
+from typing import Dict, Any, List
+from urllib.parse import urlparse
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from create_tiny_model import create_tiny_model, write_config
+from load_test_saturation import start_server
+from check_memory_governor import peak_rss, reset_peak_rss
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+BOUNDARY = "personaplex-upload-check"
+
+
+def silent_wav(size: int, sample_rate: int = 16000) -> bytes:
+    """A 16-bit mono WAV of about size bytes of silence"""
+    data_size = (size - 44) & ~1
+    header = struct.pack(
+        '<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + data_size, b'WAVE', b'fmt ', 16, 1, 1,
+        sample_rate, sample_rate * 2, 2, 16, b'data', data_size
+    )
+    return header + bytes(data_size)
+
+
+def multipart_parts(wav: bytes) -> List[bytes]:
+    """Multipart body pieces around the shared WAV bytes (not copied)"""
+    head = (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"audio\"; filename=\"speech.wav\"\r\n"
+        f"Content-Type: audio/wav\r\n\r\n"
+    ).encode()
+    return [head, wav, f"\r\n--{BOUNDARY}--\r\n".encode()]
+
+
+def post_upload(base_url: str, parts: List[bytes]) -> Dict[str, Any]:
+    """POST the body pieces to /generate/audio with a Content-Length"""
+    url = urlparse(base_url)
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=300)
+    start = time.perf_counter()
+    conn.putrequest("POST", "/generate/audio")
+    conn.putheader("Content-Type", f"multipart/form-data; boundary={BOUNDARY}")
+    conn.putheader("Content-Length", str(sum(len(part) for part in parts)))
+    conn.endheaders()
+    for part in parts:
+        conn.send(memoryview(part))
+    response = conn.getresponse()
+    body = response.read()
+    conn.close()
+    return {'status': response.status, 'ms': (time.perf_counter() - start) * 1000, 'body': body}
+
+
+def declared_too_large(base_url: str, size: int) -> Dict[str, Any]:
+    """Declare a size-byte body and wait for the answer before sending any of it"""
+    url = urlparse(base_url)
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+    start = time.perf_counter()
+    conn.putrequest("POST", "/generate/audio")
+    conn.putheader("Content-Type", f"multipart/form-data; boundary={BOUNDARY}")
+    conn.putheader("Content-Length", str(size))
+    conn.endheaders()
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return {'status': response.status, 'ms': (time.perf_counter() - start) * 1000}
+
+
+def chunked_too_large(base_url: str, parts: List[bytes], chunk_bytes: int = 64 * 1024) -> Dict[str, Any]:
+    """Send an oversized body chunked until the server answers
+
+    Returns the status and how many body bytes were sent before the answer.
+    """
+    url = urlparse(base_url)
+    sock = socket.create_connection((url.hostname, url.port), timeout=30)
+    sock.sendall(
+        f"POST /generate/audio HTTP/1.1\r\nHost: {url.hostname}\r\n"
+        f"Content-Type: multipart/form-data; boundary={BOUNDARY}\r\n"
+        f"Transfer-Encoding: chunked\r\n\r\n".encode()
+    )
+    body = b"".join(parts)
+    sent = 0
+    try:
+        while sent < len(body):
+            if select.select([sock], [], [], 0)[0]:
+                break
+            chunk = body[sent:sent + chunk_bytes]
+            sock.sendall(b"%x\r\n" % len(chunk) + chunk + b"\r\n")
+            sent += len(chunk)
+        else:
+            sock.sendall(b"0\r\n\r\n")
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    status_line = sock.makefile('rb').readline().decode()
+    sock.close()
+    return {'status': int(status_line.split()[1]), 'sent_bytes': sent}
+
+
+def run_checks(upload_mb: float = 8.0, concurrent: int = 8, max_request_mb: float = 10.0,
+               spool_mb: float = 1.0) -> Dict[str, Any]:
+    """Run the upload checks and return the measurements"""
+    workdir = tempfile.mkdtemp(prefix="personaplex-uploads-")
+    model_dir = create_tiny_model(str(Path(workdir) / "model"))
+    # Silent uploads are answered after decoding and VAD, without the model
+    config_path = write_config(model_dir, str(Path(workdir) / "config.yaml"), overrides={
+        'server': {'max_request_size': int(max_request_mb * MB), 'upload_spool_size': int(spool_mb * MB)},
+        'audio': {'vad': {'enabled': True, 'on_silence': 'empty'}}
+    })
+    base_url, stop = start_server(config_path)
+    # Built once and shared by every client, so they add nothing to the peak
+    parts = multipart_parts(silent_wav(int(upload_mb * MB)))
+    oversized = multipart_parts(silent_wav(int(max_request_mb * MB * 1.5)))
+    try:
+        single = post_upload(base_url, parts)
+        assert single['status'] == 200, f"upload failed ({single['status']}): {single['body'][:200]}"
+
+        reset_peak_rss()
+        rss_before = peak_rss()
+        results: List[Dict[str, Any]] = []
+        threads = [
+            threading.Thread(target=lambda: results.append(post_upload(base_url, parts)))
+            for _ in range(concurrent)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        rss_growth = peak_rss() - rss_before
+
+        declared = declared_too_large(base_url, sum(len(part) for part in oversized))
+        chunked = chunked_too_large(base_url, oversized)
+        missing = requests.post(
+            f"{base_url}/generate/audio", files={'other': ("a.wav", b"RIFF")}, timeout=30
+        ).status_code
+        uploads = requests.get(f"{base_url}/info", timeout=10).json()['uploads']
+    finally:
+        stop()
+
+    failures = [result['status'] for result in results if result['status'] != 200]
+    assert not failures, f"{len(failures)} of {concurrent} concurrent uploads failed: {failures}"
+    assert declared['status'] == 413, f"declared oversized body returned {declared['status']}"
+    assert chunked['status'] == 413, f"chunked oversized body returned {chunked['status']}"
+    assert chunked['sent_bytes'] < sum(len(part) for part in oversized), "oversized body was read to the end"
+    assert missing == 422, f"upload without an audio part returned {missing}"
+    assert uploads['disk'] >= concurrent, f"uploads over the spool size stayed in memory: {uploads}"
+
+    upload_bytes = len(parts[1])
+    return {
+        'upload_mb': upload_bytes / MB,
+        'concurrent': concurrent,
+        'single_upload_ms': single['ms'],
+        'concurrent_upload_ms': max(result['ms'] for result in results),
+        'peak_rss_growth_mb': rss_growth / MB,
+        'peak_rss_growth_per_upload_mb': rss_growth / concurrent / MB,
+        # Every upload also holds its decoded float32 samples while VAD runs
+        'decoded_float32_mb_per_upload': upload_bytes * 2 / MB,
+        'declared_413_ms': declared['ms'],
+        'chunked_413_after_mb': chunked['sent_bytes'] / MB,
+        'uploads': uploads
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check spooled upload limits and peak RSS")
+    parser.add_argument("--upload-mb", type=float, default=8.0, help="Size of each concurrent upload")
+    parser.add_argument("--concurrent", type=int, default=8, help="Concurrent uploads")
+
+    args = parser.parse_args()
+
+    try:
+        results = run_checks(args.upload_mb, args.concurrent)
+    except AssertionError as e:
+        logger.error(f"Upload check failed: {e}")
+        sys.exit(1)
+    print(json.dumps(results, indent=2))
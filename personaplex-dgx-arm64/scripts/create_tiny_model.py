@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Create a tiny, randomly initialized stand-in causal LM
+Lets the server and benchmarks run on CPU without downloading PersonaPlex
+"""
+
+import os
+import sys
+import json
+import logging
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+import yaml
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Small corpus used to train the stand-in byte-level BPE tokenizer
+CORPUS = [
+    "Hello, how are you today?",
+    "I am a helpful conversational assistant.",
+    "You are PersonaPlex, a friendly speech-to-speech agent.",
+    "Please tell me about the weather in Santa Clara.",
+    "The quick brown fox jumps over the lazy dog.",
+    "What can I help you with?",
+    "Thank you for calling, have a great day!",
+]
+
+# Stand-in audio processor saved next to the model with audio=True, loaded
+# by AutoProcessor through remote code like a real model's processor
+TINY_PROCESSOR = '''"""
+Stand-in audio processor for the tiny model
+Turns audio into one prompt token per frame, picked by frame energy
+"""
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer
+
+
+class TinyAudioProcessor:
+    frame_ms = 20
+    max_tokens = 32
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    @classmethod
+    def from_pretrained(cls, path, **kwargs):
+        return cls(AutoTokenizer.from_pretrained(path))
+
+    @classmethod
+    def register_for_auto_class(cls, auto_class="AutoProcessor"):
+        pass
+
+    def __call__(self, audio, sampling_rate=16000, return_tensors="pt", **kwargs):
+        samples = np.asarray(audio, dtype=np.float32).reshape(-1)
+        frame = max(sampling_rate * self.frame_ms // 1000, 1)
+        count = min(max(len(samples) // frame, 1), self.max_tokens)
+        energy = np.array([np.sqrt(np.mean(part ** 2)) if len(part) else 0.0
+                           for part in np.array_split(samples, count)])
+        # Skip the special tokens at the start of the vocabulary
+        specials = len(self.tokenizer.all_special_ids)
+        ids = specials + (energy * 1000).astype(np.int64) % (len(self.tokenizer) - specials)
+        input_ids = torch.tensor(ids, dtype=torch.long).reshape(1, -1)
+        return {'input_ids': input_ids, 'attention_mask': torch.ones_like(input_ids)}
+
+    def decode(self, *args, **kwargs):
+        return self.tokenizer.decode(*args, **kwargs)
+
+    def batch_decode(self, *args, **kwargs):
+        return self.tokenizer.batch_decode(*args, **kwargs)
+'''
+
+
+def create_tiny_model(output_dir: str,
+                      vocab_size: int = 512,
+                      hidden_size: int = 64,
+                      num_layers: int = 2,
+                      num_heads: int = 4,
+                      seed: int = 0,
+                      dtype: str = "float32",
+                      audio: bool = False) -> str:
+    """Create and save a tiny Llama-style model and tokenizer
+
+    dtype is the on-disk weight dtype; serving in another dtype forces a
+    conversion (and a private copy) at load time, as with real checkpoints.
+    audio adds a stand-in processor so audio routes reach the model.
+    """
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers, decoders, trainers
+    from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    # Tokenizer
+    special_tokens = ["<pad>", "<s>", "</s>", "<unk>"]
+    bpe = Tokenizer(models.BPE(unk_token="<unk>"))
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=vocab_size,
+        special_tokens=special_tokens,
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet()
+    )
+    bpe.train_from_iterator(CORPUS * 10, trainer=trainer)
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=bpe,
+        pad_token="<pad>",
+        bos_token="<s>",
+        eos_token="</s>",
+        unk_token="<unk>"
+    )
+    tokenizer.save_pretrained(output_path)
+
+    # Model
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 4,
+        num_hidden_layers=num_layers,
+        num_attention_heads=num_heads,
+        num_key_value_heads=num_heads,
+        max_position_embeddings=4096,
+        pad_token_id=tokenizer.pad_token_id,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id
+    )
+    model = LlamaForCausalLM(config)
+    # Random weights hit </s> at arbitrary points; without an EOS in the
+    # generation config every request runs to max_length, which keeps
+    # benchmark workloads predictable
+    model.generation_config.eos_token_id = None
+    model.to(getattr(torch, dtype)).save_pretrained(output_path)
+
+    if audio:
+        (output_path / "processing_tiny.py").write_text(TINY_PROCESSOR)
+        (output_path / "processor_config.json").write_text(json.dumps({
+            'processor_class': 'TinyAudioProcessor',
+            'auto_map': {'AutoProcessor': 'processing_tiny.TinyAudioProcessor'}
+        }))
+
+    logger.info(f"Tiny model saved to: {output_path}")
+    return str(output_path)
+
+
+def create_draft_model(model_dir: str, output_dir: str, num_layers: int = 1) -> str:
+    """Save the first num_layers layers of a tiny model as its draft model
+
+    The draft shares the tokenizer, embeddings and LM head, as a
+    speculative-decoding draft must.
+    """
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    model = AutoModelForCausalLM.from_pretrained(model_dir)
+    model.model.layers = model.model.layers[:num_layers]
+    model.config.num_hidden_layers = num_layers
+    model.save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(model_dir).save_pretrained(output_dir)
+
+    logger.info(f"Draft model ({num_layers} layers) saved to: {output_dir}")
+    return str(output_dir)
+
+
+def write_config(model_dir: str, config_out: str,
+                 base_config: Optional[str] = None,
+                 overrides: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+    """Write a copy of the server config pointing at the tiny model
+
+    overrides maps config sections to keys that replace the base values.
+    """
+    if base_config is None:
+        base_config = str(Path(__file__).parent.parent / "config" / "config.yaml")
+    with open(base_config, 'r') as f:
+        config = yaml.safe_load(f)
+
+    config['model']['name'] = str(Path(model_dir).resolve())
+    config['model']['path'] = str(Path(model_dir).resolve())
+    config['model']['device'] = "cpu"
+    config['model']['dtype'] = "float32"
+    config['model']['max_length'] = 128
+    for section, values in (overrides or {}).items():
+        config.setdefault(section, {}).update(values)
+
+    os.makedirs(os.path.dirname(os.path.abspath(config_out)), exist_ok=True)
+    with open(config_out, 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+
+    logger.info(f"Config written to: {config_out}")
+    return config_out
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Create a tiny stand-in causal LM")
+    parser.add_argument(
+        "--output-dir",
+        default="models/tiny-personaplex",
+        help="Directory to save the model and tokenizer"
+    )
+    parser.add_argument(
+        "--config-out",
+        default=None,
+        help="Optionally write a config.yaml pointing at the tiny model"
+    )
+    parser.add_argument(
+        "--num-layers",
+        type=int,
+        default=2,
+        help="Number of transformer layers"
+    )
+    parser.add_argument(
+        "--hidden-size",
+        type=int,
+        default=64,
+        help="Hidden size"
+    )
+
+    args = parser.parse_args()
+
+    try:
+        model_dir = create_tiny_model(
+            args.output_dir,
+            hidden_size=args.hidden_size,
+            num_layers=args.num_layers
+        )
+        if args.config_out:
+            write_config(model_dir, args.config_out)
+    except Exception as e:
+        logger.error(f"Failed to create tiny model: {e}")
+        sys.exit(1)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Saturation load test for the PersonaPlex server with a tiny stand-in model
+Floods /generate past the admission limit and checks that excess requests
+get 429 + Retry-After while /health and /info stay responsive
+"""
+
+import os
+import sys
+import time
+import json
+import socket
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import uvicorn
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from create_tiny_model import create_tiny_model, write_config
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def start_server(config_path: str):
+    """Start the API server in a background thread; returns (base_url, stop)"""
+    os.environ['CONFIG_PATH'] = config_path
+    from src.server import app
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base_url}/health", timeout=1).status_code == 200:
+                break
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    else:
+        raise RuntimeError("Server did not become healthy")
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+
+    return base_url, stop
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def run_load_test(num_requests: int = 32, max_queue_size: int = 4,
+                  max_length: int = 1024) -> dict:
+    """Saturate /generate and probe /health and /info meanwhile"""
+    workdir = tempfile.mkdtemp(prefix="personaplex-load-")
+    model_dir = create_tiny_model(str(Path(workdir) / "model"))
+    config_path = write_config(
+        model_dir, str(Path(workdir) / "config.yaml"),
+        overrides={
+            'server': {'max_queue_size': max_queue_size, 'timeout': 120},
+            'performance': {'batch_size': 1}
+        }
+    )
+    base_url, stop = start_server(config_path)
+
+    statuses = {}
+    retry_after_seen = []
+    probe_latencies = {'/health': [], '/info': []}
+    done = threading.Event()
+
+    def call_generate(_):
+        response = requests.post(
+            f"{base_url}/generate",
+            json={'text': "Tell me a story.", 'max_length': max_length},
+            timeout=300
+        )
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        if response.status_code == 429:
+            retry_after_seen.append(response.headers.get('Retry-After'))
+
+    def probe():
+        while not done.is_set():
+            for path in probe_latencies:
+                start = time.perf_counter()
+                requests.get(f"{base_url}{path}", timeout=30)
+                probe_latencies[path].append((time.perf_counter() - start) * 1000)
+            time.sleep(0.05)
+
+    prober = threading.Thread(target=probe, daemon=True)
+    try:
+        prober.start()
+        with ThreadPoolExecutor(max_workers=num_requests) as pool:
+            list(pool.map(call_generate, range(num_requests)))
+    finally:
+        done.set()
+        prober.join()
+        stop()
+
+    return {
+        'num_requests': num_requests,
+        'status_counts': statuses,
+        'retry_after_headers': sorted(set(retry_after_seen)),
+        'probe_latency_ms': {
+            path: {
+                'count': len(values),
+                'p50': percentile(values, 50),
+                'p99': percentile(values, 99),
+                'max': max(values) if values else 0.0
+            }
+            for path, values in probe_latencies.items()
+        }
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Saturation load test")
+    parser.add_argument("--requests", type=int, default=32, help="Concurrent /generate requests")
+    parser.add_argument("--max-queue-size", type=int, default=4, help="server.max_queue_size")
+    parser.add_argument("--max-length", type=int, default=1024, help="max_length per request")
+    parser.add_argument("--max-probe-ms", type=float, default=250,
+                        help="Fail if a /health or /info probe takes longer than this")
+
+    args = parser.parse_args()
+
+    results = run_load_test(args.requests, args.max_queue_size, args.max_length)
+    print(json.dumps(results, indent=2))
+
+    failures = []
+    if not results['status_counts'].get(429):
+        failures.append("no request was rejected with 429")
+    if None in results['retry_after_headers']:
+        failures.append("429 response without Retry-After")
+    for path, latency in results['probe_latency_ms'].items():
+        if latency['max'] > args.max_probe_ms:
+            failures.append(f"{path} took {latency['max']:.0f} ms under load")
+    if failures:
+        for failure in failures:
+            logger.error(failure)
+        sys.exit(1)
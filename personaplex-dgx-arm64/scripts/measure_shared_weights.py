@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Measure per-worker memory with and without shared memory-mapped weights
+Starts N worker processes that each load a small CPU model the way a
+uvicorn worker would, and reports RSS/PSS growth from loading the model
+"""
+
+import sys
+import json
+import logging
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from create_tiny_model import create_tiny_model, write_config
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def read_smaps_rollup(pid: str = "self") -> dict:
+    """Rss/Pss/Private/Shared totals of a process in MiB"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+        for line in f.readlines()[1:]:
+            key, rest = line.split(':', 1)
+            values[key] = int(rest.split()[0]) / 1024
+    return values
+
+
+def _worker(config_path: str, loaded, results, release):
+    """Load the model like a server worker and report its memory growth"""
+    import torch  # noqa: F401 - imported before the baseline reading
+    from src.model_handler import PersonaPlexModelHandler
+
+    before = read_smaps_rollup()
+    handler = PersonaPlexModelHandler(config_path)
+    handler.load_model()
+    handler.generate_batch(["Hello, how are you today?"], max_lengths=[16])
+    loaded.wait()
+    # Every worker has loaded and touched the weights; PSS now splits
+    # shared pages between them
+    after = read_smaps_rollup()
+    results.put({key: after[key] - before[key] for key in ('Rss', 'Pss', 'Private_Dirty')})
+    release.wait()
+
+
+def measure(config_path: str, num_workers: int) -> dict:
+    """Run num_workers concurrent workers and aggregate their memory growth"""
+    context = multiprocessing.get_context("spawn")
+    loaded = context.Barrier(num_workers)
+    release = context.Event()
+    results = context.Queue()
+    workers = [
+        context.Process(target=_worker, args=(config_path, loaded, results, release))
+        for _ in range(num_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        per_worker = [results.get(timeout=600) for _ in workers]
+    finally:
+        release.set()
+        for worker in workers:
+            worker.join()
+    return {
+        'per_worker_mb': per_worker,
+        'total_rss_mb': sum(w['Rss'] for w in per_worker),
+        'total_pss_mb': sum(w['Pss'] for w in per_worker)
+    }
+
+
+def run_measurement(num_workers: int = 3, hidden_size: int = 512, num_layers: int = 8) -> dict:
+    """Compare private and shared weights across num_workers workers"""
+    workdir = Path(tempfile.mkdtemp(prefix="personaplex-shared-"))
+    # bfloat16 on disk served as float32, so the private baseline converts
+    # (and copies) the weights in every worker like a real checkpoint would
+    model_dir = create_tiny_model(
+        str(workdir / "model"), hidden_size=hidden_size, num_layers=num_layers,
+        dtype="bfloat16"
+    )
+    # Served size in float32
+    model_mb = 2 * sum(f.stat().st_size for f in Path(model_dir).glob("*.safetensors")) / 2**20
+
+    results = {'num_workers': num_workers, 'model_mb': model_mb}
+    for mode, enabled in (('private', False), ('shared', True)):
+        config_path = write_config(
+            model_dir, str(workdir / f"config_{mode}.yaml"),
+            overrides={'performance': {
+                'shared_weights': {'enabled': enabled, 'dir': str(workdir / "shared")},
+                'prefix_cache': {'enabled': False}
+            }}
+        )
+        if enabled:
+            # Convert once up front so the measured workers only map the file
+            measure(config_path, 1)
+        results[mode] = measure(config_path, num_workers)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Shared weights RSS/PSS measurement")
+    parser.add_argument("--workers", type=int, default=3, help="Worker processes")
+    parser.add_argument("--hidden-size", type=int, default=512, help="Tiny model hidden size")
+    parser.add_argument("--num-layers", type=int, default=8, help="Tiny model layers")
+
+    args = parser.parse_args()
+
+    results = run_measurement(args.workers, args.hidden_size, args.num_layers)
+    print(json.dumps(results, indent=2))
+
+    # With shared weights N workers should cost about one model in total PSS
+    if results['shared']['total_pss_mb'] > results['model_mb'] * 1.5 + 50 * args.workers:
+        logger.error("Shared weights total PSS is not close to a single model copy")
+        sys.exit(1)
@@ -0,0 +1,383 @@
+"""
+Audio ingestion for PersonaPlex
+Decodes WAV/PCM uploads into normalized mono float32 at the model's sample rate
+"""
+
+import os
+import struct
+import logging
+from typing import Dict, Any, List, Tuple, Optional, Callable
+
+import numpy as np
+
+from src.vad import VoiceActivityDetector, VadResult
+
+logger = logging.getLogger(__name__)
+
+# WAV format tags
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Taps of the windowed-sinc anti-aliasing filter used when downsampling
+LOWPASS_TAPS = 63
+
+# Encoded bytes read per step when decoding a file upload
+DECODE_CHUNK_BYTES = 1024 * 1024
+
+# Marker dtype for packed 24-bit PCM, which NumPy has no type for
+INT24 = 'int24'
+
+
+class AudioFormatError(ValueError):
+    """Raised for uploads that are not decodable audio"""
+
+
+def wav_layout(read: Callable[[int, int], bytes], size: int) -> Tuple[Any, int, int, int, int, int]:
+    """Walk the chunks of a RIFF/WAVE file of size bytes
+
+    read(offset, n) returns up to n bytes at offset. Returns (dtype,
+    channels, sample_rate, block_align, data_offset, data_size) where dtype
+    is the NumPy sample type (INT24 for packed 24-bit PCM) and the data
+    chunk is clipped to the file.
+    """
+    if size < 12 or read(0, 4) != b'RIFF' or read(8, 4) != b'WAVE':
+        raise AudioFormatError("Not a RIFF/WAVE file")
+
+    fmt = None
+    data = None
+    offset = 12
+    while offset + 8 <= size:
+        chunk_id, chunk_size = struct.unpack('<4sI', read(offset, 8))
+        if chunk_id == b'fmt ':
+            body = read(offset + 8, min(chunk_size, 40))
+            if len(body) < 16:
+                raise AudioFormatError("Truncated fmt chunk")
+            format_tag, channels, sample_rate, _, block_align, bits = struct.unpack_from('<HHIIHH', body)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                # The real format tag is the first two bytes of the sub-format GUID
+                format_tag = struct.unpack_from('<H', body, 24)[0]
+            fmt = (format_tag, channels, sample_rate, block_align, bits)
+        elif chunk_id == b'data':
+            data = (offset + 8, min(chunk_size, size - offset - 8))
+        # Chunks are word aligned
+        offset += 8 + chunk_size + (chunk_size & 1)
+
+    if fmt is None or data is None:
+        raise AudioFormatError("WAV file is missing its fmt or data chunk")
+    format_tag, channels, sample_rate, block_align, bits = fmt
+    if channels < 1 or sample_rate < 1 or block_align < 1:
+        raise AudioFormatError("Invalid WAV header")
+
+    if format_tag == WAVE_FORMAT_PCM and bits in (8, 16, 32):
+        dtype = np.dtype({8: np.uint8, 16: '<i2', 32: '<i4'}[bits])
+    elif format_tag == WAVE_FORMAT_PCM and bits == 24:
+        dtype = INT24
+    elif format_tag == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+        dtype = np.dtype('<f4' if bits == 32 else '<f8')
+    else:
+        raise AudioFormatError(f"Unsupported WAV encoding (format {format_tag:#x}, {bits}-bit)")
+    return dtype, channels, sample_rate, block_align, data[0], data[1]
+
+
+def frames_from_bytes(buffer, dtype, channels: int) -> np.ndarray:
+    """View whole frames of PCM bytes as (frames, channels) samples
+
+    24-bit PCM (dtype INT24) is widened to int32, which needs a copy.
+    """
+    if dtype == INT24:
+        raw = np.frombuffer(buffer, dtype=np.uint8).reshape(-1, 3)
+        # Sign-extend 3-byte little-endian samples into the top of an int32
+        samples = (
+            (raw[:, 0].astype(np.int32) << 8)
+            | (raw[:, 1].astype(np.int32) << 16)
+            | (raw[:, 2].astype(np.int32) << 24)
+        )
+    else:
+        samples = np.frombuffer(buffer, dtype=dtype)
+    return samples.reshape(-1, channels)
+
+
+def parse_wav(data) -> Tuple[np.ndarray, int, int]:
+    """Parse a RIFF/WAVE buffer without copying the sample data
+
+    Returns (samples, sample_rate, channels) where samples is a read-only
+    NumPy view of the data chunk, shaped (frames, channels), in the file's
+    own sample type (24-bit PCM is widened to int32, which needs a copy).
+    """
+    view = memoryview(data).cast('B')
+    dtype, channels, sample_rate, block_align, offset, size = wav_layout(
+        lambda start, n: bytes(view[start:start + n]), len(view)
+    )
+    # Drop a trailing partial frame
+    size -= size % block_align
+    return frames_from_bytes(view[offset:offset + size], dtype, channels), sample_rate, channels
+
+
+def downmix(samples: np.ndarray) -> np.ndarray:
+    """Average (frames, channels) to mono
+
+    Multi-channel input is averaged straight into float32 (no overflow, one
+    allocation); mono input is returned as a view in its own dtype.
+    """
+    if samples.ndim == 1:
+        return samples
+    if samples.shape[1] == 1:
+        return samples[:, 0]
+    return samples.mean(axis=1, dtype=np.float32)
+
+
+def to_float32(samples: np.ndarray, source_dtype=None) -> np.ndarray:
+    """Scale PCM values to float32 in [-1, 1]
+
+    source_dtype is the original sample type when samples have already been
+    converted (e.g. by downmix); float input passes through uncopied.
+    """
+    source_dtype = np.dtype(source_dtype if source_dtype is not None else samples.dtype)
+    if source_dtype.kind == 'f':
+        return samples.astype(np.float32, copy=False)
+    out = samples.astype(np.float32, copy=False)
+    if out is samples and not out.flags.writeable:
+        out = out.copy()
+    if source_dtype == np.uint8:
+        out -= 128.0
+        out *= 1.0 / 128.0
+    else:
+        out *= 1.0 / float(-np.iinfo(source_dtype).min)
+    return out
+
+
+def resample(samples: np.ndarray, source_rate: int, target_rate: int) -> np.ndarray:
+    """Resample mono float32 audio with vectorized linear interpolation
+
+    Downsampling first applies a Hann-windowed sinc low-pass at the target
+    Nyquist frequency so that high frequencies do not alias.
+    """
+    if source_rate == target_rate or not len(samples):
+        return samples
+    if target_rate < source_rate:
+        samples = lowpass(samples, 0.5 * target_rate / source_rate)
+    num_out = int(round(len(samples) * target_rate / source_rate))
+    positions = np.arange(num_out, dtype=np.float64) * (source_rate / target_rate)
+    index = np.minimum(positions.astype(np.int64), len(samples) - 1)
+    frac = (positions - index).astype(np.float32)
+    following = np.minimum(index + 1, len(samples) - 1)
+    out = samples[following] - samples[index]
+    out *= frac
+    out += samples[index]
+    return out
+
+
+def lowpass(samples: np.ndarray, cutoff: float) -> np.ndarray:
+    """FIR low-pass; cutoff is a fraction of the sample rate (0 < cutoff < 0.5)"""
+    taps = np.arange(LOWPASS_TAPS, dtype=np.float32) - (LOWPASS_TAPS - 1) / 2
+    kernel = (2 * cutoff * np.sinc(2 * cutoff * taps) * np.hanning(LOWPASS_TAPS)).astype(np.float32)
+    kernel /= kernel.sum()
+    return np.convolve(samples, kernel, mode='same').astype(np.float32, copy=False)
+
+
+def normalize(samples: np.ndarray, target_peak: float) -> np.ndarray:
+    """Remove DC offset and scale the peak to target_peak, in place"""
+    if not len(samples):
+        return samples
+    if not samples.flags.writeable:
+        samples = samples.copy()
+    samples -= samples.mean(dtype=np.float64)
+    peak = float(np.abs(samples).max())
+    if peak > 0:
+        samples *= target_peak / peak
+    return samples
+
+
+class AudioPreprocessor:
+    """Turns uploaded audio bytes into model-ready samples
+
+    WAV input is parsed from its header; anything else is treated as raw
+    PCM described by audio.pcm when audio.format is 'pcm'. The output is
+    float32 mono (when audio.channels is 1) at audio.sample_rate, DC-free and
+    peak-normalized if audio.normalize is set. Integer samples are read via
+    np.frombuffer views over the upload (or decoded from a file upload
+    DECODE_CHUNK_BYTES at a time), so the only full-size allocation is the
+    float32 conversion. process_speech also drops silence found by the
+    voice-activity detector (audio.vad).
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """Initialize from the audio config"""
+        audio_config = config.get('audio', {}) or {}
+        self.sample_rate = int(audio_config.get('sample_rate', 16000))
+        self.channels = int(audio_config.get('channels', 1))
+        self.format = str(audio_config.get('format', 'wav')).lower()
+        self.normalize = bool(audio_config.get('normalize', True))
+        self.target_peak = float(audio_config.get('target_peak', 0.95))
+        pcm_config = audio_config.get('pcm', {}) or {}
+        self.pcm_sample_rate = int(pcm_config.get('sample_rate', self.sample_rate))
+        self.pcm_channels = int(pcm_config.get('channels', self.channels))
+        self.pcm_dtype = np.dtype(pcm_config.get('dtype', 'int16')).newbyteorder('<')
+        self.vad = VoiceActivityDetector(config)
+
+    def decode(self, data) -> Tuple[np.ndarray, int]:
+        """Decode bytes into (frames, channels) samples and their sample rate"""
+        if bytes(memoryview(data)[:4]) == b'RIFF':
+            samples, sample_rate, _ = parse_wav(data)
+            return samples, sample_rate
+        if self.format == 'pcm':
+            return self.decode_pcm(data), self.pcm_sample_rate
+        raise AudioFormatError(f"Expected {self.format.upper()} audio")
+
+    def decode_file(self, f) -> Tuple[np.ndarray, int]:
+        """Decode a seekable file chunk by chunk into float32 samples (see to_float)
+
+        Returns the samples and their sample rate. Only DECODE_CHUNK_BYTES
+        of encoded audio is in memory at a time.
+        """
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+
+        def read(offset: int, n: int) -> bytes:
+            f.seek(offset)
+            return f.read(n)
+
+        if read(0, 4) == b'RIFF':
+            dtype, channels, sample_rate, frame_bytes, offset, data_size = wav_layout(read, size)
+        elif self.format == 'pcm':
+            dtype, channels, sample_rate = self.pcm_dtype, self.pcm_channels, self.pcm_sample_rate
+            frame_bytes, offset, data_size = dtype.itemsize * channels, 0, size
+        else:
+            raise AudioFormatError(f"Expected {self.format.upper()} audio")
+
+        frames = data_size // frame_bytes
+        out = np.empty((frames,) if self.channels == 1 else (frames, channels), dtype=np.float32)
+        chunk_frames = max(DECODE_CHUNK_BYTES // frame_bytes, 1)
+        f.seek(offset)
+        done = 0
+        while done < frames:
+            data = f.read(min(chunk_frames, frames - done) * frame_bytes)
+            count = len(data) // frame_bytes
+            if not count:
+                break
+            out[done:done + count] = self.to_float(frames_from_bytes(data[:count * frame_bytes], dtype, channels))
+            done += count
+        return out[:done], sample_rate
+
+    def decode_pcm(self, data, channels: Optional[int] = None, dtype=None) -> np.ndarray:
+        """View raw PCM bytes as (frames, channels) samples
+
+        Layout defaults to audio.pcm; a trailing partial frame is dropped.
+        """
+        channels = channels or self.pcm_channels
+        dtype = self.pcm_dtype if dtype is None else np.dtype(dtype).newbyteorder('<')
+        view = memoryview(data)
+        frame_bytes = dtype.itemsize * channels
+        view = view[:len(view) - len(view) % frame_bytes]
+        return np.frombuffer(view, dtype=dtype).reshape(-1, channels)
+
+    def to_float(self, samples: np.ndarray) -> np.ndarray:
+        """Decoded samples to float32, downmixed to mono when audio.channels is 1"""
+        source_dtype = samples.dtype
+        if self.channels == 1:
+            return to_float32(downmix(samples), source_dtype)
+        return to_float32(samples, source_dtype)
+
+    def to_model_rate(self, samples: np.ndarray, sample_rate: int) -> np.ndarray:
+        """Resample float32 samples to audio.sample_rate"""
+        if samples.ndim == 1:
+            return resample(samples, sample_rate, self.sample_rate)
+        if sample_rate == self.sample_rate:
+            return samples
+        return np.stack([
+            resample(np.ascontiguousarray(samples[:, channel]), sample_rate, self.sample_rate)
+            for channel in range(samples.shape[1])
+        ], axis=1)
+
+    def finish(self, samples: np.ndarray, sample_rate: int) -> np.ndarray:
+        """Resample float32 samples to audio.sample_rate and normalize them"""
+        samples = self.to_model_rate(samples, sample_rate)
+        if self.normalize:
+            samples = normalize(samples, self.target_peak)
+        return samples
+
+    def _decode_float(self, data) -> Tuple[np.ndarray, int]:
+        """float32 samples (see to_float) and sample rate of bytes or a file upload"""
+        if hasattr(data, 'read'):
+            samples, sample_rate = self.decode_file(data)
+        else:
+            samples, sample_rate = self.decode(data)
+            if len(samples):
+                samples = self.to_float(samples)
+        if not len(samples):
+            raise AudioFormatError("Audio contains no samples")
+        return samples, sample_rate
+
+    def process(self, data) -> np.ndarray:
+        """Decode, downmix, resample and normalize an upload (bytes or a seekable file)"""
+        samples, sample_rate = self._decode_float(data)
+        return self.finish(samples, sample_rate)
+
+    def process_speech(self, data) -> Tuple[List[np.ndarray], Optional[VadResult]]:
+        """Like process, but keeping only the speech found by the VAD
+
+        Returns the normalized speech segments (none for silent input) and
+        the detection result, which is None when audio.vad.enabled is off.
+        Detection runs before normalization so that silence is not
+        amplified to full scale first.
+        """
+        samples, sample_rate = self._decode_float(data)
+        return self.speech_segments(samples, sample_rate)
+
+    def speech_segments(self, samples: np.ndarray, sample_rate: int) -> Tuple[List[np.ndarray], Optional[VadResult]]:
+        """Resample float32 samples (see to_float) and keep the speech, as process_speech"""
+        if not len(samples):
+            raise AudioFormatError("Audio contains no samples")
+        samples = self.to_model_rate(samples, sample_rate)
+        if not self.vad.enabled:
+            return [normalize(samples, self.target_peak) if self.normalize else samples], None
+        result = self.vad.detect(samples, self.sample_rate)
+        segments = [samples[start:end] for start, end in result.spans]
+        if self.normalize:
+            segments = [normalize(segment, self.target_peak) for segment in segments]
+        return segments, result
+
+
+class AudioRingBuffer:
+    """Fixed-capacity buffer holding the most recent float32 samples
+
+    Writes overwrite the oldest samples once the buffer is full, so memory
+    stays bounded however long a stream runs. Samples are 1-D (mono) or
+    (frames, channels).
+    """
+
+    def __init__(self, capacity: int, channels: int = 1):
+        """Allocate capacity frames"""
+        shape = (capacity,) if channels == 1 else (capacity, channels)
+        self._data = np.zeros(shape, dtype=np.float32)
+        self.capacity = capacity
+        self.total_written = 0
+
+    def __len__(self) -> int:
+        return min(self.total_written, self.capacity)
+
+    def write(self, samples: np.ndarray):
+        """Append samples, dropping the oldest ones beyond capacity"""
+        if len(samples) >= self.capacity:
+            self._data[:] = samples[-self.capacity:]
+            self.total_written += len(samples)
+            # Keep the write position consistent with total_written
+            self._data = np.roll(self._data, self.total_written % self.capacity, axis=0)
+            return
+        start = self.total_written % self.capacity
+        first = min(len(samples), self.capacity - start)
+        self._data[start:start + first] = samples[:first]
+        self._data[:len(samples) - first] = samples[first:]
+        self.total_written += len(samples)
+
+    def read(self) -> np.ndarray:
+        """Copy of the buffered samples, oldest first"""
+        if self.total_written <= self.capacity:
+            return self._data[:self.total_written].copy()
+        start = self.total_written % self.capacity
+        return np.concatenate([self._data[start:], self._data[:start]])
+
+    def clear(self):
+        """Drop all buffered samples"""
+        self.total_written = 0
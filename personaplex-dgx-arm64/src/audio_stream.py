@@ -0,0 +1,113 @@
+"""
+Streaming audio input for PersonaPlex
+Cuts incoming PCM frames into audio.chunk_size chunks and keeps the most
+recent audio in a ring buffer that responses are generated from
+"""
+
+import time
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from src.audio import AudioPreprocessor, AudioRingBuffer, AudioFormatError
+
+logger = logging.getLogger(__name__)
+
+
+class AudioStream:
+    """Incremental audio state of one streaming connection
+
+    feed() accepts PCM bytes of any length. Every complete chunk of
+    audio.chunk_size frames is decoded, converted to float32 (and downmixed
+    when the model takes mono) and written to a ring buffer holding the last
+    audio.stream.window_ms of audio, so per-message work is bounded by the
+    chunk size and memory by the window. Resampling and normalization run
+    once per response on the window (take() then AudioPreprocessor.finish),
+    which avoids filter edge effects at every chunk boundary.
+    """
+
+    def __init__(self, preprocessor: AudioPreprocessor, config: Dict[str, Any],
+                 sample_rate: Optional[int] = None, channels: Optional[int] = None,
+                 dtype: Optional[str] = None):
+        """Initialize from the audio config; the PCM layout defaults to audio.pcm"""
+        audio_config = config.get('audio', {}) or {}
+        stream_config = audio_config.get('stream', {}) or {}
+        self.preprocessor = preprocessor
+        self.chunk_size = int(audio_config.get('chunk_size', 4096))
+        self.sample_rate = int(sample_rate or preprocessor.pcm_sample_rate)
+        self.channels = int(channels or preprocessor.pcm_channels)
+        try:
+            self.dtype = np.dtype(dtype or preprocessor.pcm_dtype).newbyteorder('<')
+        except TypeError as e:
+            raise AudioFormatError(f"Unsupported PCM dtype: {dtype}") from e
+        if self.dtype.kind not in 'iuf' or self.sample_rate < 1 or self.channels < 1:
+            raise AudioFormatError("Invalid PCM layout")
+
+        self.min_context = int(self.sample_rate * float(stream_config.get('min_context_ms', 1000)) / 1000)
+        window = int(self.sample_rate * float(stream_config.get('window_ms', 10000)) / 1000)
+        self.ring = AudioRingBuffer(
+            max(window, self.chunk_size, self.min_context),
+            1 if preprocessor.channels == 1 else self.channels
+        )
+        self._chunk_bytes = self.chunk_size * self.channels * self.dtype.itemsize
+        self._pending = bytearray()
+        self._taken = 0
+        self.last_frame_at: Optional[float] = None
+        self.chunks = 0
+
+    def feed(self, data) -> int:
+        """Buffer PCM bytes; returns how many chunks were completed"""
+        self.last_frame_at = time.perf_counter()
+        self._pending += data
+        complete = len(self._pending) // self._chunk_bytes
+        if complete:
+            consumed = complete * self._chunk_bytes
+            self._write(memoryview(self._pending)[:consumed])
+            del self._pending[:consumed]
+            self.chunks += complete
+        return complete
+
+    def flush(self):
+        """Write a trailing partial chunk (at the end of an utterance)"""
+        if len(self._pending) >= self.channels * self.dtype.itemsize:
+            self._write(self._pending)
+        self._pending.clear()
+
+    def _write(self, data):
+        samples = self.preprocessor.decode_pcm(data, self.channels, self.dtype)
+        self.ring.write(self.preprocessor.to_float(samples))
+
+    @property
+    def ready(self) -> bool:
+        """Enough audio for a response and some of it not yet responded to"""
+        return self.ring.total_written >= self.min_context and self.ring.total_written > self._taken
+
+    @property
+    def has_new_audio(self) -> bool:
+        """Audio arrived since the last take()"""
+        return self.ring.total_written > self._taken
+
+    def take(self) -> Tuple[np.ndarray, Optional[float]]:
+        """Copy the window and the arrival time of its newest frame"""
+        self._taken = self.ring.total_written
+        return self.ring.read(), self.last_frame_at
+
+    def reset(self):
+        """Start a new utterance"""
+        self.ring.clear()
+        self._pending.clear()
+        self._taken = 0
+        self.last_frame_at = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Buffered audio and layout"""
+        return {
+            'sample_rate': self.sample_rate,
+            'channels': self.channels,
+            'dtype': self.dtype.name,
+            'chunk_size': self.chunk_size,
+            'chunks': self.chunks,
+            'buffered_ms': len(self.ring) * 1000 / self.sample_rate,
+            'received_ms': self.ring.total_written * 1000 / self.sample_rate
+        }
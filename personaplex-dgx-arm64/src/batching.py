@@ -0,0 +1,192 @@
+"""
+Dynamic micro-batching for PersonaPlex
+Collects concurrent text requests and runs them as one batched generate
+"""
+
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Tuple
+
+from src.metrics import QUEUE_WAIT
+from src.cancellation import CancelToken, cancelled_result
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _PendingRequest:
+    """A text request waiting to be batched"""
+    input_text: str
+    max_length: Optional[int]
+    gen_kwargs: Dict[str, Any]
+    cancel: Optional[CancelToken] = None
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def batch_key(self) -> Tuple:
+        """Requests can share a batch only if their sampling settings match"""
+        return tuple(sorted(self.gen_kwargs.items()))
+
+
+class BatchScheduler:
+    """Groups concurrent requests into batched model.generate calls
+
+    A single worker thread waits for the first pending request, then keeps
+    collecting until either max_batch_size requests are queued or max_wait_ms
+    has elapsed. Requests with different sampling settings are split into
+    separate batches; max_length is honoured per request. Requests whose
+    cancel token is set while queued are dropped, and tokens set while a
+    batch runs stop just their row.
+    """
+
+    def __init__(self, model_handler, max_batch_size: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None):
+        """Initialize scheduler from the handler's performance config"""
+        perf_config = model_handler.config.get('performance', {})
+        self.model_handler = model_handler
+        self.max_batch_size = max(int(max_batch_size or perf_config.get('batch_size', 1)), 1)
+        self.max_wait = float(
+            max_wait_ms if max_wait_ms is not None else perf_config.get('batch_wait_ms', 10)
+        ) / 1000.0
+        self._queue: "queue.Queue[Optional[_PendingRequest]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._stats = {
+            'requests': 0,
+            'batches': 0,
+            'max_batch_size_seen': 0,
+            'cancelled_in_queue': 0
+        }
+
+    def start(self):
+        """Start the batching worker thread"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="batch-scheduler", daemon=True
+        )
+        self._thread.start()
+        logger.info(
+            f"Batch scheduler started (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:.1f})"
+        )
+
+    def stop(self):
+        """Stop the worker thread, failing any requests still queued"""
+        if not self._running:
+            return
+        self._running = False
+        self._queue.put(None)
+        if self._thread:
+            self._thread.join()
+        while True:
+            try:
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending is not None and pending.future.set_running_or_notify_cancel():
+                pending.future.set_exception(RuntimeError("Batch scheduler stopped"))
+        logger.info("Batch scheduler stopped")
+
+    def submit(self, input_text: str, cancel: Optional[CancelToken] = None, **gen_kwargs) -> Future:
+        """Queue a text request and return a future for its result dict"""
+        if not self._running:
+            raise RuntimeError("Batch scheduler is not running")
+        max_length = gen_kwargs.pop('max_length', None)
+        pending = _PendingRequest(input_text, max_length, gen_kwargs, cancel)
+        self._queue.put(pending)
+        return pending.future
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get batching statistics"""
+        stats = dict(self._stats)
+        stats['avg_batch_size'] = (
+            stats['requests'] / stats['batches'] if stats['batches'] else 0.0
+        )
+        stats['queue_depth'] = self._queue.qsize()
+        stats['max_batch_size'] = self.max_batch_size
+        stats['max_wait_ms'] = self.max_wait * 1000
+        return stats
+
+    def _collect(self) -> List[_PendingRequest]:
+        """Block for the first request, then gather more until full or timed out"""
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                pending = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if pending is None:
+                # Re-post the sentinel so the run loop sees it after this batch
+                self._queue.put(None)
+                break
+            batch.append(pending)
+        return batch
+
+    def _run(self):
+        """Worker loop"""
+        while self._running:
+            # Drop requests whose caller already gave up (e.g. deadline passed)
+            batch = [
+                pending for pending in self._collect()
+                if pending.future.set_running_or_notify_cancel() and not self._cancelled(pending)
+            ]
+            if not batch:
+                continue
+
+            groups: Dict[Tuple, List[_PendingRequest]] = {}
+            for pending in batch:
+                groups.setdefault(pending.batch_key, []).append(pending)
+
+            for group in groups.values():
+                self._run_group(group)
+
+    def _cancelled(self, pending: _PendingRequest) -> bool:
+        """Resolve a request cancelled while queued; True if it was"""
+        if pending.cancel is None or not pending.cancel.is_set():
+            return False
+        pending.cancel.record('queued')
+        self._stats['cancelled_in_queue'] += 1
+        pending.future.set_result(cancelled_result(pending.cancel))
+        return True
+
+    def _run_group(self, group: List[_PendingRequest]):
+        """Run one batched generate and hand each caller its own result"""
+        started_at = time.perf_counter()
+        for pending in group:
+            QUEUE_WAIT.observe(started_at - pending.enqueued_at, queue='batch')
+        batch_kwargs = dict(group[0].gen_kwargs)
+        if any(pending.cancel is not None for pending in group):
+            batch_kwargs['cancel_tokens'] = [pending.cancel for pending in group]
+        try:
+            results = self.model_handler.generate_batch(
+                [pending.input_text for pending in group],
+                max_lengths=[pending.max_length for pending in group],
+                **batch_kwargs
+            )
+        except Exception as e:
+            logger.error(f"Batch execution failed: {e}")
+            for pending in group:
+                pending.future.set_exception(e)
+            return
+
+        self._stats['requests'] += len(group)
+        self._stats['batches'] += 1
+        self._stats['max_batch_size_seen'] = max(
+            self._stats['max_batch_size_seen'], len(group)
+        )
+        for pending, result in zip(group, results):
+            pending.future.set_result(result)
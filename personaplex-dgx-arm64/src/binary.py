@@ -0,0 +1,116 @@
+"""
+Binary request codecs for PersonaPlex
+Compact /generate/binary bodies for high-rate internal clients: raw PCM
+behind a small header, and token-ID arrays (packed int32 or msgpack) that
+bypass JSON parsing and the tokenizer
+"""
+
+import struct
+import logging
+from typing import Dict, Any, Tuple, Optional
+
+import numpy as np
+
+from src.audio import frames_from_bytes
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# Content types accepted by /generate/binary
+PCM_TYPE = 'application/x-personaplex-pcm'
+TOKENS_TYPE = 'application/x-personaplex-tokens'
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+# PCM body: magic, version, sample type code, channels, sample rate, then
+# interleaved little-endian samples
+PCM_MAGIC = b'PPCM'
+PCM_VERSION = 1
+PCM_HEADER = struct.Struct('<4sBBHI')
+PCM_DTYPES = {1: np.dtype('<i2'), 2: np.dtype('<i4'), 3: np.dtype('<f4'), 4: np.dtype(np.uint8)}
+
+# Keys a msgpack request map may carry besides input_ids
+MSGPACK_PARAMS = ('max_length', 'temperature', 'seed', 'timeout', 'model')
+
+
+class BinaryFormatError(ValueError):
+    """Raised for a malformed or unsupported binary request body"""
+
+
+def pack_pcm_header(sample_rate: int, channels: int = 1, dtype: Any = '<i2') -> bytes:
+    """Header to put in front of raw PCM samples"""
+    dtype = np.dtype(dtype)
+    code = next((code for code, value in PCM_DTYPES.items() if value == dtype), None)
+    if code is None:
+        raise BinaryFormatError(f"Unsupported PCM sample type {dtype}")
+    return PCM_HEADER.pack(PCM_MAGIC, PCM_VERSION, code, channels, sample_rate)
+
+
+def parse_pcm(body) -> Tuple[np.ndarray, int]:
+    """Parse a headered PCM body without copying the samples
+
+    Returns a read-only (frames, channels) view of the samples and their
+    sample rate; a trailing partial frame is dropped.
+    """
+    view = memoryview(body).cast('B')
+    if len(view) < PCM_HEADER.size:
+        raise BinaryFormatError("PCM body is shorter than its header")
+    magic, version, code, channels, sample_rate = PCM_HEADER.unpack_from(view)
+    if magic != PCM_MAGIC or version != PCM_VERSION:
+        raise BinaryFormatError(f"Expected a version {PCM_VERSION} PCM header")
+    if code not in PCM_DTYPES or channels < 1 or sample_rate < 1:
+        raise BinaryFormatError("Invalid PCM header")
+    dtype = PCM_DTYPES[code]
+    data = view[PCM_HEADER.size:]
+    frame_bytes = dtype.itemsize * channels
+    data = data[:len(data) - len(data) % frame_bytes]
+    return frames_from_bytes(data, dtype, channels), sample_rate
+
+
+def parse_tokens(body) -> np.ndarray:
+    """Token IDs of a packed little-endian int32 body"""
+    if len(body) % 4:
+        raise BinaryFormatError("Token body length is not a multiple of 4 bytes")
+    return np.frombuffer(body, dtype='<i4')
+
+
+def pack_tokens(token_ids) -> bytes:
+    """Packed little-endian int32 body of token IDs"""
+    return np.asarray(token_ids, dtype='<i4').tobytes()
+
+
+def parse_msgpack(body) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Token IDs and generation parameters of a msgpack body
+
+    The body is either an array of token IDs or a map with input_ids and
+    any of MSGPACK_PARAMS.
+    """
+    if msgpack is None:
+        raise BinaryFormatError("msgpack is not installed; send packed int32 tokens instead")
+    try:
+        message = msgpack.unpackb(body)
+    except Exception as e:
+        raise BinaryFormatError(f"Invalid msgpack body: {e}")
+    params: Dict[str, Any] = {}
+    if isinstance(message, dict):
+        params = {key: message[key] for key in MSGPACK_PARAMS if message.get(key) is not None}
+        message = message.get('input_ids')
+    if not isinstance(message, list) or not all(isinstance(token, int) for token in message):
+        raise BinaryFormatError("msgpack body must be an array of token IDs or a map with input_ids")
+    return np.asarray(message, dtype=np.int64), params
+
+
+def pack_msgpack(message: Dict[str, Any]) -> bytes:
+    """msgpack encoding of a response map"""
+    return msgpack.packb(message)
+
+
+def check_token_ids(token_ids: np.ndarray, vocab_size: Optional[int]):
+    """Raise BinaryFormatError for an empty prompt or IDs outside the vocabulary"""
+    if not len(token_ids):
+        raise BinaryFormatError("No token IDs given")
+    if token_ids.min() < 0 or (vocab_size is not None and token_ids.max() >= vocab_size):
+        raise BinaryFormatError(f"Token IDs must be in [0, {vocab_size})")
@@ -0,0 +1,143 @@
+"""
+Cooperative cancellation for PersonaPlex
+Per-request cancel tokens, checked between decode steps, stop generation
+when the client goes away or the request deadline passes
+"""
+
+import time
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Sequence
+
+import torch
+from transformers import StoppingCriteria
+
+from src.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CANCELLED = REGISTRY.counter(
+    'personaplex_cancelled_requests_total',
+    'Requests cancelled before finishing, by reason and whether generation had started (stage)',
+    ['reason', 'stage']
+)
+TOKENS_SAVED = REGISTRY.counter(
+    'personaplex_cancelled_tokens_saved_total',
+    'Tokens of budget left ungenerated because their request was cancelled mid-generation',
+    ['reason']
+)
+
+_lock = threading.Lock()
+_stats: Dict[str, Any] = {'requests': {}, 'tokens_saved': 0}
+
+
+class CancelToken(threading.Event):
+    """Cancellation flag for one request, with an optional deadline
+
+    A threading.Event, so it can stand in for a stream's stop_event: it
+    reads as set once cancel() (or set()) is called or once timeout
+    seconds have passed since it was created. reason records why it was
+    cancelled first ('deadline', 'client_disconnect', ...). Pickling keeps
+    only the deadline, so a token sent to a replica process still expires
+    but cannot be cancelled from this one.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, deadline: Optional[float] = None):
+        super().__init__()
+        if deadline is None and timeout is not None:
+            deadline = time.monotonic() + timeout
+        self.deadline = deadline
+        self.reason: Optional[str] = None
+        self._recorded = False
+
+    def cancel(self, reason: str):
+        """Cancel the request, keeping the first reason given"""
+        if self.reason is None:
+            self.reason = reason
+        self.set()
+
+    def is_set(self) -> bool:
+        if super().is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel('deadline')
+            return True
+        return False
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline, or None without one"""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def record(self, stage: str, tokens_saved: int = 0):
+        """Count this cancellation once; stage is 'queued' or 'running'"""
+        if self.reason is None or self._recorded:
+            return
+        self._recorded = True
+        CANCELLED.inc(reason=self.reason, stage=stage)
+        TOKENS_SAVED.inc(tokens_saved, reason=self.reason)
+        with _lock:
+            key = f"{self.reason}/{stage}"
+            _stats['requests'][key] = _stats['requests'].get(key, 0) + 1
+            _stats['tokens_saved'] += tokens_saved
+        logger.info(f"Request cancelled ({self.reason}) while {stage}, {tokens_saved} tokens saved")
+
+    def __reduce__(self):
+        return (CancelToken, (None, self.deadline))
+
+
+def cancelled_result(token: CancelToken) -> Dict[str, Any]:
+    """Result dict of a request stopped by token"""
+    return {
+        'output': None,
+        'success': False,
+        'error': f"Generation cancelled ({token.reason or 'stopped'})",
+        'cancelled': token.reason or 'stopped'
+    }
+
+
+class CancelCriteria(StoppingCriteria):
+    """Stops each row of a generate call once its cancel token is set
+
+    tokens holds one threading.Event (usually a CancelToken) or None per
+    batch row. With budgets, rows also stop once they have generated their
+    own number of new tokens, so a padded batch ends as soon as every row
+    is finished or cancelled rather than at the largest budget.
+    stopped_at records how many tokens each cancelled row had generated.
+    """
+
+    def __init__(self, tokens: Sequence[Optional[threading.Event]], prompt_length: int,
+                 budgets: Optional[Sequence[int]] = None):
+        self.tokens = list(tokens)
+        self.prompt_length = prompt_length
+        self.budgets = list(budgets) if budgets is not None else None
+        self.stopped_at: List[Optional[int]] = [None] * len(self.tokens)
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        generated = input_ids.shape[1] - self.prompt_length
+        done = []
+        for row, token in enumerate(self.tokens):
+            if self.stopped_at[row] is None and token is not None and token.is_set():
+                self.stopped_at[row] = generated
+            done.append(
+                self.stopped_at[row] is not None
+                or (self.budgets is not None and generated >= self.budgets[row])
+            )
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    def cancelled(self, row: int = 0) -> bool:
+        """Whether row was stopped by its token"""
+        return self.stopped_at[row] is not None
+
+    def record(self, budgets: Sequence[int]):
+        """Record the tokens saved by every cancelled row"""
+        for token, stopped_at, budget in zip(self.tokens, self.stopped_at, budgets):
+            if stopped_at is not None and isinstance(token, CancelToken):
+                token.record('running', max(budget - stopped_at, 0))
+
+
+def get_stats() -> Dict[str, Any]:
+    """Cancelled requests by reason/stage and tokens saved in this process"""
+    with _lock:
+        return {'requests': dict(_stats['requests']), 'tokens_saved': _stats['tokens_saved']}
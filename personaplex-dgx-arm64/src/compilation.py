@@ -0,0 +1,282 @@
+"""
+torch.compile support for PersonaPlex
+Pads prompts to a fixed set of length buckets and generates with static KV
+caches so compiled graphs are reused instead of recompiled per request
+"""
+
+import time
+import logging
+import functools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+import torch
+from transformers import StaticCache
+
+from src.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+BUCKET_LATENCY = REGISTRY.histogram(
+    'personaplex_bucket_generate_seconds', 'Generate latency by prompt length bucket', ['bucket']
+)
+
+# Recent latencies kept per bucket for the percentiles in get_stats
+LATENCY_WINDOW = 256
+
+# Graphs allowed per function beyond what warmup compiles (e.g. batch sizes
+# that were not warmed up)
+RECOMPILE_HEADROOM = 8
+
+
+def compiled_graphs() -> int:
+    """Graphs compiled by dynamo in this process so far"""
+    from torch._dynamo.utils import counters
+
+    return int(counters['stats']['unique_graphs'])
+
+
+class _StaticCacheForward:
+    """Model forward that runs compiled only for static-cache calls
+
+    Prefix-cache, session and other dynamic-cache generations change shape
+    every step and would recompile continuously, so they stay eager.
+    """
+
+    def __init__(self, eager, compiled):
+        self.eager = eager
+        self.compiled = compiled
+        # generate inspects forward's signature (e.g. for logits_to_keep)
+        functools.update_wrapper(self, eager)
+
+    def __call__(self, *args, **kwargs):
+        if isinstance(kwargs.get('past_key_values'), StaticCache):
+            return self.compiled(*args, **kwargs)
+        return self.eager(*args, **kwargs)
+
+
+class CompiledGeneration:
+    """Length-bucketed, static-cache generation for a compiled model
+
+    With performance.compile_model on, the model's forward is compiled and
+    every text generation is left-padded to the smallest of
+    performance.compile.buckets that fits its prompt. Generation uses a
+    StaticCache of max_cache_len (pooled per batch size), so each bucket
+    and batch size needs one prefill graph and each batch size one decode
+    graph. warmup() compiles those for warmup_batch_sizes at startup.
+    Prompts longer than the largest bucket run uncompiled. Graphs compiled
+    after warmup are counted as recompiles, and latency is tracked per
+    bucket, to help tune the bucket list.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """Initialize from the performance config"""
+        performance_config = config.get('performance', {}) or {}
+        compile_config = performance_config.get('compile', {}) or {}
+        self.enabled = bool(performance_config.get('compile_model', False))
+        self.backend = compile_config.get('backend', 'inductor')
+        self.mode = compile_config.get('mode')
+        self.max_cache_len = int(
+            compile_config.get('max_cache_len') or config.get('model', {}).get('max_length', 2048)
+        )
+        buckets = sorted({int(bucket) for bucket in compile_config.get('buckets') or [64, 128, 256, 512, 1024]})
+        self.buckets = [bucket for bucket in buckets if bucket < self.max_cache_len]
+        if self.enabled and len(self.buckets) < len(buckets):
+            logger.warning(f"Dropping compile buckets that leave no room below max_cache_len={self.max_cache_len}")
+        self.warmup_batch_sizes = [int(size) for size in compile_config.get('warmup_batch_sizes') or [1]]
+        self.warmup_new_tokens = max(int(compile_config.get('warmup_new_tokens', 4)), 2)
+
+        self._caches: Dict[int, List[StaticCache]] = {}
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, deque] = {}
+        self._requests: Dict[str, int] = {}
+        self.warmup_ms: Dict[str, float] = {}
+        self.graphs_after_warmup: Optional[int] = None
+        self.model = None
+
+    def compile(self, model):
+        """Compile model's forward for static-cache calls"""
+        # Each bucket needs a prefill graph with and without padding, plus a
+        # decode and a cache-allocating graph, per batch size; past dynamo's
+        # per-function limit new shapes silently run eager
+        needed = len(self.warmup_batch_sizes) * (2 * len(self.buckets) + 2) + RECOMPILE_HEADROOM
+        dynamo_config = torch._dynamo.config
+        if needed > dynamo_config.recompile_limit:
+            dynamo_config.recompile_limit = needed
+        compiled = torch.compile(model.forward, backend=self.backend, mode=self.mode, dynamic=False)
+        model.forward = _StaticCacheForward(model.forward, compiled)
+        self.model = model
+        logger.info(f"Compiled model forward (backend={self.backend}, buckets={self.buckets})")
+
+    def disable(self):
+        """Restore the eager forward and stop bucketing"""
+        if self.model is not None and isinstance(self.model.forward, _StaticCacheForward):
+            self.model.forward = self.model.forward.eager
+        self.model = None
+        self._caches.clear()
+
+    @property
+    def active(self) -> bool:
+        return self.enabled and self.model is not None
+
+    def bucket_for(self, length: int) -> Optional[int]:
+        """Smallest bucket that fits length, or None"""
+        for bucket in self.buckets:
+            if length <= bucket:
+                return bucket
+        return None
+
+    @contextmanager
+    def prepare(self, inputs: Dict[str, torch.Tensor], generation_config: Dict[str, Any],
+                pad_token_id: int):
+        """Pad inputs to their bucket and attach a pooled static cache
+
+        Yields the (inputs, generation_config) to generate with. A
+        'max_length' budget is converted to max_new_tokens for the unpadded
+        prompt; either is capped to what fits in the static cache. Inputs
+        that fit no bucket are yielded unchanged and run uncompiled.
+        """
+        length = inputs['input_ids'].shape[1]
+        bucket = self.bucket_for(length) if self.active else None
+        if bucket is None:
+            if self.active:
+                self._record('overflow', None)
+            yield inputs, generation_config
+            return
+
+        pad = bucket - length
+        if pad:
+            input_ids = inputs['input_ids']
+            inputs = {
+                **inputs,
+                'input_ids': torch.nn.functional.pad(input_ids, (pad, 0), value=pad_token_id),
+                'attention_mask': torch.nn.functional.pad(
+                    inputs.get('attention_mask', torch.ones_like(input_ids)), (pad, 0), value=0
+                )
+            }
+
+        generation_config = dict(generation_config)
+        max_length = generation_config.pop('max_length', None)
+        if 'max_new_tokens' in generation_config:
+            new_tokens = generation_config['max_new_tokens']
+        else:
+            new_tokens = max_length - length
+        generation_config['max_new_tokens'] = max(min(new_tokens, self.max_cache_len - bucket), 1)
+        if generation_config.get('min_new_tokens', 0) > generation_config['max_new_tokens']:
+            generation_config['min_new_tokens'] = generation_config['max_new_tokens']
+
+        batch_size = inputs['input_ids'].shape[0]
+        cache = self._acquire(batch_size)
+        generation_config['past_key_values'] = cache
+        # The forward is already compiled; keep generate from compiling it again
+        generation_config['disable_compile'] = True
+        start = time.perf_counter()
+        try:
+            yield inputs, generation_config
+        finally:
+            self._release(batch_size, cache)
+            self._record(str(bucket), time.perf_counter() - start)
+
+    def _acquire(self, batch_size: int) -> StaticCache:
+        with self._lock:
+            pool = self._caches.get(batch_size)
+            if pool:
+                cache = pool.pop()
+                cache.reset()
+                return cache
+        return StaticCache(config=self.model.config, max_cache_len=self.max_cache_len)
+
+    def _release(self, batch_size: int, cache: StaticCache):
+        with self._lock:
+            self._caches.setdefault(batch_size, []).append(cache)
+
+    def _record(self, bucket: str, seconds: Optional[float]):
+        with self._lock:
+            self._requests[bucket] = self._requests.get(bucket, 0) + 1
+            if seconds is not None:
+                self._latencies.setdefault(bucket, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+        if seconds is not None:
+            BUCKET_LATENCY.observe(seconds, bucket=bucket)
+
+    def _initialize_caches(self, batch_size: int, count: int, pad_token_id: int):
+        """Add count allocated caches to the pool
+
+        A new StaticCache allocates its tensors during its first forward,
+        which traces separately from later (allocated) calls; doing that
+        here keeps it out of serving.
+        """
+        input_ids = torch.full((batch_size, self.buckets[0]), pad_token_id, dtype=torch.long, device=self.model.device)
+        caches = []
+        for _ in range(count):
+            cache = StaticCache(config=self.model.config, max_cache_len=self.max_cache_len)
+            with torch.no_grad():
+                self.model.generate(
+                    input_ids=input_ids, attention_mask=torch.ones_like(input_ids), past_key_values=cache,
+                    max_new_tokens=1, do_sample=False, disable_compile=True
+                )
+            caches.append(cache)
+        for cache in caches:
+            self._release(batch_size, cache)
+
+    def warmup(self, pad_token_id: int, pool_size: int = 1):
+        """Compile every bucket for each warmup batch size
+
+        pool_size caches are allocated per batch size, enough for that
+        many concurrent generations without allocating during serving.
+        """
+        if not self.active or not self.buckets:
+            return
+        for batch_size in self.warmup_batch_sizes:
+            self._initialize_caches(batch_size, pool_size, pad_token_id)
+            for bucket in self.buckets:
+                start = time.perf_counter()
+                # generate drops an all-ones attention mask, so prompts that
+                # fill the bucket exactly and padded ones trace different graphs
+                for length in sorted({max(bucket - 1, 1), bucket}):
+                    input_ids = torch.full(
+                        (batch_size, length), pad_token_id, dtype=torch.long, device=self.model.device
+                    )
+                    inputs = {'input_ids': input_ids, 'attention_mask': torch.ones_like(input_ids)}
+                    config = {'max_new_tokens': self.warmup_new_tokens, 'min_new_tokens': self.warmup_new_tokens}
+                    with torch.no_grad(), self.prepare(inputs, config, pad_token_id) as (padded, generation_config):
+                        self.model.generate(**padded, do_sample=False, **generation_config)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                self.warmup_ms[f"{bucket}x{batch_size}"] = elapsed_ms
+                logger.info(f"Warmed up bucket {bucket} (batch {batch_size}) in {elapsed_ms:.0f}ms")
+        # Warmup calls are not traffic
+        with self._lock:
+            self._requests.clear()
+            self._latencies.clear()
+        self.graphs_after_warmup = compiled_graphs()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Buckets, recompiles and per-bucket latency"""
+        if not self.enabled:
+            return {'enabled': False}
+        graphs = compiled_graphs()
+        with self._lock:
+            buckets = {}
+            for bucket, count in self._requests.items():
+                samples = sorted(self._latencies.get(bucket, ()))
+                buckets[bucket] = {'requests': count}
+                if samples:
+                    buckets[bucket].update({
+                        'p50_ms': samples[len(samples) // 2] * 1000,
+                        'p95_ms': samples[min(int(len(samples) * 0.95), len(samples) - 1)] * 1000,
+                        'mean_ms': sum(samples) / len(samples) * 1000
+                    })
+        return {
+            'enabled': True,
+            'active': self.active,
+            'backend': self.backend,
+            'buckets': self.buckets,
+            'max_cache_len': self.max_cache_len,
+            'warmup_ms': self.warmup_ms,
+            'graphs': graphs,
+            'recompiles_after_warmup': (
+                graphs - self.graphs_after_warmup if self.graphs_after_warmup is not None else None
+            ),
+            'per_bucket': buckets
+        }
@@ -0,0 +1,128 @@
+"""
+Inference executor for PersonaPlex
+Runs blocking model calls off the asyncio event loop with bounded admission
+"""
+
+import asyncio
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, Dict, Any, Callable
+
+from src.metrics import QUEUE_WAIT, ERRORS
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the admission queue is full"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Server is at capacity, retry later")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """Bounded worker pool for blocking inference calls
+
+    At most max_workers calls run at once and at most max_queue_size more
+    wait for a worker. Anything beyond that is rejected immediately with
+    QueueFullError so callers can answer 429 instead of piling up work.
+    The same admission slots cover work that runs elsewhere (the batch
+    scheduler, streaming threads) through admit().
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """Initialize executor from the server config"""
+        server_config = config.get('server', {})
+        self.max_workers = max(int(server_config.get('inference_workers', 1)), 1)
+        self.max_queue_size = max(int(server_config.get('max_queue_size', 32)), 0)
+        self.retry_after = int(server_config.get('retry_after', 1))
+        self.timeout = server_config.get('timeout')
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="inference"
+        )
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {
+            'admitted': 0,
+            'rejected': 0,
+            'timed_out': 0
+        }
+
+    @property
+    def capacity(self) -> int:
+        """Total requests allowed in flight (running plus queued)"""
+        return self.max_workers + self.max_queue_size
+
+    def admit(self) -> Callable[..., None]:
+        """Reserve an admission slot or raise QueueFullError
+
+        Returns an idempotent release function, which also works as a
+        future done-callback.
+        """
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self._stats['rejected'] += 1
+                ERRORS.inc(type='queue_full')
+                raise QueueFullError(self.retry_after)
+            self._in_flight += 1
+            self._stats['admitted'] += 1
+
+        released = [False]
+
+        def release(*_):
+            with self._lock:
+                if released[0]:
+                    return
+                released[0] = True
+                self._in_flight -= 1
+
+        return release
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Admit and submit fn to the worker pool"""
+        release = self.admit()
+        enqueued_at = time.perf_counter()
+
+        def run():
+            QUEUE_WAIT.observe(time.perf_counter() - enqueued_at, queue='executor')
+            return fn(*args, **kwargs)
+
+        try:
+            future = self._pool.submit(run)
+        except Exception:
+            release()
+            raise
+        future.add_done_callback(release)
+        return future
+
+    async def wait(self, future: Future, timeout: Optional[float] = None) -> Any:
+        """Await a concurrent future, applying the per-request deadline"""
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._stats['timed_out'] += 1
+            ERRORS.inc(type='timeout')
+            raise
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn on the worker pool and await its result"""
+        return await self.wait(self.submit(fn, *args, **kwargs))
+
+    def shutdown(self):
+        """Stop the worker pool"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get admission statistics"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = self._in_flight
+        stats['capacity'] = self.capacity
+        stats['max_workers'] = self.max_workers
+        stats['timeout'] = self.timeout
+        return stats
@@ -0,0 +1,363 @@
+"""
+Memory governor for PersonaPlex
+Estimates each generation's KV-cache footprint and admits, queues or
+rejects it so the process stays within a device (or host RSS) budget
+"""
+
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Callable
+
+import torch
+
+from src.metrics import REGISTRY, ERRORS
+
+logger = logging.getLogger(__name__)
+
+MEMORY_BYTES = REGISTRY.gauge(
+    'personaplex_memory_governor_bytes',
+    'Memory governor budget, baseline usage and bytes reserved by in-flight generations', ['kind']
+)
+ADMISSIONS = REGISTRY.counter(
+    'personaplex_memory_admissions_total', 'Generations by memory-governor outcome', ['outcome']
+)
+
+MB = 1024 * 1024
+
+# How often a queued generation re-checks its cancel token
+_POLL_SECONDS = 0.1
+
+
+class MemoryBudgetError(Exception):
+    """Raised when a generation does not fit the memory budget
+
+    retry_after is None when it can never fit (the request is too large)
+    and a number of seconds when it timed out waiting for memory.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def too_large(self) -> bool:
+        return self.retry_after is None
+
+
+def rejected_result(error: MemoryBudgetError) -> Dict[str, Any]:
+    """Result dict of a generation the memory governor turned away"""
+    result = {
+        'output': None,
+        'success': False,
+        'error': str(error),
+        'memory': 'too_large' if error.too_large else 'busy'
+    }
+    if not error.too_large:
+        result['retry_after'] = error.retry_after
+    return result
+
+
+def _process_rss() -> int:
+    """Resident set size of this process in bytes"""
+    with open('/proc/self/status', 'r') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def _host_memory() -> int:
+    """Host memory available to this process (MemTotal, or the cgroup limit if lower)"""
+    total = 0
+    with open('/proc/meminfo', 'r') as f:
+        for line in f:
+            if line.startswith('MemTotal:'):
+                total = int(line.split()[1]) * 1024
+                break
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path, 'r') as f:
+                limit = f.read().strip()
+        except OSError:
+            continue
+        if limit.isdigit() and 0 < int(limit) < total:
+            total = int(limit)
+        break
+    return total
+
+
+class MemoryGovernor:
+    """Keeps in-flight generations within a memory budget
+
+    The budget is gpu.memory_fraction of the device's memory (host memory,
+    measured as RSS, on CPU), split evenly between the processes sharing it
+    (uvicorn workers, and CPU replica processes), unless
+    gpu.memory_governor.budget_mb sets it outright. On CUDA the fraction is
+    also applied to the caching allocator, and allow_growth: false reserves
+    the whole budget at startup.
+
+    Each generation reserves an estimate of its KV cache (prompt plus new
+    tokens, per row), prefill activations and logits before it runs. A
+    reservation that fits next to the baseline (memory in use while idle:
+    weights, prefix and session caches) and the other reservations is
+    admitted; one that would fit once others finish waits up to
+    queue_timeout seconds; one that can never fit is rejected. On CUDA the
+    baseline is re-measured whenever the server goes idle; RSS keeps memory
+    the allocator holds for reuse, so on CPU it is the RSS after loading
+    plus the growth of the prefix and session caches since.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """Initialize from the gpu and server config"""
+        gpu_config = config.get('gpu', {}) or {}
+        governor_config = gpu_config.get('memory_governor', {}) or {}
+        server_config = config.get('server', {}) or {}
+        self.enabled = bool(governor_config.get('enabled', True))
+        self.memory_fraction = float(gpu_config.get('memory_fraction', 0.9))
+        if not 0 < self.memory_fraction <= 1:
+            raise ValueError(f"gpu.memory_fraction must be in (0, 1], not {self.memory_fraction}")
+        self.allow_growth = bool(gpu_config.get('allow_growth', True))
+        self.budget_mb = governor_config.get('budget_mb')
+        self.overhead = float(governor_config.get('overhead', 0.2))
+        self.queue_timeout = float(governor_config.get('queue_timeout', 30))
+        self.retry_after = int(server_config.get('retry_after', 1))
+        self.workers = max(int(server_config.get('workers', 1)), 1)
+        self.cpu_replicas = max(int(gpu_config.get('cpu_replicas', 1)), 1)
+
+        self.device: Optional[torch.device] = None
+        self.budget = 0
+        self.base = 0
+        self.reserved = 0
+        self.peak_reserved = 0
+        self.in_flight = 0
+        self.kv_bytes_per_token = 0
+        self.activation_bytes_per_token = 0
+        self.logits_bytes = 0
+        self._cache_bytes: Callable[[], int] = lambda: 0
+        self._loaded = 0
+        self._loaded_cache = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'admitted': 0, 'queued': 0, 'rejected': 0, 'timed_out': 0,
+            'cancelled': 0, 'clamped_batches': 0
+        }
+
+    def configure(self, device: torch.device):
+        """Set the budget for device and apply the CUDA allocator limits
+
+        Called before the weights load so the allocator cap covers them.
+        """
+        self.device = device
+        if device.type == 'cuda':
+            fraction = self.memory_fraction / self.workers
+            torch.cuda.set_per_process_memory_fraction(fraction, device)
+            total = torch.cuda.get_device_properties(device).total_memory
+        else:
+            fraction = self.memory_fraction / (self.workers * self.cpu_replicas)
+            total = _host_memory()
+        self.budget = int(float(self.budget_mb) * MB) if self.budget_mb else int(total * fraction)
+        MEMORY_BYTES.set(self.budget, kind='budget')
+
+    def attach(self, model, draft=None, cache_bytes: Optional[Callable[[], int]] = None):
+        """Size per-token estimates from the loaded model and measure the baseline
+
+        cache_bytes returns the bytes held by long-lived KV caches (prefix
+        cache, sessions).
+        """
+        self.kv_bytes_per_token = self._kv_bytes_per_token(model)
+        text_config = model.config.get_text_config()
+        element_size = self._element_size(model)
+        hidden = getattr(text_config, 'hidden_size', 0)
+        intermediate = getattr(text_config, 'intermediate_size', None) or 4 * hidden
+        # Prefill holds roughly one layer's hidden and MLP activations per token
+        self.activation_bytes_per_token = (hidden + intermediate) * element_size
+        # generate keeps float32 logits for the last position of each row
+        self.logits_bytes = getattr(text_config, 'vocab_size', 0) * 4
+        if draft is not None:
+            self.kv_bytes_per_token += self._kv_bytes_per_token(draft)
+
+        if self.device is not None and self.device.type == 'cuda' and not self.allow_growth:
+            # Hold the whole budget in the caching allocator up front
+            free = self.budget - torch.cuda.memory_reserved(self.device)
+            if free > 0:
+                block = torch.empty(free, dtype=torch.uint8, device=self.device)
+                del block
+        with self._cond:
+            if cache_bytes is not None:
+                self._cache_bytes = cache_bytes
+            self._loaded = self._measure()
+            self._loaded_cache = self._cache_bytes()
+            self.base = self._loaded
+            MEMORY_BYTES.set(self.base, kind='base')
+        if self.enabled and self.base >= self.budget:
+            logger.warning(
+                f"Memory in use after loading ({self.base / MB:.0f}MB) already exceeds the "
+                f"{self.budget / MB:.0f}MB budget; generations will be rejected until gpu.memory_fraction "
+                "or gpu.memory_governor.budget_mb is raised"
+            )
+        logger.info(
+            f"Memory governor: budget {self.budget / MB:.0f}MB, baseline {self.base / MB:.0f}MB, "
+            f"{self.kv_bytes_per_token} KV bytes per token"
+        )
+
+    def rebase(self):
+        """Re-measure the baseline after other models were loaded or unloaded
+
+        Memory held by running generations is approximated by what they
+        reserved.
+        """
+        with self._cond:
+            self._loaded = max(self._measure() - self.reserved, 0)
+            self._loaded_cache = self._cache_bytes()
+            self.base = self._loaded
+            MEMORY_BYTES.set(self.base, kind='base')
+            self._cond.notify_all()
+
+    @property
+    def active(self) -> bool:
+        return self.enabled and self.kv_bytes_per_token > 0
+
+    @staticmethod
+    def _element_size(model) -> int:
+        dtype = getattr(model, 'dtype', torch.float32)
+        # Quantized (integer) weights still compute in floating point
+        return torch.finfo(dtype).bits // 8 if dtype.is_floating_point else 4
+
+    def _kv_bytes_per_token(self, model) -> int:
+        """Key and value bytes one token adds to every layer's cache"""
+        text_config = model.config.get_text_config()
+        layers = getattr(text_config, 'num_hidden_layers', 0)
+        heads = getattr(text_config, 'num_attention_heads', 1)
+        kv_heads = getattr(text_config, 'num_key_value_heads', None) or heads
+        head_dim = getattr(text_config, 'head_dim', None) or text_config.hidden_size // heads
+        return 2 * layers * kv_heads * head_dim * self._element_size(model)
+
+    def _measure(self) -> int:
+        """Memory in use now: allocated device memory, or RSS on CPU"""
+        if self.device is not None and self.device.type == 'cuda':
+            return torch.cuda.memory_allocated(self.device)
+        return _process_rss()
+
+    def _baseline(self) -> int:
+        """Memory in use with no generation running"""
+        if self.device is not None and self.device.type == 'cuda':
+            return self._measure()
+        return max(self._loaded + self._cache_bytes() - self._loaded_cache, 0)
+
+    def estimate(self, prompt_tokens: int, new_tokens: int, rows: int = 1) -> int:
+        """Bytes a generation of rows sequences needs on top of the baseline"""
+        kv = (prompt_tokens + new_tokens) * self.kv_bytes_per_token
+        activations = prompt_tokens * self.activation_bytes_per_token
+        return int(rows * ((kv + activations) * (1 + self.overhead) + self.logits_bytes))
+
+    @property
+    def capacity(self) -> int:
+        """Bytes available to generations when none are running"""
+        return max(self.budget - self.base, 0)
+
+    def rows_that_fit(self, row_bytes: int, rows: int) -> int:
+        """Largest batch (up to rows) of row_bytes rows to run now, or 0 if one row never fits
+
+        At least one row is returned when a row fits an idle budget, so
+        callers queue for it rather than spinning.
+        """
+        if not self.active:
+            return rows
+        with self._cond:
+            available = self.capacity - self.reserved
+            if row_bytes * rows <= available:
+                return rows
+            if row_bytes > self.capacity:
+                return 0
+            self._stats['clamped_batches'] += 1
+            return max(min(available // row_bytes, rows), 1)
+
+    @contextmanager
+    def reserve(self, nbytes: int, cancel: Optional[threading.Event] = None):
+        """Hold nbytes of the budget while the context runs
+
+        Raises MemoryBudgetError if nbytes can never fit or does not fit
+        within queue_timeout. A wait ended by cancel reserves nothing;
+        callers check cancel before generating.
+        """
+        if not self.active or not self._acquire(nbytes, cancel):
+            yield
+            return
+        try:
+            yield
+        finally:
+            self._release(nbytes)
+
+    def _fits(self, nbytes: int) -> bool:
+        return self.base + self.reserved + nbytes <= self.budget
+
+    def _acquire(self, nbytes: int, cancel: Optional[threading.Event]) -> bool:
+        """Reserve nbytes, waiting for other generations if needed"""
+        with self._cond:
+            if nbytes > self.capacity:
+                self._reject('rejected')
+                raise MemoryBudgetError(
+                    f"Request needs ~{nbytes / MB:.0f}MB, more than the {self.capacity / MB:.0f}MB "
+                    "memory budget for generation; lower max_length"
+                )
+            if not self._fits(nbytes):
+                self._stats['queued'] += 1
+                ADMISSIONS.inc(outcome='queued')
+                deadline = time.monotonic() + self.queue_timeout
+                while not self._fits(nbytes):
+                    if cancel is not None and cancel.is_set():
+                        self._stats['cancelled'] += 1
+                        ADMISSIONS.inc(outcome='cancelled')
+                        return False
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._reject('timed_out')
+                        raise MemoryBudgetError(
+                            "Timed out waiting for memory, retry later", retry_after=self.retry_after
+                        )
+                    self._cond.wait(min(remaining, _POLL_SECONDS))
+            self.reserved += nbytes
+            self.in_flight += 1
+            self.peak_reserved = max(self.peak_reserved, self.reserved)
+            self._stats['admitted'] += 1
+            ADMISSIONS.inc(outcome='admitted')
+            MEMORY_BYTES.set(self.reserved, kind='reserved')
+            return True
+
+    def _reject(self, outcome: str):
+        self._stats[outcome] += 1
+        ADMISSIONS.inc(outcome=outcome)
+        ERRORS.inc(type='memory_budget')
+
+    def _release(self, nbytes: int):
+        with self._cond:
+            self.reserved -= nbytes
+            self.in_flight -= 1
+            if not self.in_flight:
+                # Idle: pick up memory held by caches that grew meanwhile
+                self.base = self._baseline()
+                MEMORY_BYTES.set(self.base, kind='base')
+            MEMORY_BYTES.set(self.reserved, kind='reserved')
+            self._cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Budget, usage and admission counts"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'enabled': self.enabled,
+                'mode': 'device' if self.device is not None and self.device.type == 'cuda' else 'rss',
+                'memory_fraction': self.memory_fraction,
+                'allow_growth': self.allow_growth,
+                'budget_mb': self.budget / MB,
+                'base_mb': self.base / MB,
+                'reserved_mb': self.reserved / MB,
+                'peak_reserved_mb': self.peak_reserved / MB,
+                'available_mb': max(self.budget - self.base - self.reserved, 0) / MB,
+                'in_use_mb': self._measure() / MB,
+                'in_flight': self.in_flight,
+                'kv_bytes_per_token': self.kv_bytes_per_token
+            })
+        return stats
@@ -0,0 +1,382 @@
+"""
+Metrics for PersonaPlex
+Lightweight in-process registry rendered in the Prometheus text format
+"""
+
+import os
+import time
+import bisect
+import threading
+import logging
+from typing import Optional, Dict, Any, List, Tuple, Callable, Iterable
+
+import torch
+from transformers import StoppingCriteria
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from sub-millisecond tokenization up to long generations
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0
+)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...],
+                   extra: Optional[Tuple[str, str]] = None) -> str:
+    """Render a {name="value",...} label set"""
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _escape(value: Any) -> str:
+    """Escape a label value"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    """Render a sample value"""
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base class: a named metric with a fixed set of label names"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        """Label values in labelnames order"""
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        """Text-format lines for this metric"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing value"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        """Increase the counter"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        """Current value"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or is read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels):
+        """Set the gauge"""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        """Increase the gauge"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        """Decrease the gauge"""
+        self.inc(-amount, **labels)
+
+    def _samples(self) -> List[str]:
+        if self._callback is not None:
+            try:
+                items = list(self._callback().items())
+            except Exception as e:
+                logger.warning(f"Metric callback for {self.name} failed: {e}")
+                items = []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram of observed values"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        """Record one observation"""
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = ([0] * (len(self.buckets) + 1), [0.0])
+                self._series[key] = series
+            series[0][index] += 1
+            series[1][0] += value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), total[0]) for key, (counts, total) in self._series.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together for /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        """Add a metric (names must be unique)"""
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        """Create and register a counter"""
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+              callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None) -> Gauge:
+        """Create and register a gauge"""
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        """Create and register a histogram"""
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition of every metric"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _process_memory() -> Dict[Tuple[str, ...], float]:
+    """Resident and virtual memory of this process"""
+    values = {}
+    with open('/proc/self/status', 'r') as f:
+        for line in f:
+            if line.startswith(('VmRSS:', 'VmHWM:', 'VmSize:')):
+                name, amount = line.split(':', 1)
+                kind = {'VmRSS': 'resident', 'VmHWM': 'resident_peak', 'VmSize': 'virtual'}[name]
+                values[(kind,)] = int(amount.split()[0]) * 1024
+    return values
+
+
+def _system_memory() -> Dict[Tuple[str, ...], float]:
+    """Host memory totals"""
+    values = {}
+    with open('/proc/meminfo', 'r') as f:
+        for line in f:
+            name, amount = line.split(':', 1)
+            if name in ('MemTotal', 'MemAvailable'):
+                values[(name[3:].lower(),)] = int(amount.split()[0]) * 1024
+    return values
+
+
+def _gpu_memory() -> Dict[Tuple[str, ...], float]:
+    """CUDA memory allocated and reserved per device"""
+    values = {}
+    if torch.cuda.is_available():
+        for index in range(torch.cuda.device_count()):
+            values[(str(index), 'allocated')] = torch.cuda.memory_allocated(index)
+            values[(str(index), 'reserved')] = torch.cuda.memory_reserved(index)
+    return values
+
+
+def _process_cpu() -> Dict[Tuple[str, ...], float]:
+    """CPU time used by this process"""
+    times = os.times()
+    return {('user',): times.user, ('system',): times.system}
+
+
+REGISTRY = MetricsRegistry()
+
+QUEUE_WAIT = REGISTRY.histogram(
+    'personaplex_queue_wait_seconds', 'Time requests wait before execution starts', ['queue']
+)
+TOKENIZE_LATENCY = REGISTRY.histogram(
+    'personaplex_tokenize_seconds', 'Prompt tokenization time', ['kind']
+)
+PREFILL_LATENCY = REGISTRY.histogram(
+    'personaplex_prefill_seconds', 'Time from generate start to the first generated token', ['kind']
+)
+DECODE_LATENCY = REGISTRY.histogram(
+    'personaplex_decode_seconds', 'Time generating tokens after the first', ['kind']
+)
+DETOKENIZE_LATENCY = REGISTRY.histogram(
+    'personaplex_detokenize_seconds', 'Output decoding time', ['kind']
+)
+REQUEST_LATENCY = REGISTRY.histogram(
+    'personaplex_request_duration_seconds', 'End-to-end HTTP request latency', ['route', 'status']
+)
+REQUESTS = REGISTRY.counter(
+    'personaplex_requests_total', 'HTTP requests handled', ['route', 'status']
+)
+IN_FLIGHT = REGISTRY.gauge(
+    'personaplex_requests_in_flight', 'HTTP requests currently being handled'
+)
+ERRORS = REGISTRY.counter(
+    'personaplex_errors_total', 'Errors by type', ['type']
+)
+PROMPT_TOKENS = REGISTRY.counter(
+    'personaplex_prompt_tokens_total', 'Prompt tokens processed', ['kind']
+)
+GENERATED_TOKENS = REGISTRY.counter(
+    'personaplex_generated_tokens_total', 'Tokens generated', ['kind']
+)
+AUDIO_SECONDS = REGISTRY.counter(
+    'personaplex_audio_seconds_total', 'Seconds of uploaded audio kept as speech or removed as silence', ['kind']
+)
+AUDIO_STREAM_LATENCY = REGISTRY.histogram(
+    'personaplex_audio_stream_latency_seconds',
+    'Time from the last audio frame of an utterance to the first response message'
+)
+DECODE_THROUGHPUT = REGISTRY.gauge(
+    'personaplex_decode_tokens_per_second', 'Decode throughput of the most recent generation', ['kind']
+)
+REGISTRY.gauge(
+    'personaplex_process_memory_bytes', 'Memory of the server process', ['type'],
+    callback=_process_memory
+)
+REGISTRY.gauge(
+    'personaplex_system_memory_bytes', 'Host memory', ['type'],
+    callback=_system_memory
+)
+REGISTRY.gauge(
+    'personaplex_gpu_memory_bytes', 'CUDA memory per device', ['device', 'type'],
+    callback=_gpu_memory
+)
+REGISTRY.gauge(
+    'personaplex_process_cpu_seconds', 'CPU time used by the server process', ['mode'],
+    callback=_process_cpu
+)
+
+
+class GenerationTimer:
+    """Records the phases of one generate call into the hot-path histograms
+
+    Call tokenized() after tokenization and generating() once a generation
+    slot is held, pass criteria to generate so the end of prefill is
+    timestamped, then call generated() and finally finish() with the token
+    counts after detokenization. Nothing is recorded per token except a
+    timestamp on the first step.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.start = time.perf_counter()
+        self.tokenized_at: Optional[float] = None
+        self.generate_start: Optional[float] = None
+        self.generated_at: Optional[float] = None
+        self.criteria = _FirstStepCriteria()
+
+    def tokenized(self):
+        """Mark the end of tokenization"""
+        self.tokenized_at = time.perf_counter()
+        TOKENIZE_LATENCY.observe(self.tokenized_at - self.start, kind=self.kind)
+
+    def generating(self):
+        """Mark the start of model.generate (after waiting for a slot)"""
+        self.generate_start = time.perf_counter()
+        QUEUE_WAIT.observe(self.generate_start - (self.tokenized_at or self.start), queue='generation_slot')
+
+    def generated(self):
+        """Mark the end of model.generate"""
+        self.generated_at = time.perf_counter()
+
+    def finish(self, prompt_tokens: int, generated_tokens: int):
+        """Mark the end of detokenization and record all phases"""
+        now = time.perf_counter()
+        generate_start = self.generate_start or self.tokenized_at or self.start
+        generated_at = self.generated_at or now
+        first_step = self.criteria.first_step_at or generated_at
+        PREFILL_LATENCY.observe(first_step - generate_start, kind=self.kind)
+        decode_seconds = generated_at - first_step
+        DECODE_LATENCY.observe(decode_seconds, kind=self.kind)
+        DETOKENIZE_LATENCY.observe(now - generated_at, kind=self.kind)
+        PROMPT_TOKENS.inc(prompt_tokens, kind=self.kind)
+        GENERATED_TOKENS.inc(generated_tokens, kind=self.kind)
+        if decode_seconds > 0 and generated_tokens > 1:
+            DECODE_THROUGHPUT.set((generated_tokens - 1) / decode_seconds, kind=self.kind)
+
+
+class _FirstStepCriteria(StoppingCriteria):
+    """Stopping criterion that never stops; remembers when the first step ended"""
+
+    def __init__(self):
+        self.first_step_at: Optional[float] = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        if self.first_step_at is None:
+            self.first_step_at = time.perf_counter()
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
@@ -4,32 +4,130 @@ Handles model loading, inference, and management
 """
 
 import os
+import gc
+import json
+import time
+import queue
+import threading
 import torch
 import yaml
-import subprocess
-import sys
-from typing import Optional, Dict, Any
-from transformers import AutoModelForCausalLM, AutoTokenizer, AutoProcessor
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import Optional, Dict, Any, List, Iterator
+from transformers import (
+    AutoModelForCausalLM,
+    AutoTokenizer,
+    AutoProcessor,
+    StoppingCriteria,
+    StoppingCriteriaList
+)
+from transformers.generation.streamers import BaseStreamer
 from pathlib import Path
 import logging
-from huggingface_hub import hf_hub_download
+from huggingface_hub import snapshot_download
+
+from src.prefix_cache import PrefixCache
+from src.sessions import SessionStore
+from src.response_cache import ResponseCache
+from src.shared_weights import SharedWeights
+from src.audio import AudioPreprocessor
+from src.tokenization import TokenizerService, IncrementalDetokenizer
+from src.profiling import PROFILER, profiled
+from src.quantization import load_model_config, resolve_mode, quantize_model
+from src.compilation import CompiledGeneration
+from src.speculative import SpeculativeDecoder
+from src.cancellation import CancelToken, CancelCriteria, cancelled_result
+from src.memory import MemoryGovernor, MemoryBudgetError, rejected_result
+from src.metrics import GenerationTimer, ERRORS
 
 logger = logging.getLogger(__name__)
 
 
+class _TimedTextStreamer(BaseStreamer):
+    """Streamer yielding the text of each generated token as it arrives
+
+    Text is decoded incrementally (see IncrementalDetokenizer) and handed
+    to the iterating consumer; the prompt, which generate puts first, is
+    skipped. Arrival times are recorded too: each put is usually one
+    token, but speculative decoding delivers every accepted run of tokens
+    at once, so the count per put is kept as well.
+    """
+
+    def __init__(self, decoder, skip_special_tokens: bool = True):
+        self.detokenizer = IncrementalDetokenizer(decoder, skip_special_tokens)
+        self.token_times: List[float] = []
+        self.token_counts: List[int] = []
+        self._prompt_pending = True
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+
+    def put(self, value):
+        if value.dim() > 1:
+            if value.shape[0] > 1:
+                raise ValueError("Streaming supports a single sequence only")
+            value = value[0]
+        if self._prompt_pending:
+            self._prompt_pending = False
+            return
+        self.token_times.append(time.perf_counter())
+        self.token_counts.append(value.numel())
+        text = self.detokenizer.push(value.tolist())
+        if text:
+            self._queue.put(text)
+
+    def end(self):
+        text = self.detokenizer.flush()
+        if text:
+            self._queue.put(text)
+        self._queue.put(None)
+
+    def __iter__(self):
+        while True:
+            text = self._queue.get()
+            if text is None:
+                return
+            yield text
+
+
 class PersonaPlexModelHandler:
     """Handles PersonaPlex model loading and inference"""
     
-    def __init__(self, config_path: str = "config/config.yaml"):
-        """Initialize model handler with configuration"""
+    def __init__(self, config_path: str = "config/config.yaml", device: Optional[str] = None):
+        """Initialize model handler with configuration
+
+        device pins the handler to one device (used by replica pools);
+        by default the first of gpu.device_ids is used.
+        """
         # Ensure we have the full path to the config file, not just the directory
         if os.path.isdir(config_path):
             config_path = os.path.join(config_path, 'config.yaml')
+        self.config_path = config_path
         self.config = self._load_config(config_path)
         self.model = None
         self.tokenizer = None
         self.processor = None
-        self.device = self._setup_device()
+        self.device = torch.device(device) if device else self._setup_device()
+        # Before any weights load, so gpu.memory_fraction caps them too
+        self.memory = MemoryGovernor(self.config)
+        self.memory.configure(self.device)
+        self.prefix_cache = PrefixCache(self.config)
+        self.sessions = SessionStore(self.config, self.device)
+        self.response_cache = ResponseCache(self.config)
+        self.tokens = TokenizerService(self.config)
+        self.audio = AudioPreprocessor(self.config)
+        self.model_config = load_model_config(self.config, config_path)
+        self.quantization = resolve_mode(self.config, self.model_config)
+        self.quantization_info: Dict[str, Any] = {'mode': 'none'}
+        self.compiled = CompiledGeneration(self.config)
+        self.speculative = SpeculativeDecoder(self.config)
+        # Set once load_model (including compile warmup) has finished
+        self.ready = False
+        self.model_source: Optional[str] = None
+        self.startup_timings: Dict[str, float] = {}
+        # Bounds how many generate calls (batched, single or streaming) run
+        # on the model at the same time
+        self._generation_slots = threading.BoundedSemaphore(max(
+            int(self.config.get('performance', {}).get('max_concurrent_generations', 1)), 1
+        ))
         
     def _load_config(self, config_path: str) -> Dict[str, Any]:
         """Load configuration from YAML file"""
@@ -57,11 +155,20 @@ class PersonaPlexModelHandler:
             logger.warning("CUDA not available, using CPU")
             return torch.device("cpu")
     
+    @profiled('load_model', requests=0)
     def load_model(self):
-        """Load the PersonaPlex model"""
+        """Load the PersonaPlex model
+
+        Model files are resolved locally first (see _resolve_model_source);
+        once they are on disk the tokenizer, processor and weights load in
+        parallel without any network access. Per-phase timings are logged
+        and kept in startup_timings.
+        """
         try:
             model_name = self.config['model']['name']
-            model_path = self.config['model'].get('path', None)
+            load_start = time.perf_counter()
+            self.startup_timings = {}
+            self.ready = False
             
             logger.info(f"Loading model: {model_name}")
             
@@ -74,199 +181,888 @@ class PersonaPlexModelHandler:
             else:
                 dtype = torch.float32
             
-            # Load tokenizer and processor
-            logger.info("Loading tokenizer and processor...")
+            with self._timed_phase('resolve'):
+                self.model_source = self._resolve_model_source(model_name)
+                if self.speculative.enabled:
+                    draft_source = self._resolve_model_source(self.speculative.draft_name)
             
-            # Ensure sentencepiece is installed
-            try:
-                import sentencepiece as spm
-                logger.info("sentencepiece is available")
-            except ImportError:
-                logger.warning("sentencepiece not found, installing...")
-                subprocess.check_call([sys.executable, "-m", "pip", "install", "--quiet", "sentencepiece", "tiktoken"])
-                import sentencepiece as spm
-                logger.info("sentencepiece and tiktoken installed")
+            # Tokenizer, processor and weights are independent; load them concurrently
+            logger.info("Loading tokenizer, processor and weights...")
+            with ThreadPoolExecutor(max_workers=3, thread_name_prefix="load") as pool:
+                tokenizer_future = pool.submit(self._timed_call, 'tokenizer', self._load_tokenizer)
+                processor_future = pool.submit(self._timed_call, 'processor', self._load_processor)
+                weights_future = pool.submit(self._timed_call, 'weights', self._load_weights, dtype)
+                self.tokenizer = tokenizer_future.result()
+                self.processor = processor_future.result()
+                self.model = weights_future.result()
             
-            # PersonaPlex uses a SentencePiece model file: tokenizer_spm_32k_3.model
-            # We need to load it directly using sentencepiece or create a tokenizer from it
-            tokenizer_loaded = False
-            last_error = None
+            with self._timed_phase('post_load'):
+                # Move to device if not using device_map
+                if not isinstance(self.model, torch.nn.Module):
+                    self.model = self.model.to(self.device)
+                
+                # Set to evaluation mode
+                self.model.eval()
+                
+                # Left padding so batched prompts end at the same position
+                self._prepare_tokenizer_for_batching()
+                self.tokens.attach(self.tokenizer)
             
-            # Strategy 1: Download SentencePiece model first, then load tokenizer
-            # PersonaPlex has tokenizer_spm_32k_3.model - we need to ensure it's downloaded
-            cache_dir = self.config.get('huggingface', {}).get('cache_dir')
-            try:
-                logger.info("Downloading SentencePiece model file (tokenizer_spm_32k_3.model)...")
-                spm_model_path = hf_hub_download(
-                    repo_id=model_name,
-                    filename="tokenizer_spm_32k_3.model",
-                    cache_dir=cache_dir,
-                    token=os.getenv('HF_TOKEN')
-                )
-                logger.info(f"Downloaded SentencePiece model to: {spm_model_path}")
-            except Exception as e_download:
-                logger.warning(f"Could not download SentencePiece model: {e_download}")
-                spm_model_path = None
+            if self.speculative.enabled:
+                with self._timed_phase('draft'):
+                    self.speculative.load(draft_source, self.model, dtype, self.device)
             
-            # Strategy 1: Try loading tokenizer normally (transformers should auto-detect SPM file)
-            try:
-                logger.info("Attempting to load tokenizer (transformers should auto-detect SentencePiece model)...")
-                self.tokenizer = AutoTokenizer.from_pretrained(
-                    model_name,
-                    cache_dir=cache_dir,
-                    trust_remote_code=True,
-                    local_files_only=False
-                )
-                tokenizer_loaded = True
-                logger.info("Tokenizer loaded successfully with auto-detection")
-            except Exception as e1:
-                last_error = e1
-                logger.warning(f"Strategy 1 (auto-detect) failed: {e1}")
+            # Before prefix prefill, so cached KV state matches the served weights
+            if self.quantization != 'none':
+                with self._timed_phase('quantize'):
+                    self._quantize()
             
-            # Strategy 2: Try with use_fast=False (force slow tokenizer)
-            if not tokenizer_loaded:
-                try:
-                    logger.info("Attempting to load tokenizer with use_fast=False...")
-                    self.tokenizer = AutoTokenizer.from_pretrained(
-                        model_name,
-                        cache_dir=cache_dir,
-                        trust_remote_code=True,
-                        use_fast=False,
-                        local_files_only=False
-                    )
-                    tokenizer_loaded = True
-                    logger.info("Tokenizer loaded successfully with use_fast=False")
-                except Exception as e2:
-                    last_error = e2
-                    logger.warning(f"Strategy 2 (use_fast=False) failed: {e2}")
+            # Prefill configured persona/system prompts into the prefix cache
+            if self.prefix_cache.enabled:
+                with self._timed_phase('prefix_cache'):
+                    for prefix_text in self.config['performance'].get('prefix_cache', {}).get('prefixes') or []:
+                        self.register_prefix(prefix_text)
             
-            # Strategy 3: Try with local_files_only=True (use already downloaded files)
-            if not tokenizer_loaded and spm_model_path:
+            # Compile and warm up every length bucket before reporting healthy
+            if self.compiled.enabled:
+                if self.prefix_cache.enabled:
+                    logger.warning("Prefix cache only applies to prompts longer than the largest compile bucket")
                 try:
-                    logger.info("Attempting to load tokenizer from cached files...")
-                    self.tokenizer = AutoTokenizer.from_pretrained(
-                        model_name,
-                        cache_dir=cache_dir,
-                        trust_remote_code=True,
-                        local_files_only=True
-                    )
-                    tokenizer_loaded = True
-                    logger.info("Tokenizer loaded successfully from cached files")
-                except Exception as e3:
-                    last_error = e3
-                    logger.warning(f"Strategy 3 (cached files) failed: {e3}")
+                    with self._timed_phase('compile'):
+                        logger.info("Compiling model...")
+                        self.compiled.compile(self.model)
+                    with self._timed_phase('warmup'):
+                        self.compiled.warmup(
+                            self.tokenizer.pad_token_id,
+                            self.config.get('performance', {}).get('max_concurrent_generations', 1)
+                        )
+                except Exception as e:
+                    logger.warning(f"Model compilation failed, serving uncompiled: {e}")
+                    self.compiled.disable()
             
-            if not tokenizer_loaded:
-                error_msg = (
-                    f"All tokenizer loading strategies failed. Last error: {last_error}\n"
-                    f"PersonaPlex uses tokenizer_spm_32k_3.model (SentencePiece).\n"
-                    f"Please ensure:\n"
-                    f"1. HuggingFace token is set (HF_TOKEN environment variable)\n"
-                    f"2. Model files are downloaded correctly\n"
-                    f"3. SentencePiece is properly installed"
-                )
-                logger.error(error_msg)
-                raise RuntimeError(error_msg)
+            # Last, so the baseline includes prefilled prefixes and static caches
+            with self._timed_phase('memory'):
+                self.memory.attach(self.model, self.speculative.draft, self._cache_bytes)
             
+            self.ready = True
+            self.startup_timings['total'] = (time.perf_counter() - load_start) * 1000
+            breakdown = ", ".join(f"{phase}={ms:.0f}ms" for phase, ms in self.startup_timings.items())
+            logger.info(f"Model loaded successfully ({breakdown})")
+            
+        except Exception as e:
+            logger.error(f"Failed to load model: {e}")
+            raise
+    
+    def _resolve_model_source(self, model_name: str) -> str:
+        """Find a local directory holding the model files
+
+        Tries, in order: model.name as a local path, the local manifest
+        (model.manifest, default <model.path>/manifest.json), and the
+        HuggingFace cache with local_files_only. Only if all of these miss
+        and offline mode is off (model.offline / HF_HUB_OFFLINE) are the
+        files downloaded, after which the manifest is updated so the next
+        start needs no network.
+        """
+        if os.path.isdir(model_name):
+            return model_name
+        
+        manifest_path = self._manifest_path()
+        if manifest_path and os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, 'r') as f:
+                    entry = json.load(f).get('models', {}).get(model_name)
+                if entry and os.path.isfile(os.path.join(entry['path'], 'config.json')):
+                    logger.info(f"Resolved {model_name} from manifest: {entry['path']}")
+                    return entry['path']
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable manifest {manifest_path}: {e}")
+        
+        cache_dir = self.config.get('huggingface', {}).get('cache_dir')
+        try:
+            local_path = snapshot_download(
+                repo_id=model_name, cache_dir=cache_dir, local_files_only=True
+            )
+            logger.info(f"Resolved {model_name} from local HuggingFace cache: {local_path}")
+        except Exception as e:
+            offline = self.config['model'].get('offline', False) or os.getenv('HF_HUB_OFFLINE') == '1'
+            if offline:
+                raise RuntimeError(
+                    f"Model {model_name} is not available locally and offline mode is on. "
+                    f"Download it first with scripts/download_model.py ({e})"
+                )
+            logger.info(f"{model_name} not found locally, downloading...")
+            local_path = snapshot_download(
+                repo_id=model_name, cache_dir=cache_dir, token=os.getenv('HF_TOKEN')
+            )
+        
+        self._write_manifest(model_name, local_path)
+        return local_path
+    
+    def _manifest_path(self) -> Optional[str]:
+        """Location of the local model manifest"""
+        manifest_path = self.config['model'].get('manifest')
+        if manifest_path:
+            return manifest_path
+        model_path = self.config['model'].get('path')
+        return os.path.join(model_path, 'manifest.json') if model_path else None
+    
+    def _write_manifest(self, model_name: str, local_path: str):
+        """Record where a model's files live so later starts skip resolution"""
+        manifest_path = self._manifest_path()
+        if not manifest_path:
+            return
+        try:
+            manifest = {'models': {}}
+            if os.path.exists(manifest_path):
+                with open(manifest_path, 'r') as f:
+                    manifest = json.load(f)
+            manifest.setdefault('models', {})[model_name] = {
+                'path': local_path,
+                'files': sorted(os.listdir(local_path)),
+                'resolved_at': time.time()
+            }
+            os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+            tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(tmp_path, manifest_path)
+        except Exception as e:
+            logger.warning(f"Could not write model manifest {manifest_path}: {e}")
+    
+    def _load_tokenizer(self):
+        """Load the tokenizer from the resolved local files
+
+        PersonaPlex ships a SentencePiece model (tokenizer_spm_32k_3.model);
+        the fast tokenizer is tried first, then the slow SentencePiece one.
+        Packages are never installed at runtime.
+        """
+        last_error = None
+        for use_fast in (True, False):
             try:
-                self.processor = AutoProcessor.from_pretrained(
-                    model_name,
-                    cache_dir=self.config.get('huggingface', {}).get('cache_dir'),
-                    trust_remote_code=True
+                tokenizer = AutoTokenizer.from_pretrained(
+                    self.model_source,
+                    trust_remote_code=True,
+                    use_fast=use_fast,
+                    local_files_only=True
                 )
+                logger.info(f"Tokenizer loaded (use_fast={use_fast})")
+                return tokenizer
             except Exception as e:
-                logger.warning(f"Processor not available: {e}")
-                self.processor = None
-            
-            # Load model
-            logger.info("Loading model...")
-            self.model = AutoModelForCausalLM.from_pretrained(
-                model_name,
-                torch_dtype=dtype,
-                device_map="auto",
-                cache_dir=self.config.get('huggingface', {}).get('cache_dir'),
-                trust_remote_code=True
+                last_error = e
+                logger.warning(f"Tokenizer load with use_fast={use_fast} failed: {e}")
+        
+        try:
+            import sentencepiece  # noqa: F401
+            hint = "Model files may be incomplete; re-run scripts/download_model.py"
+        except ImportError:
+            hint = "sentencepiece is not installed; add it to the image (see requirements.txt)"
+        error_msg = f"Failed to load tokenizer from {self.model_source}: {last_error}. {hint}"
+        logger.error(error_msg)
+        raise RuntimeError(error_msg)
+    
+    def _load_processor(self):
+        """Load the audio processor, if the model has one"""
+        try:
+            return AutoProcessor.from_pretrained(
+                self.model_source,
+                trust_remote_code=True,
+                local_files_only=True
             )
-            
-            # Move to device if not using device_map
-            if not isinstance(self.model, torch.nn.Module):
-                self.model = self.model.to(self.device)
-            
-            # Set to evaluation mode
-            self.model.eval()
-            
-            # Compile model if requested (PyTorch 2.0+)
-            if self.config.get('performance', {}).get('compile_model', False):
-                try:
-                    logger.info("Compiling model...")
-                    self.model = torch.compile(self.model)
-                except Exception as e:
-                    logger.warning(f"Model compilation failed: {e}")
-            
-            logger.info("Model loaded successfully")
-            
         except Exception as e:
-            logger.error(f"Failed to load model: {e}")
-            raise
+            logger.warning(f"Processor not available: {e}")
+            return None
+    
+    def _load_weights(self, dtype: torch.dtype):
+        """Load model weights from the resolved local files
+
+        With performance.shared_weights enabled on CPU, weights are mapped
+        from a shared safetensors file so uvicorn workers share one copy.
+        """
+        shared_weights = SharedWeights(self.config, self.model_source)
+        if shared_weights.enabled:
+            if self.device.type == 'cpu':
+                return shared_weights.load(
+                    dtype, lambda: self._load_pretrained(dtype, device_map=None)
+                )
+            logger.warning("Shared weights only apply to CPU serving; loading a private copy")
+        return self._load_pretrained(dtype)
+    
+    def _load_pretrained(self, dtype: torch.dtype, device_map: Any = "auto"):
+        """Load model weights with from_pretrained
+
+        With several gpu.device_ids each replica holds a full copy, so the
+        model is placed on this handler's device instead of sharded.
+        """
+        if device_map == "auto" and len(self.config.get('gpu', {}).get('device_ids', [0])) > 1:
+            device_map = {'': str(self.device)}
+        return AutoModelForCausalLM.from_pretrained(
+            self.model_source,
+            torch_dtype=dtype,
+            device_map=device_map,
+            trust_remote_code=True,
+            local_files_only=True
+        )
+    
+    def _quantize(self):
+        """Apply the configured quantization mode (CPU only)"""
+        if self.device.type != 'cpu':
+            logger.warning(f"{self.quantization} quantization only applies to CPU serving; using {self.device} weights as loaded")
+            return
+        model_config = self.config['model']
+        self.quantization_info = quantize_model(
+            self.model, self.quantization,
+            group_size=int(model_config.get('quantization_group_size', 128)),
+            skip=model_config.get('quantization_skip', ['lm_head']) or []
+        )
+    
+    @contextmanager
+    def _timed_phase(self, phase: str):
+        """Record the wall time of a startup phase in startup_timings"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_timings[phase] = (time.perf_counter() - start) * 1000
     
+    def _timed_call(self, phase: str, fn, *args):
+        """Call fn, recording its wall time as a startup phase"""
+        with self._timed_phase(phase):
+            return fn(*args)
+    
+    @profiled('generate')
     def generate(self, 
                  input_text: Optional[str] = None,
                  input_audio: Optional[Any] = None,
+                 cancel: Optional[CancelToken] = None,
+                 input_ids: Optional[Any] = None,
+                 return_ids: bool = False,
                  **kwargs) -> Dict[str, Any]:
-        """Generate response from model"""
+        """Generate response from model
+
+        input_audio is either float32 samples at audio.sample_rate or raw
+        upload bytes, which go through the audio ingestion stage first.
+        input_ids is an already tokenized text prompt (a sequence of token
+        IDs), which skips the tokenizer. With return_ids the result carries
+        the generated token IDs as 'output_ids' instead of decoded text.
+        Generation stops between decode steps once cancel is set, returning
+        a result with 'cancelled' set to its reason.
+        """
         if self.model is None:
             raise RuntimeError("Model not loaded. Call load_model() first.")
         
         try:
+            # Token prompts take the text path (prefix cache, buckets, draft model)
+            text = bool(input_text) or input_ids is not None
+            timer = GenerationTimer('text' if text else 'audio')
             # Prepare inputs
             if input_text:
-                inputs = self.tokenizer(input_text, return_tensors="pt")
-            elif input_audio and self.processor:
-                inputs = self.processor(input_audio, return_tensors="pt")
+                inputs = self.tokens.to_inputs([self.tokens.encode(input_text)])
+            elif input_ids is not None:
+                ids = torch.tensor(input_ids, dtype=torch.long).reshape(1, -1)
+                inputs = {'input_ids': ids, 'attention_mask': torch.ones_like(ids)}
+            elif input_audio is not None and self.processor:
+                if isinstance(input_audio, (bytes, bytearray, memoryview)):
+                    input_audio = self.audio.process(input_audio)
+                inputs = self.processor(
+                    input_audio, sampling_rate=self.audio.sample_rate, return_tensors="pt"
+                )
             else:
                 raise ValueError("Either input_text or input_audio must be provided")
             
             # Move inputs to device
             inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            timer.tokenized()
             
             # Get generation parameters from config
-            generation_config = {
-                'max_length': self.config['model'].get('max_length', 2048),
-                'temperature': self.config['model'].get('temperature', 0.7),
-                'top_p': self.config['model'].get('top_p', 0.9),
-                'top_k': self.config['model'].get('top_k', 50),
-                **kwargs
+            generation_config = self._get_generation_config(**kwargs)
+            seed = generation_config.pop('seed', None)
+            
+            # Resume from a cached prompt prefix so only the suffix is prefilled
+            if text and not self._bucketed(inputs):
+                generation_config.update(self._get_prefix_state(inputs))
+
+            # Generate once the memory budget has room for this request
+            prompt_tokens = inputs['input_ids'].shape[1] if 'input_ids' in inputs else 0
+            reservation = self.memory.estimate(
+                prompt_tokens, self._new_token_budget(generation_config, prompt_tokens)
+            )
+            speculate = self._can_speculate(text, inputs, generation_config)
+            with self.memory.reserve(reservation, cancel), self._generation_slots:
+                if cancel is not None and cancel.is_set():
+                    # Client went away or the deadline passed while queued
+                    cancel.record('queued')
+                    return cancelled_result(cancel)
+                with torch.no_grad(), \
+                        self._compiled_inputs(text, inputs, generation_config) as (padded, generation_config), \
+                        self.speculative.run(speculate) as speculation:
+                    timer.generating()
+                    self._apply_seed(seed)
+                    padded_tokens = padded['input_ids'].shape[1] if 'input_ids' in padded else 0
+                    criteria = self._stopping_criteria(timer, [cancel], padded_tokens)
+                    outputs = self.model.generate(
+                        **padded,
+                        stopping_criteria=StoppingCriteriaList(criteria),
+                        **generation_config,
+                        **speculation.kwargs
+                    )
+                    speculation.tokens = outputs.shape[1] - padded_tokens if speculate else 0
+            timer.generated()
+            
+            if cancel is not None and criteria[-1].cancelled():
+                timer.finish(prompt_tokens, outputs.shape[1] - padded_tokens)
+                criteria[-1].record([self._new_token_budget(generation_config, padded_tokens)])
+                return cancelled_result(cancel)
+
+            if return_ids:
+                timer.finish(prompt_tokens, outputs.shape[1] - padded_tokens)
+                return {
+                    'output_ids': outputs[0, padded_tokens:].tolist(),
+                    'success': True
+                }
+
+            # Decode output
+            if text:
+                output_text = self.tokens.decode(outputs[0])
+            else:
+                output_text = self.processor.decode(outputs[0], skip_special_tokens=True)
+            timer.finish(prompt_tokens, outputs.shape[1] - padded_tokens)
+            
+            return {
+                'output': output_text,
+                'success': True
             }
             
-            # Generate
-            with torch.no_grad():
+        except MemoryBudgetError as e:
+            logger.warning(f"Generation not admitted: {e}")
+            return rejected_result(e)
+        except Exception as e:
+            logger.error(f"Generation failed: {e}")
+            ERRORS.inc(type=type(e).__name__)
+            return {
+                'output': None,
+                'success': False,
+                'error': str(e)
+            }
+    
+    @profiled('generate_batch', requests=lambda self, input_texts, *args, **kwargs: len(input_texts))
+    def generate_batch(self,
+                       input_texts: List[str],
+                       max_lengths: Optional[List[Optional[int]]] = None,
+                       cancel_tokens: Optional[List[Optional[CancelToken]]] = None,
+                       **kwargs) -> List[Dict[str, Any]]:
+        """Generate responses for several text prompts in one forward pass
+
+        Prompts are left-padded together. Sampling kwargs are shared by the
+        whole batch, while max_lengths and cancel_tokens apply per prompt:
+        a cancelled row stops and the batch ends once every row has
+        finished or been cancelled.
+        """
+        if self.model is None:
+            raise RuntimeError("Model not loaded. Call load_model() first.")
+
+        try:
+            if not input_texts:
+                raise ValueError("input_texts must not be empty")
+            if max_lengths is None:
+                max_lengths = [None] * len(input_texts)
+            if cancel_tokens is None:
+                cancel_tokens = [None] * len(input_texts)
+            if len(input_texts) == 1 and (self.prefix_cache.enabled or self.speculative.active):
+                # Unpadded single prompts can reuse the prefix cache and
+                # decode speculatively
+                if max_lengths[0] is not None:
+                    kwargs['max_length'] = max_lengths[0]
+                return [self.generate(input_text=input_texts[0], cancel=cancel_tokens[0], **kwargs)]
+
+            timer = GenerationTimer('batch')
+            inputs = self.tokens.to_inputs(self.tokens.encode_batch(input_texts), self.device)
+            timer.tokenized()
+
+            generation_config = self._get_generation_config(**kwargs)
+            default_max_length = generation_config.pop('max_length')
+            generation_config.pop('max_new_tokens', None)
+
+            # Each prompt keeps its own token budget: max_length counts the
+            # prompt, so the padded batch runs for the largest remaining budget
+            # and every row is truncated back to its own afterwards
+            prompt_lengths = inputs['attention_mask'].sum(dim=1).tolist()
+            budgets = [
+                max((default_max_length if max_length is None else max_length) - prompt_length, 0)
+                for max_length, prompt_length in zip(max_lengths, prompt_lengths)
+            ]
+            generation_config['max_new_tokens'] = max(max(budgets), 1)
+
+            # Clamp the batch to the rows the memory budget has room for now;
+            # one long prompt pads every row, so rows that never fit
+            # together run one at a time
+            row_bytes = self.memory.estimate(inputs['input_ids'].shape[1], generation_config['max_new_tokens'])
+            rows = self.memory.rows_that_fit(row_bytes, len(input_texts))
+            if len(input_texts) > 1 and rows < len(input_texts):
+                size = max(rows, 1)
+                results = []
+                for start in range(0, len(input_texts), size):
+                    end = start + size
+                    results.extend(self.generate_batch(
+                        input_texts[start:end], max_lengths[start:end], cancel_tokens[start:end], **kwargs
+                    ))
+                return results
+
+            with self.memory.reserve(row_bytes * len(input_texts)), self._generation_slots, torch.no_grad(), \
+                    self._compiled_inputs(True, inputs, generation_config) as (inputs, generation_config):
+                # Bucketing may pad the batch further
+                padded_length = inputs['input_ids'].shape[1]
+                timer.generating()
+                criteria = self._stopping_criteria(timer, cancel_tokens, padded_length, budgets)
                 outputs = self.model.generate(
                     **inputs,
+                    stopping_criteria=StoppingCriteriaList(criteria),
                     **generation_config
                 )
+            timer.generated()
+
+            cancel_criteria = criteria[-1]
+            cancel_criteria.record(budgets)
+            finished = [index for index in range(len(input_texts)) if not cancel_criteria.cancelled(index)]
+            texts = self.tokens.decode_batch(
+                [outputs[index][:padded_length + budgets[index]] for index in finished]
+            ) if finished else []
+            decoded = dict(zip(finished, texts))
+            results = []
+            for index in range(len(input_texts)):
+                if index not in decoded:
+                    results.append(cancelled_result(cancel_tokens[index]))
+                    continue
+                results.append({
+                    'output': decoded[index],
+                    'success': True
+                })
+            generated = outputs.shape[1] - padded_length
+            timer.finish(
+                sum(prompt_lengths),
+                sum(
+                    min(budget, generated if stopped_at is None else stopped_at)
+                    for budget, stopped_at in zip(budgets, cancel_criteria.stopped_at)
+                )
+            )
+            return results
+
+        except MemoryBudgetError as e:
+            logger.warning(f"Batched generation not admitted: {e}")
+            return [rejected_result(e) for _ in input_texts]
+        except Exception as e:
+            logger.error(f"Batched generation failed: {e}")
+            ERRORS.inc(type=type(e).__name__)
+            return [
+                {
+                    'output': None,
+                    'success': False,
+                    'error': str(e)
+                }
+                for _ in input_texts
+            ]
+
+    def generate_stream(self,
+                        input_text: Optional[str] = None,
+                        stop_event: Optional[threading.Event] = None,
+                        input_audio: Optional[Any] = None,
+                        **kwargs) -> Iterator[Dict[str, Any]]:
+        """Generate a response, yielding decoded text as tokens are produced
+
+        Yields {'text': ...} events for each decoded chunk followed by a final
+        {'done': True, ...} event with time-to-first-token and inter-token
+        latency. Setting stop_event (or closing the iterator) ends generation
+        early; a CancelToken stop_event also ends it at its deadline, and the
+        final event then carries 'cancelled' with its reason. input_audio
+        takes the same forms as in generate().
+        """
+        if self.model is None:
+            raise RuntimeError("Model not loaded. Call load_model() first.")
+
+        stop_event = stop_event or threading.Event()
+        if input_text:
+            timer = GenerationTimer('stream')
+            inputs = self.tokens.to_inputs([self.tokens.encode(input_text)])
+            decoder = self.tokenizer
+        elif input_audio is not None and self.processor:
+            timer = GenerationTimer('audio_stream')
+            if isinstance(input_audio, (bytes, bytearray, memoryview)):
+                input_audio = self.audio.process(input_audio)
+            inputs = self.processor(
+                input_audio, sampling_rate=self.audio.sample_rate, return_tensors="pt"
+            )
+            decoder = self.processor
+        else:
+            raise ValueError("Either input_text or input_audio must be provided")
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        timer.tokenized()
+
+        streamer = _TimedTextStreamer(decoder, skip_special_tokens=True)
+        generation_config = self._get_generation_config(**kwargs)
+        seed = generation_config.pop('seed', None)
+        if input_text and not self._bucketed(inputs):
+            generation_config.update(self._get_prefix_state(inputs))
+        speculate = self._can_speculate(input_text, inputs, generation_config)
+        prompt_tokens = inputs['input_ids'].shape[1] if 'input_ids' in inputs else 0
+        reservation = self.memory.estimate(prompt_tokens, self._new_token_budget(generation_config, prompt_tokens))
+        compiled_inputs = self._compiled_inputs(input_text, inputs, generation_config)
+        errors: List[Exception] = []
+        # Set by the generation thread: its CancelCriteria and token budget
+        cancellation: Dict[str, Any] = {}
+
+        def _run():
+            try:
+                with PROFILER.capture('generate_stream'), \
+                        self.memory.reserve(reservation, stop_event), self._generation_slots:
+                    if stop_event.is_set():
+                        # Consumer went away while we waited for a free slot
+                        if isinstance(stop_event, CancelToken):
+                            stop_event.record('queued')
+                        streamer.end()
+                        return
+                    with torch.no_grad(), compiled_inputs as (padded, padded_config), \
+                            self.speculative.run(speculate) as speculation:
+                        timer.generating()
+                        self._apply_seed(seed)
+                        padded_tokens = padded['input_ids'].shape[1] if 'input_ids' in padded else 0
+                        criteria = self._stopping_criteria(timer, [stop_event], padded_tokens)
+                        cancellation.update(
+                            criteria=criteria[-1], budget=self._new_token_budget(padded_config, padded_tokens)
+                        )
+                        outputs = self.model.generate(
+                            **padded,
+                            streamer=streamer,
+                            stopping_criteria=StoppingCriteriaList(criteria),
+                            **padded_config,
+                            **speculation.kwargs
+                        )
+                        speculation.tokens = outputs.shape[1] - padded_tokens if speculate else 0
+                timer.generated()
+            except Exception as e:
+                errors.append(e)
+                # Unblock the consumer if generate failed before finishing
+                streamer.end()
+
+        start = time.perf_counter()
+        thread = threading.Thread(target=_run, name="generate-stream", daemon=True)
+        thread.start()
+
+        try:
+            for text in streamer:
+                if text:
+                    yield {'text': text}
+        finally:
+            # Runs on normal completion and when the consumer closes us early
+            stop_event.set()
+            thread.join()
+            if cancellation:
+                cancellation['criteria'].record([cancellation['budget']])
+
+        if errors:
+            logger.error(f"Streaming generation failed: {errors[0]}")
+            ERRORS.inc(type=type(errors[0]).__name__)
+            raise errors[0]
+
+        token_times = streamer.token_times
+        tokens = sum(streamer.token_counts)
+        # Text is decoded incrementally while streaming, so detokenize time
+        # is folded into decode here
+        timer.finish(prompt_tokens, tokens)
+        later_tokens = tokens - streamer.token_counts[0] if token_times else 0
+        done = {
+            'done': True,
+            'tokens': tokens,
+            'ttft_ms': (token_times[0] - start) * 1000 if token_times else None,
+            'mean_itl_ms': (token_times[-1] - token_times[0]) / later_tokens * 1000 if later_tokens else None,
+            'total_ms': (time.perf_counter() - start) * 1000
+        }
+        reason = getattr(stop_event, 'reason', None)
+        if reason and (not cancellation or cancellation['criteria'].cancelled()):
+            done['cancelled'] = reason
+        yield done
+
+    @profiled('generate_turn')
+    def generate_turn(self,
+                      session_id: str,
+                      input_text: str,
+                      cancel: Optional[CancelToken] = None,
+                      **kwargs) -> Dict[str, Any]:
+        """Generate the next turn of a stateful conversation
+
+        The session's token history and KV cache are kept server-side, so
+        only the new turn is prefilled. max_length applies to this turn
+        (its prompt plus the reply) rather than to the whole history. A
+        turn stopped by cancel is not added to the session.
+        """
+        if self.model is None:
+            raise RuntimeError("Model not loaded. Call load_model() first.")
+        if not self.sessions.enabled:
+            raise RuntimeError("Sessions are disabled")
+        
+        session = self.sessions.acquire(session_id)
+        token_ids = None
+        past_key_values = None
+        saved = 0
+        try:
+            if not input_text:
+                raise ValueError("input_text must be provided")
             
-            # Decode output
-            if input_text:
-                output_text = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+            # Only the first turn starts with special tokens (e.g. BOS)
+            timer = GenerationTimer('session')
+            new_ids = self.tokens.encode(input_text, add_special_tokens=not session.token_ids)
+            timer.tokenized()
+            history_ids = session.token_ids + new_ids
+            input_ids = torch.tensor([history_ids], device=self.device)
+            inputs = {
+                'input_ids': input_ids,
+                'attention_mask': torch.ones_like(input_ids)
+            }
+            
+            generation_config = self._get_generation_config(**kwargs)
+            seed = generation_config.pop('seed', None)
+            max_length = generation_config.pop('max_length')
+            generation_config['max_new_tokens'] = max(max_length - len(new_ids), 1)
+            if session.past_key_values is not None:
+                saved = session.cached_tokens
+                generation_config['past_key_values'] = session.past_key_values
             else:
-                output_text = self.processor.decode(outputs[0], skip_special_tokens=True)
+                generation_config.update(self._get_prefix_state(inputs))
+            # A resident session cache is already part of the baseline
+            reservation = self.memory.estimate(
+                len(new_ids) if saved else len(history_ids), generation_config['max_new_tokens']
+            )
             
+            with self.memory.reserve(reservation, cancel), self._generation_slots:
+                if cancel is not None and cancel.is_set():
+                    cancel.record('queued')
+                    return {**cancelled_result(cancel), 'session_id': session_id}
+                with torch.no_grad():
+                    timer.generating()
+                    self._apply_seed(seed)
+                    criteria = self._stopping_criteria(timer, [cancel], input_ids.shape[1])
+                    outputs = self.model.generate(
+                        **inputs,
+                        return_dict_in_generate=True,
+                        stopping_criteria=StoppingCriteriaList(criteria),
+                        **generation_config
+                    )
+            timer.generated()
+            
+            if cancel is not None and criteria[-1].cancelled():
+                timer.finish(len(new_ids), outputs.sequences.shape[1] - len(history_ids))
+                criteria[-1].record([generation_config['max_new_tokens']])
+                # generate extended the session's cache in place; re-prefill next turn
+                session.past_key_values = None
+                session.nbytes = 0
+                return {**cancelled_result(cancel), 'session_id': session_id}
+
+            token_ids = outputs.sequences[0].tolist()
+            past_key_values = outputs.past_key_values
+            output_text = self.tokens.decode(token_ids[len(session.token_ids):])
+            timer.finish(len(new_ids), len(token_ids) - len(history_ids))
             return {
                 'output': output_text,
+                'session_id': session_id,
                 'success': True
             }
             
+        except MemoryBudgetError as e:
+            logger.warning(f"Session generation not admitted: {e}")
+            return {**rejected_result(e), 'session_id': session_id}
         except Exception as e:
-            logger.error(f"Generation failed: {e}")
+            logger.error(f"Session generation failed: {e}")
+            ERRORS.inc(type=type(e).__name__)
+            # The cache may be partially extended; fall back to re-prefilling
+            session.past_key_values = None
+            session.nbytes = 0
             return {
                 'output': None,
+                'session_id': session_id,
                 'success': False,
                 'error': str(e)
             }
-    
+        finally:
+            self.sessions.release(session, token_ids, past_key_values, saved)
+
+    def register_prefix(self, prefix_text: str) -> Dict[str, Any]:
+        """Prefill a shared prompt prefix (e.g. a persona preamble) into the prefix cache"""
+        if self.model is None:
+            raise RuntimeError("Model not loaded. Call load_model() first.")
+        if not self.prefix_cache.enabled:
+            raise RuntimeError("Prefix cache is disabled")
+        
+        token_ids = self.tokens.encode(prefix_text)
+        cached = self._cache_prefix(token_ids)
+        return {
+            'tokens': len(token_ids),
+            'cached': cached
+        }
+
+    def _cache_prefix(self, token_ids: List[int]) -> bool:
+        """Run prefill over token_ids and store the resulting KV cache"""
+        input_ids = torch.tensor([token_ids], device=self.device)
+        with self._generation_slots, torch.no_grad():
+            outputs = self.model(input_ids=input_ids, use_cache=True)
+        return self.prefix_cache.put(token_ids, outputs.past_key_values)
+
+    def _get_prefix_state(self, inputs: Dict[str, torch.Tensor]) -> Dict[str, Any]:
+        """Return generate kwargs that resume from a cached prefix, if any
+
+        On a miss the prompt is recorded for automatic prefix detection; a
+        prefix that has become common is prefilled and cached so that later
+        requests can reuse it.
+        """
+        if not self.prefix_cache.enabled or inputs['input_ids'].shape[0] != 1:
+            return {}
+        
+        token_ids = inputs['input_ids'][0].tolist()
+        hit = self.prefix_cache.lookup(token_ids)
+        if hit is not None:
+            return {'past_key_values': hit[1]}
+        
+        prefix_length = self.prefix_cache.observe(token_ids)
+        if prefix_length is not None:
+            self._cache_prefix(token_ids[:prefix_length])
+        return {}
+
+    def _stopping_criteria(self, timer: GenerationTimer, cancel_tokens: List[Optional[threading.Event]],
+                           prompt_length: int, budgets: Optional[List[int]] = None) -> List[StoppingCriteria]:
+        """Stopping criteria for one generate call, ending with a CancelCriteria when needed"""
+        criteria = [timer.criteria]
+        if budgets is not None or any(token is not None for token in cancel_tokens):
+            criteria.append(CancelCriteria(cancel_tokens, prompt_length, budgets))
+        return criteria
+
+    @staticmethod
+    def _new_token_budget(generation_config: Dict[str, Any], prompt_length: int) -> int:
+        """New tokens a generate call with generation_config may produce"""
+        if 'max_new_tokens' in generation_config:
+            return generation_config['max_new_tokens']
+        return max(generation_config.get('max_length', 0) - prompt_length, 0)
+
+    def _cache_bytes(self) -> int:
+        """Bytes held by the prefix cache and session KV caches in the model's memory"""
+        sessions = self.sessions.get_stats()
+        total = self.prefix_cache.get_stats().get('memory_bytes', 0) + sessions['device_memory_bytes']
+        if self.device.type == 'cpu':
+            # Offloaded caches live in host memory, which is the CPU budget too
+            total += sessions['host_memory_bytes']
+        return total
+
+    def _bucketed(self, inputs: Dict[str, torch.Tensor]) -> bool:
+        """Whether a text prompt will run through a compiled length bucket"""
+        return self.compiled.active and self.compiled.bucket_for(inputs['input_ids'].shape[1]) is not None
+
+    def _can_speculate(self, text: Any, inputs: Dict[str, torch.Tensor], generation_config: Dict[str, Any]) -> bool:
+        """Whether a generation may use the draft model
+
+        Assisted decoding handles one text prompt without a pre-filled KV
+        cache (prefix cache hits and compiled buckets bring their own).
+        """
+        return (
+            bool(text) and self.speculative.active and inputs['input_ids'].shape[0] == 1
+            and 'past_key_values' not in generation_config and not self._bucketed(inputs)
+        )
+
+    def _compiled_inputs(self, text: Any, inputs: Dict[str, torch.Tensor], generation_config: Dict[str, Any]):
+        """Context yielding the (inputs, generation_config) to generate with
+
+        Text prompts are padded to their compile bucket (see
+        CompiledGeneration.prepare); audio inputs and uncompiled models pass
+        through unchanged.
+        """
+        if not text or not self.compiled.active:
+            return nullcontext((inputs, generation_config))
+        return self.compiled.prepare(inputs, generation_config, self.tokenizer.pad_token_id)
+
+    def response_cache_key(self, input_text: str, **kwargs) -> Optional[str]:
+        """Response cache key for a text request, or None if it is not cacheable
+
+        Only deterministic requests are cacheable: greedy decoding, or
+        sampling with a fixed seed.
+        """
+        if not self.response_cache.enabled:
+            return None
+        
+        generation_config = self._get_generation_config(**kwargs)
+        default_do_sample = getattr(getattr(self.model, 'generation_config', None), 'do_sample', False)
+        generation_config['do_sample'] = bool(generation_config.get('do_sample', default_do_sample))
+        if generation_config['do_sample'] and generation_config.get('seed') is None:
+            self.response_cache.record_uncacheable()
+            return None
+        
+        return self.response_cache.make_key(
+            input_text,
+            self.config['model']['name'],
+            self.config['model'].get('dtype', 'float16'),
+            generation_config,
+            self._quantization_key()
+        )
+
+    def _quantization_key(self) -> Dict[str, Any]:
+        """Quantization settings the served weights were produced with"""
+        # quantization_info, not self.quantization: off CPU the mode is not applied
+        mode = self.quantization_info.get('mode', 'none')
+        if mode == 'none':
+            return {'mode': mode}
+        model_config = self.config['model']
+        key = {'mode': mode, 'skip': sorted(model_config.get('quantization_skip', ['lm_head']) or [])}
+        if mode == 'int4':
+            key['group_size'] = int(model_config.get('quantization_group_size', 128))
+        return key
+
+    def _apply_seed(self, seed: Optional[int]):
+        """Seed the RNGs for reproducible sampling
+
+        Must be called while holding a generation slot; seeded outputs are
+        only reproducible with max_concurrent_generations set to 1.
+        """
+        if seed is not None:
+            torch.manual_seed(seed)
+
+    def _get_generation_config(self, **kwargs) -> Dict[str, Any]:
+        """Merge per-request generation parameters over the config defaults"""
+        return {
+            'max_length': self.config['model'].get('max_length', 2048),
+            'temperature': self.config['model'].get('temperature', 0.7),
+            'top_p': self.config['model'].get('top_p', 0.9),
+            'top_k': self.config['model'].get('top_k', 50),
+            **kwargs
+        }
+
+    def _prepare_tokenizer_for_batching(self):
+        """Configure the tokenizer for left-padded batched generation"""
+        if self.tokenizer is None:
+            return
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.tokenizer.padding_side = 'left'
+
+    def unload(self):
+        """Drop the model, its caches and sessions so their memory can be freed
+
+        Generations already running keep their own references and finish.
+        """
+        self.ready = False
+        self.compiled.disable()
+        self.prefix_cache.clear()
+        self.sessions.clear()
+        self.speculative.draft = None
+        self.tokens.attach(None)
+        self.model = None
+        gc.collect()
+        if self.device.type == 'cuda':
+            torch.cuda.empty_cache()
+        logger.info(f"Unloaded model {self.config['model']['name']}")
+
+    def vocab_size(self) -> Optional[int]:
+        """Number of input embeddings, the bound on valid token IDs"""
+        if self.model is None:
+            return None
+        return self.model.get_input_embeddings().num_embeddings
+
     def is_loaded(self) -> bool:
-        """Check if model is loaded"""
-        return self.model is not None
+        """Check if model is loaded (and warmed up, when compiled)"""
+        return self.model is not None and self.ready
     
     def get_model_info(self) -> Dict[str, Any]:
         """Get model information"""
@@ -279,5 +1075,15 @@ class PersonaPlexModelHandler:
             'device': str(self.device),
             'dtype': self.config['model'].get('dtype', 'float16'),
             'cuda_available': torch.cuda.is_available(),
-            'cuda_device_count': torch.cuda.device_count() if torch.cuda.is_available() else 0
+            'cuda_device_count': torch.cuda.device_count() if torch.cuda.is_available() else 0,
+            'prefix_cache': self.prefix_cache.get_stats(),
+            'sessions': self.sessions.get_stats(),
+            'response_cache': self.response_cache.get_stats(),
+            'model_source': self.model_source,
+            'quantization': self.quantization_info,
+            'compile': self.compiled.get_stats(),
+            'speculative': self.speculative.get_stats(),
+            'tokenizer': self.tokens.get_stats(),
+            'memory': self.memory.get_stats(),
+            'startup_timings_ms': self.startup_timings
         }
@@ -0,0 +1,472 @@
+"""
+Model registry for PersonaPlex
+Loads models in the background, swaps them in once warmed up, drains the
+instances they replace and keeps a small LRU of resident models
+"""
+
+import os
+import time
+import shutil
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+import yaml
+
+from src.replicas import ReplicaPool
+from src.memory import MB
+from src.metrics import REGISTRY
+from src.profiling import PROFILER
+
+logger = logging.getLogger(__name__)
+
+MODEL_LOADS = REGISTRY.counter(
+    'personaplex_model_loads_total', 'Model loads by outcome (loaded or failed)', ['outcome']
+)
+MODEL_UNLOADS = REGISTRY.counter(
+    'personaplex_model_unloads_total', 'Models drained and unloaded, by reason', ['reason']
+)
+RESIDENT_MODELS = REGISTRY.gauge(
+    'personaplex_resident_models', 'Models loaded and accepting requests'
+)
+
+WEIGHT_SUFFIXES = ('.safetensors', '.bin', '.pt', '.pth')
+
+
+class ModelUnavailableError(Exception):
+    """Raised when the requested model exists but cannot take requests"""
+
+
+def model_name(config: Dict[str, Any]) -> str:
+    """Default registry name of a config's model: the last part of model.name"""
+    return Path(str(config['model']['name']).rstrip('/')).name
+
+
+def _weight_bytes_on_disk(config: Dict[str, Any]) -> int:
+    """Size of a local model directory's weight files, or 0 if it is not local"""
+    path = Path(str(config['model']['name']))
+    if not path.is_dir():
+        return 0
+    return sum(f.stat().st_size for f in path.rglob('*') if f.suffix in WEIGHT_SUFFIXES and f.is_file())
+
+
+def _model_bytes(handler) -> int:
+    """Bytes of the parameters and buffers of a handler's model and draft"""
+    total = 0
+    for model in (handler.model, handler.speculative.draft):
+        if model is None:
+            continue
+        for tensor in list(model.parameters()) + list(model.buffers()):
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class Deployment:
+    """One resident model: its handler, replica pool and requests in flight
+
+    state moves loading -> ready -> draining -> unloaded, or loading ->
+    failed. Requests hold a lease from acquire() for as long as they use
+    the handler, so a draining deployment is unloaded once the last one
+    is released (or the registry's drain_timeout passes).
+    """
+
+    def __init__(self, name: str, config_path: str, workdir: Optional[str] = None,
+                 make_default: bool = True):
+        """Initialize a deployment that has not loaded yet"""
+        self.name = name
+        self.config_path = config_path
+        self.workdir = workdir
+        self.make_default = make_default
+        with open(config_path, 'r') as f:
+            self.config = yaml.safe_load(f)
+        self.handler = None
+        self.pool: Optional[ReplicaPool] = None
+        self.state = 'loading'
+        self.error: Optional[str] = None
+        self.memory_bytes = 0
+        self.load_ms: Optional[float] = None
+        self.warmup_ms: Optional[float] = None
+        self.loaded_at: Optional[float] = None
+        self.last_used = time.monotonic()
+        self.active = 0
+        self.requests = 0
+        self._cond = threading.Condition()
+
+    def load(self, warmup_prompt: Optional[str] = None):
+        """Load the model, warm it up with one short generation and start its replicas"""
+        from src.model_handler import PersonaPlexModelHandler
+
+        start = time.perf_counter()
+        self.handler = PersonaPlexModelHandler(config_path=self.config_path)
+        self.handler.load_model()
+        if warmup_prompt:
+            warmup_start = time.perf_counter()
+            # Not a request: the nested generate is labelled but not counted
+            with PROFILER.capture('warmup', requests=0):
+                result = self.handler.generate(input_text=warmup_prompt, max_new_tokens=1, do_sample=False)
+            if not result['success']:
+                raise RuntimeError(f"Warmup generation failed: {result['error']}")
+            self.warmup_ms = (time.perf_counter() - warmup_start) * 1000
+        self.pool = ReplicaPool(self.handler)
+        self.pool.start()
+        self.memory_bytes = _model_bytes(self.handler)
+        self.load_ms = (time.perf_counter() - start) * 1000
+        self.loaded_at = time.time()
+
+    def acquire(self) -> Callable[..., None]:
+        """Count a request using this deployment
+
+        Returns an idempotent release function, which also works as a
+        future done-callback.
+        """
+        with self._cond:
+            self.active += 1
+            self.requests += 1
+            self.last_used = time.monotonic()
+
+        released = [False]
+
+        def release(*_):
+            with self._cond:
+                if released[0]:
+                    return
+                released[0] = True
+                self.active -= 1
+                self.last_used = time.monotonic()
+                self._cond.notify_all()
+
+        return release
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Wait until no request holds this deployment; False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.active == 0, timeout)
+
+    def stop(self):
+        """Stop the replicas and unload the model"""
+        if self.pool is not None:
+            self.pool.stop()
+        if self.handler is not None:
+            self.handler.unload()
+        self.pool = None
+        self.handler = None
+        self.state = 'unloaded'
+        self.cleanup()
+
+    def cleanup(self):
+        """Remove the generated config directory"""
+        if self.workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            self.workdir = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """State, load timings and traffic of this deployment"""
+        with self._cond:
+            stats = {
+                'name': self.name,
+                'state': self.state,
+                'model_name': self.config['model']['name'],
+                'dtype': self.config['model'].get('dtype', 'float16'),
+                'active_requests': self.active,
+                'requests': self.requests,
+                'idle_seconds': time.monotonic() - self.last_used
+            }
+        stats.update({
+            'memory_mb': self.memory_bytes / MB,
+            'load_ms': self.load_ms,
+            'warmup_ms': self.warmup_ms,
+            'loaded_at': self.loaded_at
+        })
+        if self.error:
+            stats['error'] = self.error
+        return stats
+
+
+class ModelRegistry:
+    """Resident models by name, with a default for requests naming none
+
+    The server config's model is loaded at startup. load() builds a
+    deployment from a modified copy of the config (or another config
+    file) and loads it in a background thread. Once it has loaded, warmed
+    up and started its replicas it is swapped in atomically: new requests
+    go to it, while requests holding the instance it replaces finish
+    there before that one is unloaded. Up to models.max_resident models
+    stay loaded and can be selected per request by name. Beyond that, or
+    when their weights would not fit the memory budget next to a model
+    being loaded, the least recently used ones are drained and unloaded.
+    The default model is never evicted.
+    """
+
+    def __init__(self, config_path: str):
+        """Initialize from the models section of the server config"""
+        self.config_path = config_path
+        with open(config_path, 'r') as f:
+            config = yaml.safe_load(f)
+        models_config = config.get('models', {}) or {}
+        self.max_resident = max(int(models_config.get('max_resident', 1)), 1)
+        self.drain_timeout = float(models_config.get('drain_timeout', 60))
+        self.warmup_prompt = models_config.get('warmup_prompt', "Hello")
+        self.memory_budget_mb = models_config.get('memory_budget_mb')
+        self.default_name = models_config.get('default_name') or model_name(config)
+
+        self.deployments: Dict[str, Deployment] = {}
+        self.default: Optional[Deployment] = None
+        self.loading: Optional[Deployment] = None
+        self.last_load: Optional[Deployment] = None
+        self.retiring: List[Deployment] = []
+        self._lock = threading.Lock()
+        self._stats = {'loads': 0, 'failed_loads': 0, 'swaps': 0, 'unloads': 0}
+
+    def start(self):
+        """Load the configured model as the default (blocking)"""
+        deployment = Deployment(self.default_name, self.config_path)
+        deployment.load()
+        self._install(deployment)
+
+    def stop(self):
+        """Unload every model"""
+        with self._lock:
+            deployments = list(self.deployments.values()) + self.retiring
+            self.deployments.clear()
+            self.retiring = []
+            self.default = None
+        for deployment in deployments:
+            deployment.stop()
+        RESIDENT_MODELS.set(0)
+
+    @property
+    def ready(self) -> bool:
+        """Whether the default model can take requests"""
+        default = self.default
+        return default is not None and default.state == 'ready' and default.handler.is_loaded()
+
+    def acquire(self, name: Optional[str] = None) -> Tuple[Deployment, Callable[..., None]]:
+        """Lease the named model (the default without a name) for one request
+
+        Returns the deployment and the release function. Raises KeyError
+        for an unknown name and ModelUnavailableError when the model is
+        not ready.
+        """
+        with self._lock:
+            deployment = self.default if name is None else self.deployments.get(name)
+            if deployment is None:
+                if name is None:
+                    raise ModelUnavailableError("Model not loaded")
+                raise KeyError(name)
+            if deployment.state != 'ready' or not deployment.handler.is_loaded():
+                raise ModelUnavailableError(f"Model {deployment.name} is {deployment.state}")
+            return deployment, deployment.acquire()
+
+    def get(self, name: str) -> Optional[Deployment]:
+        """Look up a resident, loading or most recently loaded deployment"""
+        with self._lock:
+            for deployment in [self.loading, self.last_load, *self.deployments.values(), *self.retiring]:
+                if deployment is not None and deployment.name == name:
+                    return deployment
+        return None
+
+    def load(self, name: Optional[str] = None, config_path: Optional[str] = None,
+             overrides: Optional[Dict[str, Dict[str, Any]]] = None,
+             make_default: bool = True) -> Deployment:
+        """Start loading a model in the background
+
+        The config is config_path (the server config by default) with
+        overrides applied per section, e.g. {'model': {'dtype': 'bfloat16'}}.
+        Loading a name that is already resident replaces that model. Raises
+        ValueError for a bad config and RuntimeError while another load runs.
+        """
+        with open(config_path or self.config_path, 'r') as f:
+            config = yaml.safe_load(f)
+        for section, values in (overrides or {}).items():
+            if not isinstance(values, dict):
+                raise ValueError(f"Override for {section} must be a mapping")
+            config.setdefault(section, {}).update(values)
+        if not config.get('model', {}).get('name'):
+            raise ValueError("model.name is required")
+        name = name or model_name(config)
+
+        with self._lock:
+            if self.loading is not None:
+                raise RuntimeError(f"Model {self.loading.name} is still loading")
+            workdir = tempfile.mkdtemp(prefix="personaplex-model-")
+            path = os.path.join(workdir, "config.yaml")
+            with open(path, 'w') as f:
+                yaml.safe_dump(config, f, sort_keys=False)
+            deployment = Deployment(name, path, workdir, make_default)
+            self.loading = deployment
+            self.last_load = deployment
+
+        threading.Thread(target=self._load, args=(deployment,), name="model-load", daemon=True).start()
+        logger.info(f"Loading model {name} ({config['model']['name']}) in the background")
+        return deployment
+
+    def unload(self, name: str) -> Deployment:
+        """Drain and unload a resident model
+
+        Raises KeyError for an unknown name and ValueError for the default.
+        """
+        with self._lock:
+            deployment = self.deployments.get(name)
+            if deployment is None:
+                raise KeyError(name)
+            if deployment is self.default:
+                raise ValueError("Cannot unload the default model; load a replacement first")
+            del self.deployments[name]
+            self._retire(deployment)
+        self._drain(deployment, 'removed')
+        return deployment
+
+    def _load(self, deployment: Deployment):
+        """Background load: make room, load and warm up, then swap in"""
+        try:
+            self._make_room(self._estimate_bytes(deployment), deployment.name)
+            deployment.load(self.warmup_prompt)
+        except Exception as e:
+            logger.error(f"Loading model {deployment.name} failed: {e}")
+            if deployment.handler is not None:
+                deployment.stop()
+            deployment.cleanup()
+            deployment.state = 'failed'
+            deployment.error = str(e)
+            MODEL_LOADS.inc(outcome='failed')
+            with self._lock:
+                self.loading = None
+                self._stats['failed_loads'] += 1
+            return
+        self._install(deployment)
+        # The new model's weights may push others out
+        self._make_room(0, deployment.name)
+
+    def _install(self, deployment: Deployment):
+        """Swap a loaded deployment in and start draining the one it replaces"""
+        with self._lock:
+            replaced = self.deployments.get(deployment.name)
+            self.deployments[deployment.name] = deployment
+            if deployment.make_default or self.default is None or self.default is replaced:
+                self.default = deployment
+            deployment.state = 'ready'
+            if self.loading is deployment:
+                self.loading = None
+            self._stats['loads'] += 1
+            if replaced is not None:
+                self._stats['swaps'] += 1
+                self._retire(replaced)
+        MODEL_LOADS.inc(outcome='loaded')
+        logger.info(
+            f"Model {deployment.name} is serving"
+            f"{' as the default' if self.default is deployment else ''} "
+            f"(loaded in {deployment.load_ms:.0f}ms)"
+        )
+        if replaced is not None:
+            self._drain(replaced, 'replaced')
+        self._rebase()
+
+    def _retire(self, deployment: Deployment):
+        """Stop routing to a deployment (lock must be held)"""
+        deployment.state = 'draining'
+        self.retiring.append(deployment)
+        RESIDENT_MODELS.set(len(self.deployments))
+
+    def _drain(self, deployment: Deployment, reason: str):
+        """Unload a retired deployment once its requests finish"""
+        def run():
+            if not deployment.wait_idle(self.drain_timeout):
+                logger.warning(
+                    f"Model {deployment.name} still has {deployment.active} request(s) after "
+                    f"{self.drain_timeout:.0f}s; unloading anyway"
+                )
+            deployment.stop()
+            with self._lock:
+                if deployment in self.retiring:
+                    self.retiring.remove(deployment)
+                self._stats['unloads'] += 1
+            MODEL_UNLOADS.inc(reason=reason)
+            logger.info(f"Unloaded model {deployment.name} ({reason})")
+            self._rebase()
+
+        logger.info(f"Draining model {deployment.name} ({deployment.active} request(s) in flight)")
+        threading.Thread(target=run, name="model-drain", daemon=True).start()
+
+    def _rebase(self):
+        """Let every resident model's memory governor see the current weights"""
+        with self._lock:
+            deployments = list(self.deployments.values())
+            RESIDENT_MODELS.set(len(deployments))
+        for deployment in deployments:
+            if deployment.handler is not None:
+                deployment.handler.memory.rebase()
+
+    def _budget(self) -> int:
+        """Bytes the weights of all resident models may take, or 0 for no limit"""
+        if self.memory_budget_mb:
+            return int(float(self.memory_budget_mb) * MB)
+        default = self.default
+        if default is not None and default.handler is not None and default.handler.memory.enabled:
+            return default.handler.memory.budget
+        return 0
+
+    def _estimate_bytes(self, deployment: Deployment) -> int:
+        """Expected weight bytes of a deployment that has not loaded yet"""
+        with self._lock:
+            current = self.deployments.get(deployment.name)
+        if current is not None and current.memory_bytes:
+            return current.memory_bytes
+        return _weight_bytes_on_disk(deployment.config)
+
+    def _make_room(self, incoming_bytes: int, incoming_name: str):
+        """Evict least recently used models until incoming fits
+
+        A resident model sharing incoming's name is replaced rather than
+        counted against max_resident, but its memory counts until drained.
+        """
+        budget = self._budget()
+        evicted = []
+        with self._lock:
+            while True:
+                others = [d for d in self.deployments.values() if d.name != incoming_name]
+                resident_bytes = sum(d.memory_bytes for d in self.deployments.values())
+                resident_bytes += sum(d.memory_bytes for d in self.retiring)
+                # A loaded incoming model is already among the deployments
+                count = len(others) + 1
+                over_count = count > self.max_resident
+                over_memory = budget and resident_bytes + incoming_bytes > budget
+                if not over_count and not over_memory:
+                    break
+                candidates = [d for d in others if d is not self.default]
+                if not candidates:
+                    if over_memory:
+                        logger.warning(
+                            f"Resident models need {(resident_bytes + incoming_bytes) / MB:.0f}MB, more than "
+                            f"the {budget / MB:.0f}MB budget, and none can be evicted"
+                        )
+                    break
+                victim = min(candidates, key=lambda d: d.last_used)
+                del self.deployments[victim.name]
+                self._retire(victim)
+                evicted.append(victim)
+        for victim in evicted:
+            logger.info(f"Evicting model {victim.name} to make room for {incoming_name}")
+            self._drain(victim, 'evicted')
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Resident, loading and draining models"""
+        with self._lock:
+            stats = dict(self._stats)
+            resident = list(self.deployments.values())
+            retiring = list(self.retiring)
+            default = self.default
+            loading = self.loading
+            last_load = self.last_load
+        stats.update({
+            'default': default.name if default else None,
+            'max_resident': self.max_resident,
+            'drain_timeout': self.drain_timeout,
+            'memory_budget_mb': self._budget() / MB,
+            'resident': [deployment.get_stats() for deployment in resident],
+            'draining': [deployment.get_stats() for deployment in retiring],
+            'loading': loading.get_stats() if loading else None,
+            'last_load': last_load.get_stats() if last_load else None
+        })
+        return stats
@@ -0,0 +1,204 @@
+"""
+Prefix KV-cache for PersonaPlex
+Reuses prefill state (past_key_values) for prompt prefixes shared across requests
+"""
+
+import copy
+import hashlib
+import threading
+import logging
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Tuple, Iterator
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def cache_tensors(past_key_values) -> Iterator[torch.Tensor]:
+    """Iterate over the key/value tensors of a KV cache"""
+    if hasattr(past_key_values, 'layers'):
+        for layer in past_key_values.layers:
+            yield layer.keys
+            yield layer.values
+    elif hasattr(past_key_values, 'key_cache'):
+        yield from past_key_values.key_cache
+        yield from past_key_values.value_cache
+    else:
+        for layer in past_key_values:
+            yield from layer
+
+
+def cache_nbytes(past_key_values) -> int:
+    """Memory held by a KV cache in bytes"""
+    return sum(
+        tensor.nelement() * tensor.element_size()
+        for tensor in cache_tensors(past_key_values)
+        if tensor is not None
+    )
+
+
+def move_cache(past_key_values, device: torch.device):
+    """Move a KV cache to another device in place and return it"""
+    if hasattr(past_key_values, 'layers'):
+        for layer in past_key_values.layers:
+            if getattr(layer, 'keys', None) is None:
+                continue
+            layer.keys = layer.keys.to(device, non_blocking=True)
+            layer.values = layer.values.to(device, non_blocking=True)
+            if hasattr(layer, 'device'):
+                layer.device = device
+        return past_key_values
+    if hasattr(past_key_values, 'key_cache'):
+        past_key_values.key_cache = [t.to(device, non_blocking=True) for t in past_key_values.key_cache]
+        past_key_values.value_cache = [t.to(device, non_blocking=True) for t in past_key_values.value_cache]
+        return past_key_values
+    return tuple(
+        tuple(t.to(device, non_blocking=True) for t in layer)
+        for layer in past_key_values
+    )
+
+
+def hash_tokens(token_ids: List[int]) -> str:
+    """Stable hash of a token-ID sequence"""
+    return hashlib.blake2b(array('q', token_ids).tobytes(), digest_size=16).hexdigest()
+
+
+@dataclass
+class _Entry:
+    """A cached prefix"""
+    length: int
+    past_key_values: Any
+    nbytes: int
+    hits: int = 0
+
+
+class PrefixCache:
+    """LRU cache of prefill KV state keyed by the hash of the prefix token IDs
+
+    Prefixes are either registered explicitly (e.g. persona preambles) or
+    detected automatically: every prompt is hashed at block_size token
+    boundaries, and a boundary seen auto_detect_min_hits times becomes a
+    candidate for caching. Entries are evicted least-recently-used first
+    once their total size exceeds max_memory_mb.
+    """
+
+    # Bound on the number of tracked-but-not-cached prefix hashes
+    MAX_CANDIDATES = 4096
+
+    def __init__(self, config: Dict[str, Any]):
+        """Initialize cache from the performance.prefix_cache config"""
+        cache_config = config.get('performance', {}).get('prefix_cache', {}) or {}
+        self.enabled = bool(cache_config.get('enabled', False))
+        self.max_memory_bytes = int(float(cache_config.get('max_memory_mb', 512)) * 1024 * 1024)
+        self.block_size = max(int(cache_config.get('block_size', 32)), 1)
+        self.auto_detect_min_hits = int(cache_config.get('auto_detect_min_hits', 2))
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lengths: Dict[int, int] = {}
+        self._candidates: "OrderedDict[str, int]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'prefill_tokens_saved': 0,
+            'evictions': 0
+        }
+
+    def lookup(self, token_ids: List[int]) -> Optional[Tuple[int, Any]]:
+        """Find the longest cached prefix of token_ids
+
+        Returns (prefix_length, past_key_values) with a private copy of the
+        cache that generate may extend, or None. At least one token is
+        always left for prefill.
+        """
+        with self._lock:
+            for length in sorted(self._lengths, reverse=True):
+                if length >= len(token_ids):
+                    continue
+                key = hash_tokens(token_ids[:length])
+                entry = self._entries.get(key)
+                if entry is None or entry.length != length:
+                    continue
+                self._entries.move_to_end(key)
+                entry.hits += 1
+                self._stats['hits'] += 1
+                self._stats['prefill_tokens_saved'] += length
+                return length, copy.deepcopy(entry.past_key_values)
+            self._stats['misses'] += 1
+            return None
+
+    def observe(self, token_ids: List[int]) -> Optional[int]:
+        """Record a prompt for automatic detection
+
+        Returns the length of the longest uncached block-aligned prefix that
+        has now been seen often enough to be worth caching, or None.
+        """
+        if self.auto_detect_min_hits <= 0:
+            return None
+        best = None
+        with self._lock:
+            for length in range(self.block_size, len(token_ids), self.block_size):
+                key = hash_tokens(token_ids[:length])
+                if key in self._entries:
+                    continue
+                count = self._candidates.pop(key, 0) + 1
+                self._candidates[key] = count
+                if count >= self.auto_detect_min_hits:
+                    best = length
+            while len(self._candidates) > self.MAX_CANDIDATES:
+                self._candidates.popitem(last=False)
+        return best
+
+    def put(self, token_ids: List[int], past_key_values: Any) -> bool:
+        """Cache the KV state for a prefix, evicting LRU entries to fit"""
+        nbytes = cache_nbytes(past_key_values)
+        if nbytes > self.max_memory_bytes:
+            logger.warning(
+                f"Prefix of {len(token_ids)} tokens ({nbytes} bytes) exceeds the prefix cache budget"
+            )
+            return False
+
+        key = hash_tokens(token_ids)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._candidates.pop(key, None)
+            self._entries[key] = _Entry(len(token_ids), past_key_values, nbytes)
+            self._lengths[len(token_ids)] = self._lengths.get(len(token_ids), 0) + 1
+            self._memory_bytes += nbytes
+            while self._memory_bytes > self.max_memory_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+        logger.info(f"Cached prefix of {len(token_ids)} tokens ({nbytes / 1024:.1f} KiB)")
+        return True
+
+    def clear(self):
+        """Drop all cached prefixes"""
+        with self._lock:
+            self._entries.clear()
+            self._lengths.clear()
+            self._candidates.clear()
+            self._memory_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['memory_bytes'] = self._memory_bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['max_memory_bytes'] = self.max_memory_bytes
+        stats['enabled'] = self.enabled
+        return stats
+
+    def _remove(self, key: str):
+        """Remove an entry (lock must be held)"""
+        entry = self._entries.pop(key)
+        self._memory_bytes -= entry.nbytes
+        self._lengths[entry.length] -= 1
+        if not self._lengths[entry.length]:
+            del self._lengths[entry.length]
@@ -0,0 +1,399 @@
+"""
+On-demand profiling for PersonaPlex
+Captures a torch.profiler trace and a sampled Python stack profile for the
+next N generation requests or T seconds, written as downloadable files
+"""
+
+import os
+import sys
+import json
+import time
+import functools
+import shutil
+import logging
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Optional, Dict, Any, List, Callable, Union
+
+import torch
+from torch.profiler import profile, ProfilerActivity, record_function
+
+from src.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+PROFILES = REGISTRY.counter(
+    'personaplex_profiles_total',
+    'Profiling sessions, by why they ended (requests, duration, stopped, failed)',
+    ['outcome']
+)
+
+# Files a finished session may contain
+TRACE_FILE = 'trace.json'
+OPERATORS_FILE = 'operators.txt'
+STACKS_FILE = 'stacks.folded'
+SUMMARY_FILE = 'summary.json'
+
+# Innermost Python frames of a thread that is blocked rather than running:
+# lock and condition waits, the event loop's select, idle executor workers
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('selectors.py', 'select'),
+    ('queue.py', 'get'),
+    ('thread.py', '_worker'),
+}
+
+# Returned by capture() while no session runs, so the hooks in the request
+# path cost one attribute read
+_IDLE = nullcontext()
+_local = threading.local()
+
+
+class ProfilingBusyError(RuntimeError):
+    """Raised when a profiling session is started while another one runs"""
+
+
+class StackSampler:
+    """py-spy style sampler of the Python stacks of every thread
+
+    A daemon thread reads sys._current_frames() every interval and counts
+    each thread's stack (outermost frame first, rooted at the thread name).
+    Threads blocked in a wait are skipped unless include_idle is set. The
+    counts are written in the folded format read by flamegraph.pl,
+    speedscope and inferno.
+    """
+
+    def __init__(self, interval: float, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if not self.include_idle and _frame_key(frame) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write_folded(self, path: str):
+        """Write "frame;frame;... count" lines, most frequent stacks first"""
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _frame_key(frame) -> tuple:
+    return os.path.basename(frame.f_code.co_filename), frame.f_code.co_name
+
+
+class ProfileSession:
+    """One capture window and the files it produces"""
+
+    def __init__(self, session_id: str, directory: str, requests: Optional[int],
+                 seconds: Optional[float], torch_trace: bool, stacks: bool):
+        self.id = session_id
+        self.directory = directory
+        self.max_requests = requests
+        self.seconds = seconds
+        self.torch_trace = torch_trace
+        self.stack_sampling = stacks
+        self.state = 'starting'
+        self.reason: Optional[str] = None
+        self.error: Optional[str] = None
+        self.requests = 0
+        self.files: List[str] = []
+        self.started_at = time.time()
+        self.ended_at: Optional[float] = None
+        self.profiler: Optional[profile] = None
+        self.sampler: Optional[StackSampler] = None
+        self.timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def capture(self, name: str, requests: int):
+        """Label the work of one call and count it once it finishes"""
+        outer = not getattr(_local, 'depth', 0)
+        _local.depth = getattr(_local, 'depth', 0) + 1
+        try:
+            with record_function(f"personaplex::{name}") if self.torch_trace else _IDLE:
+                yield
+        finally:
+            _local.depth -= 1
+            if outer and requests:
+                self._count(requests)
+
+    def _count(self, requests: int):
+        with self._lock:
+            self.requests += requests
+            reached = self.max_requests is not None and self.requests >= self.max_requests
+        if reached:
+            # Writing the trace takes a while; don't hold up this request
+            threading.Thread(target=PROFILER.stop, args=(self.id, 'requests'), daemon=True).start()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """State, limits and files of the session"""
+        return {
+            'id': self.id,
+            'state': self.state,
+            'reason': self.reason,
+            'error': self.error,
+            'requests': self.requests,
+            'max_requests': self.max_requests,
+            'seconds': self.seconds,
+            'torch_trace': self.torch_trace,
+            'stacks': self.stack_sampling,
+            'stack_samples': self.sampler.samples if self.sampler else 0,
+            'started_at': self.started_at,
+            'ended_at': self.ended_at,
+            'files': list(self.files)
+        }
+
+
+class Profiler:
+    """Process-wide profiling sessions started from the admin API
+
+    Handlers wrap each generation (and model loads) in capture(); with no
+    session running that returns a shared no-op context. A session starts
+    torch.profiler for every thread (operator CPU/CUDA time, shapes and
+    memory) and a StackSampler, and ends after a number of requests, a
+    number of seconds or an explicit stop, whichever comes first. Its
+    files are written under profiling.output_dir/<id>; only the last
+    profiling.keep sessions are kept. Replicas running in their own
+    processes are not profiled.
+    """
+
+    def __init__(self):
+        self.configure({})
+        self._session: Optional[ProfileSession] = None
+        self._sessions: Dict[str, ProfileSession] = {}
+        self._lock = threading.Lock()
+        self._sequence = 0
+
+    def configure(self, config: Dict[str, Any]):
+        """Apply the profiling config section"""
+        profiling_config = config.get('profiling', {}) or {}
+        self.enabled = bool(profiling_config.get('enabled', False))
+        self.output_dir = profiling_config.get('output_dir') or os.path.join(
+            tempfile.gettempdir(), 'personaplex-profiles'
+        )
+        self.max_seconds = float(profiling_config.get('max_seconds', 300))
+        self.max_requests = int(profiling_config.get('max_requests', 1000))
+        self.sample_interval = float(profiling_config.get('sample_interval_ms', 10)) / 1000
+        self.record_shapes = bool(profiling_config.get('record_shapes', True))
+        self.profile_memory = bool(profiling_config.get('profile_memory', True))
+        self.with_stack = bool(profiling_config.get('with_stack', False))
+        self.keep = max(int(profiling_config.get('keep', 10)), 1)
+
+    def capture(self, name: str, requests: int = 1):
+        """Context for one call into the model; requests=0 labels it without counting"""
+        session = self._session
+        if session is None:
+            return _IDLE
+        return session.capture(name, requests)
+
+    @property
+    def active(self) -> Optional[ProfileSession]:
+        return self._session
+
+    def start(self, requests: Optional[int] = None, seconds: Optional[float] = None,
+              torch_trace: bool = True, stacks: bool = True) -> ProfileSession:
+        """Start a session; blocks while torch.profiler initializes
+
+        Raises ValueError for missing or out-of-range limits and
+        ProfilingBusyError when a session is already running.
+        """
+        if requests is None and seconds is None:
+            raise ValueError("Give requests, seconds or both")
+        if requests is not None and not 0 < requests <= self.max_requests:
+            raise ValueError(f"requests must be in [1, {self.max_requests}]")
+        if seconds is not None and not 0 < seconds <= self.max_seconds:
+            raise ValueError(f"seconds must be in (0, {self.max_seconds}]")
+        if not (torch_trace or stacks):
+            raise ValueError("Nothing to capture: enable torch_trace, stacks or both")
+        # Bound every session so a forgotten one cannot run indefinitely
+        seconds = seconds if seconds is not None else self.max_seconds
+
+        with self._lock:
+            if self._session is not None:
+                raise ProfilingBusyError(f"Profiling session {self._session.id} is running")
+            self._sequence += 1
+            session_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{self._sequence}"
+            session = ProfileSession(
+                session_id, os.path.join(self.output_dir, session_id), requests, seconds, torch_trace, stacks
+            )
+            self._session = session
+            self._sessions[session_id] = session
+        try:
+            os.makedirs(session.directory, exist_ok=True)
+            if torch_trace:
+                session.profiler = self._torch_profiler()
+                session.profiler.start()
+            if stacks:
+                session.sampler = StackSampler(self.sample_interval)
+                session.sampler.start()
+        except Exception as e:
+            logger.error(f"Failed to start profiling: {e}")
+            self._finish(session, 'failed', e)
+            raise
+        session.state = 'running'
+        session.timer = threading.Timer(seconds, self.stop, args=(session_id, 'duration'))
+        session.timer.daemon = True
+        session.timer.start()
+        logger.info(f"Profiling session {session_id} started (requests={requests}, seconds={seconds})")
+        return session
+
+    def _torch_profiler(self) -> profile:
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        kwargs = {}
+        try:
+            # Generations run on executor threads that already exist
+            from torch._C._profiler import _ExperimentalConfig
+            kwargs['experimental_config'] = _ExperimentalConfig(profile_all_threads=True)
+        except (ImportError, TypeError):
+            logger.warning("This torch version profiles only the thread that starts the profiler")
+        return profile(
+            activities=activities,
+            record_shapes=self.record_shapes,
+            profile_memory=self.profile_memory,
+            with_stack=self.with_stack,
+            **kwargs
+        )
+
+    def stop(self, session_id: Optional[str] = None, reason: str = 'stopped') -> Optional[ProfileSession]:
+        """End the running session (if it is session_id) and write its files
+
+        Returns the session, or None when nothing matching was running.
+        """
+        with self._lock:
+            session = self._session
+            if session is None or (session_id is not None and session.id != session_id):
+                return None
+            # New calls stop capturing from here on
+            self._session = None
+        self._finish(session, reason)
+        return session
+
+    def _finish(self, session: ProfileSession, reason: str, error: Optional[Exception] = None):
+        session.state = 'writing'
+        session.reason = reason
+        with self._lock:
+            if self._session is session:
+                self._session = None
+        if session.timer is not None:
+            session.timer.cancel()
+        session.ended_at = time.time()
+        try:
+            if session.sampler is not None:
+                session.sampler.stop()
+            if session.profiler is not None:
+                session.profiler.stop()
+            if error is None:
+                self._write(session)
+        except Exception as e:
+            logger.error(f"Failed to write profile {session.id}: {e}")
+            error = e
+        if error is not None:
+            session.state, session.reason, session.error = 'failed', 'failed', str(error)
+        else:
+            session.state = 'done'
+        PROFILES.inc(outcome=session.reason)
+        logger.info(f"Profiling session {session.id} {session.state} ({reason}), files in {session.directory}")
+        self._prune()
+
+    def _write(self, session: ProfileSession):
+        if session.profiler is not None:
+            session.profiler.export_chrome_trace(os.path.join(session.directory, TRACE_FILE))
+            session.files.append(TRACE_FILE)
+            sort_by = 'self_cuda_time_total' if torch.cuda.is_available() else 'self_cpu_time_total'
+            with open(os.path.join(session.directory, OPERATORS_FILE), 'w') as f:
+                f.write(session.profiler.key_averages().table(sort_by=sort_by, row_limit=100))
+            session.files.append(OPERATORS_FILE)
+        if session.sampler is not None:
+            session.sampler.write_folded(os.path.join(session.directory, STACKS_FILE))
+            session.files.append(STACKS_FILE)
+        session.files.append(SUMMARY_FILE)
+        with open(os.path.join(session.directory, SUMMARY_FILE), 'w') as f:
+            json.dump(dict(session.get_stats(), state='done'), f, indent=2)
+
+    def _prune(self):
+        """Delete the oldest finished sessions beyond keep"""
+        with self._lock:
+            finished = [session for session in self._sessions.values() if session.state in ('done', 'failed')]
+            stale = finished[:max(len(finished) - self.keep, 0)]
+            for session in stale:
+                del self._sessions[session.id]
+        for session in stale:
+            shutil.rmtree(session.directory, ignore_errors=True)
+
+    def get(self, session_id: str) -> Optional[ProfileSession]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def file_path(self, session_id: str, name: str) -> Optional[str]:
+        """Path of a file a finished session wrote, or None"""
+        session = self.get(session_id)
+        if session is None or session.state != 'done' or name not in session.files:
+            return None
+        return os.path.join(session.directory, name)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Running session and the kept ones, newest first"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            active = self._session
+        return {
+            'enabled': self.enabled,
+            'active': active.id if active else None,
+            'output_dir': self.output_dir,
+            'sessions': [session.get_stats() for session in reversed(sessions)]
+        }
+
+
+# Process-wide: torch.profiler profiles the whole process
+PROFILER = Profiler()
+
+
+def profiled(name: str, requests: Union[int, Callable[..., int]] = 1):
+    """Decorator running a handler method inside PROFILER.capture(name)
+
+    requests is the number of requests a call counts as, or a function of
+    the call's arguments returning it.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if PROFILER.active is None:
+                return fn(*args, **kwargs)
+            count = requests(*args, **kwargs) if callable(requests) else requests
+            with PROFILER.capture(name, count):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
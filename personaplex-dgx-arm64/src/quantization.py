@@ -0,0 +1,167 @@
+"""
+Low-bit CPU inference for PersonaPlex
+Swaps nn.Linear layers for dynamic int8 or weight-only int4 versions after
+the weights are loaded
+"""
+
+import os
+import json
+import logging
+from typing import Dict, Any, Iterable, Optional
+
+import torch
+from torch import nn
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = ('none', 'int8', 'int4')
+
+# Spellings accepted for each mode
+_ALIASES = {
+    None: 'none', '': 'none', 'none': 'none', 'fp32': 'none', 'off': 'none',
+    'int8': 'int8', 'dynamic_int8': 'int8', 'qint8': 'int8',
+    'int4': 'int4', 'int4_weight_only': 'int4', 'w4': 'int4',
+}
+
+
+def load_model_config(config: Dict[str, Any], config_path: str) -> Dict[str, Any]:
+    """Read model_config.json (model.model_config, default next to config.yaml)"""
+    path = config.get('model', {}).get('model_config') or os.path.join(
+        os.path.dirname(os.path.abspath(config_path)), 'model_config.json'
+    )
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def resolve_mode(config: Dict[str, Any], model_config: Dict[str, Any]) -> str:
+    """Quantization mode: model.quantization, else optimization.quantization"""
+    mode = config.get('model', {}).get('quantization')
+    if mode is None:
+        mode = model_config.get('optimization', {}).get('quantization')
+    key = mode.lower() if isinstance(mode, str) else mode
+    if key not in _ALIASES:
+        raise ValueError(f"Unknown quantization mode {mode!r}; expected one of {', '.join(QUANTIZATION_MODES)}")
+    return _ALIASES[key]
+
+
+class Int4WeightOnlyLinear(nn.Module):
+    """Linear layer with group-wise asymmetric int4 weights
+
+    Each group of group_size input weights shares a scale and zero point.
+    The matmul runs on the packed weights through PyTorch's CPU int4
+    kernel, so weights take an eighth of their float32 size (plus 4 bytes of
+    scale/zero per group). Activations are cast to bfloat16 for the kernel,
+    whose float32 path is several times slower than a float32 matmul.
+    """
+
+    compute_dtype = torch.bfloat16
+
+    def __init__(self, packed: torch.Tensor, scales_and_zeros: torch.Tensor,
+                 bias: Optional[torch.Tensor], in_features: int, out_features: int,
+                 group_size: int):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.group_size = group_size
+        self.register_buffer('packed', packed)
+        self.register_buffer('scales_and_zeros', scales_and_zeros)
+        self.register_buffer('bias', bias)
+
+    @classmethod
+    def from_linear(cls, linear: nn.Linear, group_size: int) -> "Int4WeightOnlyLinear":
+        """Quantize a float Linear layer"""
+        weight = linear.weight.detach().float()
+        out_features, in_features = weight.shape
+        groups = weight.reshape(out_features, in_features // group_size, group_size)
+        low = groups.amin(dim=-1, keepdim=True)
+        high = groups.amax(dim=-1, keepdim=True)
+        scale = (high - low).clamp(min=1e-8) / 15
+        quantized = torch.round((groups - low) / scale).clamp(0, 15)
+        # The kernel dequantizes as (q - 8) * scale + zero
+        zero = low + 8 * scale
+        packed = torch.ops.aten._convert_weight_to_int4pack_for_cpu(
+            quantized.reshape(out_features, in_features).to(torch.int32), 1
+        )
+        scales_and_zeros = torch.stack(
+            [scale.squeeze(-1).t(), zero.squeeze(-1).t()], dim=-1
+        ).contiguous().to(cls.compute_dtype)
+        bias = linear.bias.detach().clone() if linear.bias is not None else None
+        return cls(packed, scales_and_zeros, bias, in_features, out_features, group_size)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        shape = x.shape
+        flat = x.reshape(-1, self.in_features).to(self.compute_dtype).contiguous()
+        out = torch.ops.aten._weight_int4pack_mm_for_cpu(
+            flat, self.packed, self.group_size, self.scales_and_zeros
+        ).to(x.dtype)
+        if self.bias is not None:
+            out = out + self.bias
+        return out.reshape(*shape[:-1], self.out_features)
+
+    def extra_repr(self) -> str:
+        return f"in_features={self.in_features}, out_features={self.out_features}, group_size={self.group_size}"
+
+
+def _module_bytes(module: nn.Module) -> int:
+    """Bytes held by a (possibly quantized) linear layer's weights and bias"""
+    if isinstance(module, nn.Linear):
+        return sum(t.nbytes for t in (module.weight, module.bias) if t is not None)
+    if isinstance(module, Int4WeightOnlyLinear):
+        return sum(t.nbytes for t in (module.packed, module.scales_and_zeros, module.bias) if t is not None)
+    weight, bias = module._packed_params._weight_bias()
+    total = weight.numel() * weight.element_size()
+    if weight.qscheme() in (torch.per_channel_affine, torch.per_channel_symmetric):
+        total += weight.q_per_channel_scales().nbytes + weight.q_per_channel_zero_points().nbytes
+    return total + (bias.nbytes if bias is not None else 0)
+
+
+def quantize_model(model: nn.Module, mode: str, group_size: int = 128,
+                   skip: Iterable[str] = ('lm_head',)) -> Dict[str, Any]:
+    """Quantize model's Linear layers in place and describe the result
+
+    int8 uses dynamic quantization (int8 weights per output channel,
+    activations quantized per batch at run time); int4 is weight-only.
+    Layers whose name ends with an entry of skip stay in full precision, as
+    do int4 layers whose input size is not a multiple of group_size.
+    """
+    info = {'mode': mode, 'layers': 0, 'skipped': [], 'linear_bytes_before': 0, 'linear_bytes_after': 0}
+    if mode == 'none':
+        return info
+    skip = tuple(skip)
+
+    targets = {}
+    for name, module in model.named_modules():
+        if not isinstance(module, nn.Linear):
+            continue
+        if name.endswith(skip) or (mode == 'int4' and module.in_features % group_size):
+            info['skipped'].append(name)
+            continue
+        targets[name] = module
+    info['linear_bytes_before'] = sum(_module_bytes(module) for module in targets.values())
+
+    if mode == 'int8':
+        if any(module.weight.dtype != torch.float32 for module in targets.values()):
+            logger.warning("Dynamic int8 quantization needs float32 weights; converting the model")
+            model.float()
+        torch.ao.quantization.quantize_dynamic(
+            model,
+            {name: torch.ao.quantization.per_channel_dynamic_qconfig for name in targets},
+            dtype=torch.qint8,
+            inplace=True
+        )
+    else:
+        for name, module in targets.items():
+            parent_name, _, child_name = name.rpartition('.')
+            parent = model.get_submodule(parent_name) if parent_name else model
+            setattr(parent, child_name, Int4WeightOnlyLinear.from_linear(module, group_size))
+
+    quantized = dict(model.named_modules())
+    info['layers'] = len(targets)
+    info['linear_bytes_after'] = sum(_module_bytes(quantized[name]) for name in targets)
+    logger.info(
+        f"Quantized {info['layers']} linear layers to {mode} "
+        f"({info['linear_bytes_before'] / 2**20:.1f} MiB -> {info['linear_bytes_after'] / 2**20:.1f} MiB)"
+    )
+    return info
@@ -0,0 +1,308 @@
+"""
+Replica pool for PersonaPlex
+Runs one model instance per device and routes batched requests by load
+"""
+
+import os
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import Future
+from typing import Optional, Dict, Any, List
+
+import torch
+import yaml
+
+from src.batching import BatchScheduler
+from src.cancellation import CancelToken
+
+logger = logging.getLogger(__name__)
+
+
+def _serve_replica(config_path: str, device: str, cpu_ids: Optional[List[int]], conn):
+    """Child process main loop: load a handler and answer calls over conn"""
+    from src.model_handler import PersonaPlexModelHandler
+
+    if cpu_ids:
+        os.sched_setaffinity(0, cpu_ids)
+        torch.set_num_threads(len(cpu_ids))
+    handler = PersonaPlexModelHandler(config_path, device=device)
+    try:
+        handler.load_model()
+    except Exception as e:
+        conn.send(('error', str(e)))
+        return
+    conn.send(('ok', handler.get_model_info()))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        method, args, kwargs = message
+        try:
+            conn.send(('ok', getattr(handler, method)(*args, **kwargs)))
+        except Exception as e:
+            conn.send(('error', str(e)))
+
+
+class ProcessHandler:
+    """Proxy for a model handler living in a child process
+
+    Exposes the part of the handler a BatchScheduler uses (config and
+    generate_batch). Calls are forwarded over a pipe one at a time, which
+    matches the scheduler's single worker thread. Cancel tokens reach the
+    child with their deadline only: a client disconnect cannot stop a
+    batch already running there.
+    """
+
+    def __init__(self, config_path: str, device: str = "cpu", cpu_ids: Optional[List[int]] = None):
+        """Initialize proxy; start() launches the process"""
+        with open(config_path, 'r') as f:
+            self.config = yaml.safe_load(f)
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_serve_replica,
+            args=(config_path, device, cpu_ids, child_conn),
+            daemon=True
+        )
+        self.info: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the child process and wait for its model to load"""
+        self.process.start()
+        self.info = self._receive()
+
+    def generate_batch(self, input_texts: List[str],
+                       max_lengths: Optional[List[Optional[int]]] = None,
+                       **kwargs) -> List[Dict[str, Any]]:
+        """Run generate_batch in the child process"""
+        with self._lock:
+            self._conn.send(('generate_batch', (input_texts, max_lengths), kwargs))
+            return self._receive()
+
+    def is_alive(self) -> bool:
+        """Whether the child process is running"""
+        return self.process.is_alive()
+
+    def close(self, timeout: float = 10.0):
+        """Ask the child to exit, terminating it if it does not"""
+        try:
+            self._conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+    def _receive(self) -> Any:
+        """Read one reply, raising errors from the child"""
+        try:
+            status, payload = self._conn.recv()
+        except EOFError:
+            raise RuntimeError("Replica process exited")
+        if status == 'error':
+            raise RuntimeError(payload)
+        return payload
+
+
+class Replica:
+    """One model instance with its own batch scheduler and load counters"""
+
+    def __init__(self, name: str, device: str, handler):
+        """Initialize replica around a loaded (or proxied) handler"""
+        self.name = name
+        self.device = device
+        self.handler = handler
+        self.scheduler = BatchScheduler(handler)
+        self.state = 'ready'
+        self.default_max_length = int(handler.config['model'].get('max_length', 2048))
+        self.outstanding_requests = 0
+        self.outstanding_tokens = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'completed': 0,
+            'errors': 0
+        }
+
+    @property
+    def healthy(self) -> bool:
+        """Whether the replica can serve requests"""
+        if isinstance(self.handler, ProcessHandler):
+            return self.handler.is_alive()
+        return self.handler.is_loaded()
+
+    @property
+    def accepting(self) -> bool:
+        """Whether the router may send new requests here"""
+        return self.state == 'ready' and self.healthy
+
+    def submit(self, input_text: str, cancel: Optional[CancelToken] = None, **gen_kwargs) -> Future:
+        """Queue a request on this replica's scheduler"""
+        max_length = gen_kwargs.get('max_length')
+        # max_length bounds prompt plus output, so it is the request's cost
+        cost = self.default_max_length if max_length is None else max_length
+        with self._lock:
+            self.outstanding_requests += 1
+            self.outstanding_tokens += cost
+        try:
+            future = self.scheduler.submit(input_text, cancel=cancel, **gen_kwargs)
+        except Exception:
+            self._finished(cost, failed=True)
+            raise
+        future.add_done_callback(
+            lambda f: self._finished(cost, failed=f.cancelled() or f.exception() is not None)
+        )
+        return future
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get replica statistics"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['outstanding_requests'] = self.outstanding_requests
+            stats['outstanding_tokens'] = self.outstanding_tokens
+        stats['name'] = self.name
+        stats['device'] = self.device
+        stats['state'] = self.state
+        stats['healthy'] = self.healthy
+        stats['process'] = isinstance(self.handler, ProcessHandler)
+        stats['batching'] = self.scheduler.get_stats()
+        return stats
+
+    def _finished(self, cost: int, failed: bool):
+        """Update counters when a request completes"""
+        with self._lock:
+            self.outstanding_requests -= 1
+            self.outstanding_tokens -= cost
+            self._stats['errors' if failed else 'completed'] += 1
+
+
+class ReplicaPool:
+    """Model replicas across gpu.device_ids, routed by outstanding tokens
+
+    The primary handler (already loaded by the server) is replica 0. With
+    CUDA, one more in-process replica is loaded per extra entry of
+    gpu.device_ids. On CPU-only hosts gpu.cpu_replicas replicas are used,
+    the extra ones in child processes, each pinned to its own group of
+    cores. Batched /generate requests go to the accepting replica with the
+    fewest outstanding tokens; sessions, streaming and seeded requests stay
+    on the primary because they depend on in-process state.
+    """
+
+    def __init__(self, primary_handler):
+        """Initialize pool around the loaded primary handler"""
+        self.config = primary_handler.config
+        self.config_path = primary_handler.config_path
+        self.primary = Replica('replica-0', str(primary_handler.device), primary_handler)
+        self.replicas: List[Replica] = [self.primary]
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Load the extra replicas and start every scheduler"""
+        from src.model_handler import PersonaPlexModelHandler
+
+        gpu_config = self.config.get('gpu', {})
+        if self.primary.handler.device.type == 'cuda':
+            for device_id in gpu_config.get('device_ids', [0])[1:]:
+                device = f"cuda:{device_id}"
+                handler = PersonaPlexModelHandler(self.config_path, device=device)
+                handler.load_model()
+                self.replicas.append(Replica(f"replica-{len(self.replicas)}", device, handler))
+        else:
+            cpu_groups = self._cpu_groups(int(gpu_config.get('cpu_replicas', 1)))
+            if len(cpu_groups) > 1:
+                os.sched_setaffinity(0, cpu_groups[0])
+                torch.set_num_threads(len(cpu_groups[0]))
+            for cpu_ids in cpu_groups[1:]:
+                handler = ProcessHandler(self.config_path, "cpu", cpu_ids)
+                handler.start()
+                self.replicas.append(Replica(f"replica-{len(self.replicas)}", "cpu", handler))
+
+        for replica in self.replicas:
+            replica.scheduler.start()
+        logger.info(f"Replica pool started with {len(self.replicas)} replica(s)")
+
+    def stop(self):
+        """Stop schedulers and child processes"""
+        for replica in self.replicas:
+            replica.scheduler.stop()
+            if isinstance(replica.handler, ProcessHandler):
+                replica.handler.close()
+
+    def submit(self, input_text: str, cancel: Optional[CancelToken] = None, **gen_kwargs) -> Future:
+        """Route a request to the least loaded accepting replica"""
+        with self._lock:
+            candidates = [replica for replica in self.replicas if replica.accepting]
+            if not candidates:
+                raise RuntimeError("No replica is accepting requests")
+            replica = min(
+                candidates,
+                key=lambda r: (r.outstanding_tokens, r.outstanding_requests)
+            )
+            return replica.submit(input_text, cancel=cancel, **gen_kwargs)
+
+    def get(self, name: str) -> Optional[Replica]:
+        """Look up a replica by name"""
+        for replica in self.replicas:
+            if replica.name == name:
+                return replica
+        return None
+
+    def drain(self, name: str) -> Replica:
+        """Stop routing new requests to a replica; in-flight ones finish
+
+        Raises KeyError for an unknown replica and ValueError when it is
+        the last one accepting requests.
+        """
+        with self._lock:
+            replica = self.get(name)
+            if replica is None:
+                raise KeyError(name)
+            others = [r for r in self.replicas if r is not replica and r.accepting]
+            if replica.accepting and not others:
+                raise ValueError("Cannot drain the last accepting replica")
+            replica.state = 'draining'
+        logger.info(f"Draining {name} ({replica.outstanding_requests} in flight)")
+        return replica
+
+    def resume(self, name: str) -> Replica:
+        """Route requests to a drained replica again"""
+        replica = self.get(name)
+        if replica is None:
+            raise KeyError(name)
+        replica.state = 'ready'
+        logger.info(f"Resumed {name}")
+        return replica
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get pool statistics"""
+        return {
+            'routing': 'outstanding_tokens',
+            'accepting': sum(1 for replica in self.replicas if replica.accepting),
+            'replicas': [replica.get_stats() for replica in self.replicas]
+        }
+
+    @staticmethod
+    def _cpu_groups(num_replicas: int) -> List[List[int]]:
+        """Split the available cores into one contiguous group per replica"""
+        cpus = sorted(os.sched_getaffinity(0))
+        num_replicas = max(num_replicas, 1)
+        if num_replicas > len(cpus):
+            logger.warning(
+                f"{num_replicas} CPU replicas requested but only {len(cpus)} cores "
+                f"available; replicas will share cores"
+            )
+            return [cpus] * num_replicas
+        size, extra = divmod(len(cpus), num_replicas)
+        groups = []
+        start = 0
+        for index in range(num_replicas):
+            end = start + size + (1 if index < extra else 0)
+            groups.append(cpus[start:end])
+            start = end
+        return groups
@@ -0,0 +1,196 @@
+"""
+Response cache for PersonaPlex
+Serves exact-repeat deterministic requests without running the model
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """Size- and TTL-bounded cache of generation results
+
+    Keys cover the normalized input, model name, dtype and the effective
+    generation config, so a cached result is only reused for a request
+    that would have produced the same output. Entries live in an in-memory
+    LRU of max_entries; with disk_dir set they are also written to disk and
+    survive restarts, with the oldest files pruned beyond max_disk_entries.
+    """
+
+    # Prune the disk tier every this many writes
+    DISK_PRUNE_INTERVAL = 100
+
+    def __init__(self, config: Dict[str, Any]):
+        """Initialize cache from the response_cache config"""
+        cache_config = config.get('response_cache', {}) or {}
+        self.enabled = bool(cache_config.get('enabled', False))
+        self.max_entries = max(int(cache_config.get('max_entries', 1024)), 1)
+        self.ttl = float(cache_config.get('ttl_seconds', 3600))
+        self.disk_dir = cache_config.get('disk_dir')
+        self.max_disk_entries = max(int(cache_config.get('max_disk_entries', 10000)), 1)
+        self._disk_writes = 0
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'bypassed': 0,
+            'uncacheable': 0
+        }
+        if self.enabled and self.disk_dir:
+            Path(self.disk_dir).mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normalize input text so trivially different repeats share a key"""
+        return re.sub(r"\s+", " ", text).strip()
+
+    def make_key(self, input_text: str, model_name: str, dtype: str,
+                 generation_config: Dict[str, Any],
+                 quantization: Optional[Dict[str, Any]] = None) -> str:
+        """Build the cache key for a request
+
+        quantization describes the weights actually served (mode, and the
+        settings that change int8/int4 outputs), so disk entries written
+        by a differently quantized model are never returned.
+        """
+        payload = json.dumps({
+            'input': self.normalize(input_text),
+            'model': model_name,
+            'dtype': dtype,
+            'quantization': quantization or {'mode': 'none'},
+            'generation_config': generation_config
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached result or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return result
+                del self._entries[key]
+
+        result = self._read_disk(key, now)
+        with self._lock:
+            if result is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            self._stats['disk_hits'] += 1
+            self._insert(key, result, now + self.ttl)
+        return result
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """Cache a successful result"""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._insert(key, result, expires_at)
+        self._write_disk(key, result, expires_at)
+
+    def record_bypass(self):
+        """Count a request that asked to skip the cache"""
+        with self._lock:
+            self._stats['bypassed'] += 1
+
+    def record_uncacheable(self):
+        """Count a request that could not be cached (non-deterministic sampling)"""
+        with self._lock:
+            self._stats['uncacheable'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        stats['enabled'] = self.enabled
+        stats['max_entries'] = self.max_entries
+        stats['disk_dir'] = self.disk_dir
+        return stats
+
+    def _insert(self, key: str, result: Dict[str, Any], expires_at: float):
+        """Insert into the in-memory LRU (lock must be held)"""
+        self._entries[key] = (expires_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_path(self, key: str) -> Path:
+        """Location of an entry in the disk tier"""
+        return Path(self.disk_dir) / key[:2] / f"{key}.json"
+
+    def _read_disk(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        """Load an unexpired entry from the disk tier"""
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Failed to read response cache entry {path}: {e}")
+            return None
+        if entry.get('expires_at', 0) <= now:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            return None
+        return entry['result']
+
+    def _write_disk(self, key: str, result: Dict[str, Any], expires_at: float):
+        """Persist an entry to the disk tier (atomic rename)"""
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'w') as f:
+                json.dump({'expires_at': expires_at, 'result': result}, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Failed to write response cache entry {path}: {e}")
+            return
+
+        with self._lock:
+            self._disk_writes += 1
+            prune = self._disk_writes % self.DISK_PRUNE_INTERVAL == 0
+        if prune:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Delete expired entries and the oldest ones beyond max_disk_entries"""
+        now = time.time()
+        files = []
+        for path in Path(self.disk_dir).glob("*/*.json"):
+            try:
+                mtime = path.stat().st_mtime
+            except OSError:
+                continue
+            # Entries are written with a fixed TTL, so mtime tells expiry
+            if mtime + self.ttl <= now:
+                path.unlink(missing_ok=True)
+            else:
+                files.append((mtime, path))
+        files.sort()
+        for _, path in files[:max(len(files) - self.max_disk_entries, 0)]:
+            path.unlink(missing_ok=True)
@@ -5,20 +5,37 @@ Provides REST API for speech-to-speech conversation
 
 import os
 import sys
+import json
+import time
+import asyncio
 import logging
 import yaml
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable
+from collections import deque
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, UploadFile, File
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import (
+    JSONResponse, StreamingResponse, PlainTextResponse, FileResponse, Response as RawResponse
+)
+from starlette.background import BackgroundTask
+from starlette.formparsers import MultiPartException
+from starlette.websockets import WebSocketState
 from pydantic import BaseModel
 import uvicorn
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from src.model_handler import PersonaPlexModelHandler
+from src.models import ModelRegistry, ModelUnavailableError
+from src import binary
+from src.audio import AudioFormatError
+from src.audio_stream import AudioStream
+from src.executor import InferenceExecutor, QueueFullError
+from src.uploads import UploadSpooler, UploadTooLargeError
+from src.cancellation import CancelToken, get_stats as get_cancellation_stats
+from src.profiling import PROFILER, ProfilingBusyError, profiled
+from src.metrics import REGISTRY, REQUEST_LATENCY, REQUESTS, IN_FLIGHT, ERRORS, AUDIO_SECONDS, AUDIO_STREAM_LATENCY
 
 # Setup logging
 logging.basicConfig(
@@ -27,8 +44,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Global model handler
-model_handler: Optional[PersonaPlexModelHandler] = None
+# Resident models (each with its handler and replica pool)
+models: Optional[ModelRegistry] = None
+inference_executor: Optional[InferenceExecutor] = None
+upload_spooler: Optional[UploadSpooler] = None
 
 
 class TextRequest(BaseModel):
@@ -36,6 +55,57 @@ class TextRequest(BaseModel):
     text: str
     temperature: Optional[float] = None
     max_length: Optional[int] = None
+    session_id: Optional[str] = None
+    seed: Optional[int] = None
+    bypass_cache: bool = False
+    # Seconds until the request is cancelled (capped at server.timeout)
+    timeout: Optional[float] = None
+    # Resident model to use (the default model without one)
+    model: Optional[str] = None
+
+
+class AudioStreamStart(BaseModel):
+    """PCM layout and generation parameters of a streaming audio connection"""
+    sample_rate: Optional[int] = None
+    channels: Optional[int] = None
+    dtype: Optional[str] = None
+    temperature: Optional[float] = None
+    max_length: Optional[int] = None
+    seed: Optional[int] = None
+    model: Optional[str] = None
+
+
+class PrefixRequest(BaseModel):
+    """Shared prompt prefix to prefill into the prefix cache"""
+    text: str
+    model: Optional[str] = None
+
+
+class ModelLoadRequest(BaseModel):
+    """Model to load in the background and swap in
+
+    model and dtype override model.name and model.dtype; overrides
+    replaces keys per config section. name is the registry name requests
+    select the model by (the last part of model.name by default).
+    """
+    name: Optional[str] = None
+    model: Optional[str] = None
+    dtype: Optional[str] = None
+    config_path: Optional[str] = None
+    overrides: Dict[str, Dict[str, Any]] = {}
+    default: bool = True
+
+
+class ProfileRequest(BaseModel):
+    """Profiling window: the next requests generation requests, seconds, or both
+
+    The session ends at whichever limit is reached first (and after
+    profiling.max_seconds at the latest).
+    """
+    requests: Optional[int] = None
+    seconds: Optional[float] = None
+    torch_trace: bool = True
+    stacks: bool = True
 
 
 class Response(BaseModel):
@@ -43,6 +113,9 @@ class Response(BaseModel):
     success: bool
     output: Optional[str] = None
     error: Optional[str] = None
+    session_id: Optional[str] = None
+    audio: Optional[Dict[str, Any]] = None
+    model: Optional[str] = None
 
 
 def load_config() -> Dict[str, Any]:
@@ -63,7 +136,7 @@ def load_config() -> Dict[str, Any]:
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown"""
     # Startup
-    global model_handler
+    global models, inference_executor, upload_spooler
     
     try:
         logger.info("Initializing PersonaPlex model...")
@@ -71,8 +144,11 @@ async def lifespan(app: FastAPI):
         # Ensure we have the full path to the config file, not just the directory
         if os.path.isdir(config_path):
             config_path = os.path.join(config_path, 'config.yaml')
-        model_handler = PersonaPlexModelHandler(config_path=config_path)
-        model_handler.load_model()
+        models = ModelRegistry(config_path)
+        models.start()
+        inference_executor = InferenceExecutor(models.default.config)
+        upload_spooler = UploadSpooler(models.default.config)
+        PROFILER.configure(models.default.config)
         logger.info("Model initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize model: {e}")
@@ -81,9 +157,13 @@ async def lifespan(app: FastAPI):
     yield
     
     # Shutdown
-    if model_handler:
-        logger.info("Shutting down model handler...")
-        model_handler = None
+    if inference_executor:
+        inference_executor.shutdown()
+        inference_executor = None
+    if models:
+        logger.info("Shutting down models...")
+        models.stop()
+        models = None
 
 
 # Initialize FastAPI app with lifespan
@@ -109,10 +189,12 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    if model_handler and model_handler.is_loaded():
+    # A background model load or swap never makes the server unhealthy
+    if models and models.ready:
         return {
             "status": "healthy",
-            "model_loaded": True
+            "model_loaded": True,
+            "model": models.default.name
         }
     else:
         return JSONResponse(
@@ -124,79 +206,1011 @@ async def health_check():
         )
 
 
+@app.middleware("http")
+async def limit_request_size(request: Request, call_next):
+    """Reject bodies declared larger than server.max_request_size before reading them"""
+    if upload_spooler:
+        try:
+            upload_spooler.check_length(request.headers)
+        except UploadTooLargeError as e:
+            return JSONResponse(status_code=413, content={"detail": str(e)})
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Count requests and time them per route template
+
+    For streaming routes the latency covers the time to response headers;
+    per-token timings come from the handler's generation metrics.
+    """
+    start = time.perf_counter()
+    IN_FLIGHT.inc()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        IN_FLIGHT.dec()
+        # Label by the matched template (/sessions/{session_id}) to bound cardinality
+        matched = request.scope.get('route')
+        template = getattr(matched, 'path', 'unmatched')
+        REQUESTS.inc(route=template, status=status)
+        REQUEST_LATENCY.observe(time.perf_counter() - start, route=template, status=status)
+        if status >= 500:
+            ERRORS.inc(type=f"http_{status}")
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text-format metrics"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/info")
-async def get_info():
-    """Get model and system information"""
-    if not model_handler:
-        raise HTTPException(status_code=503, detail="Model not initialized")
-    
-    info = model_handler.get_model_info()
+async def get_info(model: Optional[str] = None):
+    """Get model and system information (of the named model, or the default)"""
+    deployment, release_model = _deployment(model)
+    try:
+        info = deployment.handler.get_model_info()
+        info['replicas'] = deployment.pool.get_stats()
+    finally:
+        release_model()
+    info['models'] = models.get_stats()
+    if inference_executor:
+        info['admission'] = inference_executor.get_stats()
+    if upload_spooler:
+        info['uploads'] = upload_spooler.get_stats()
+    info['cancellation'] = get_cancellation_stats()
     return info
 
 
 @app.post("/generate", response_model=Response)
-async def generate_text(request: TextRequest):
+async def generate_text(request: TextRequest, http_request: Request):
     """Generate response from text input"""
-    if not model_handler or not model_handler.is_loaded():
-        raise HTTPException(status_code=503, detail="Model not loaded")
+    deployment, release_model = _deployment(request.model)
+    handler = deployment.handler
+    future = None
     
     try:
         # Prepare generation parameters
-        gen_kwargs = {}
-        if request.temperature is not None:
-            gen_kwargs['temperature'] = request.temperature
-        if request.max_length is not None:
-            gen_kwargs['max_length'] = request.max_length
+        gen_kwargs = _get_gen_kwargs(request)
+        cancel = _cancel_token(request.timeout)
         
-        # Generate response
-        result = model_handler.generate(
-            input_text=request.text,
-            **gen_kwargs
-        )
+        # Deterministic stateless requests can be answered from the response cache
+        cache_key = None
+        if not request.session_id:
+            if request.bypass_cache:
+                handler.response_cache.record_bypass()
+            else:
+                cache_key = handler.response_cache_key(request.text, **gen_kwargs)
+            if cache_key:
+                cached = handler.response_cache.get(cache_key)
+                if cached is not None:
+                    return Response(success=True, output=cached['output'], model=deployment.name)
+        
+        if request.session_id:
+            # Stateful turns reuse the session's KV cache instead of batching
+            future = _submit(
+                handler.generate_turn, request.session_id, request.text, cancel=cancel, **gen_kwargs
+            )
+        elif request.seed is not None:
+            # Seeded sampling must not depend on which requests share a batch
+            future = _submit(handler.generate, input_text=request.text, cancel=cancel, **gen_kwargs)
+        else:
+            # Generate response (batched with other concurrent requests on
+            # the least loaded replica)
+            release = _admit()
+            try:
+                future = deployment.pool.submit(request.text, cancel=cancel, **gen_kwargs)
+            except Exception:
+                release()
+                raise
+            future.add_done_callback(release)
+        result = await _wait_for_result(future, cancel, http_request)
         
         if result['success']:
+            if cache_key:
+                handler.response_cache.put(cache_key, {'output': result['output']})
             return Response(
                 success=True,
-                output=result['output']
+                output=result['output'],
+                session_id=request.session_id,
+                model=deployment.name
             )
         else:
-            raise HTTPException(
-                status_code=500,
-                detail=result.get('error', 'Generation failed')
-            )
+            raise _generation_failed(result)
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Generation error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        _release_after(future, release_model)
+
+
+@app.post("/generate/stream")
+async def generate_text_stream(request: TextRequest, http_request: Request):
+    """Stream a response from text input as Server-Sent Events"""
+    deployment, release_model = _deployment(request.model)
+    try:
+        _check_streaming_available(deployment.handler)
+        stop_event = _cancel_token(request.timeout)
+        release_slot = _admit()
+    except Exception:
+        release_model()
+        raise
+    
+    def release(*_):
+        release_slot()
+        release_model()
+    
+    stream = deployment.handler.generate_stream(
+        request.text, stop_event=stop_event, **_get_gen_kwargs(request)
+    )
+    
+    async def event_source():
+        try:
+            async for event in _iterate_stream(stream, stop_event):
+                if await http_request.is_disconnected():
+                    logger.info("Stream client disconnected, stopping generation")
+                    stop_event.cancel('client_disconnect')
+                    break
+                yield f"data: {json.dumps(event)}\n\n"
+        except Exception as e:
+            logger.error(f"Streaming error: {e}")
+            yield f"data: {json.dumps({'error': str(e), 'done': True})}\n\n"
+        finally:
+            release()
+    
+    # The background task also releases the slot if the body never started
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(release)
+    )
+
+
+@app.websocket("/ws/generate")
+async def generate_text_websocket(websocket: WebSocket):
+    """Stream responses over a WebSocket
+
+    Each JSON message with the TextRequest fields starts a generation whose
+    chunks are sent back as {"text": ...} messages followed by a final
+    {"done": true, ...} message. Sending {"type": "cancel"} stops the
+    current generation; requests sent while one is streaming are queued
+    and run in order afterwards. Each request is cancelled once its
+    timeout (or server.timeout) passes.
+    """
+    await websocket.accept()
+    
+    # A single reader owns receive() for the whole connection so no message
+    # is lost; requests are queued and None marks the disconnect
+    pending: asyncio.Queue = asyncio.Queue()
+    active: Dict[str, Optional[CancelToken]] = {'stop_event': None}
+    reader = asyncio.create_task(_read_websocket(websocket, pending, active))
+    
+    try:
+        while True:
+            raw_message = await pending.get()
+            if raw_message is None:
+                break
+            
+            release_model = None
+            try:
+                request = TextRequest(**json.loads(raw_message))
+                deployment, release_model = _deployment(request.model)
+                _check_streaming_available(deployment.handler)
+                stop_event = _cancel_token(request.timeout)
+                release = _admit()
+            except Exception as e:
+                if release_model:
+                    release_model()
+                error = {'error': str(e), 'done': True}
+                if isinstance(e, HTTPException):
+                    error['error'] = e.detail
+                    if e.status_code == 429:
+                        error['retry_after'] = int(e.headers['Retry-After'])
+                await websocket.send_json(error)
+                continue
+            
+            active['stop_event'] = stop_event
+            stream = deployment.handler.generate_stream(
+                request.text, stop_event=stop_event, **_get_gen_kwargs(request)
+            )
+            try:
+                async for event in _iterate_stream(stream, stop_event):
+                    if websocket.client_state == WebSocketState.DISCONNECTED:
+                        break
+                    await websocket.send_json(event)
+            except WebSocketDisconnect:
+                break
+            except Exception as e:
+                logger.error(f"WebSocket streaming error: {e}")
+                if websocket.client_state == WebSocketState.DISCONNECTED:
+                    break
+                await websocket.send_json({'error': str(e), 'done': True})
+            finally:
+                active['stop_event'] = None
+                release()
+                release_model()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader.cancel()
+    logger.info("WebSocket client disconnected")
+
+
+async def _read_websocket(websocket: WebSocket, pending: asyncio.Queue,
+                          active: Dict[str, Optional[CancelToken]]):
+    """Read every message on a WebSocket connection
+
+    Cancel messages stop the active generation, a disconnect also stops it
+    and queues None, and anything else is queued as a request.
+    """
+    while True:
+        message = await websocket.receive()
+        if message['type'] == 'websocket.disconnect':
+            if active['stop_event']:
+                active['stop_event'].cancel('client_disconnect')
+            pending.put_nowait(None)
+            return
+        text = message.get('text')
+        if text is None:
+            continue
+        try:
+            is_cancel = json.loads(text).get('type') == 'cancel'
+        except (ValueError, AttributeError):
+            is_cancel = False
+        if is_cancel:
+            # Stale cancels with nothing running are ignored
+            if active['stop_event']:
+                active['stop_event'].cancel('client_cancel')
+        else:
+            pending.put_nowait(text)
+
+
+async def _iterate_stream(stream, stop_event: CancelToken):
+    """Drive a blocking generate_stream iterator from the event loop"""
+    sentinel = object()
+    finished = False
+    try:
+        while True:
+            event = await asyncio.to_thread(next, stream, sentinel)
+            if event is sentinel:
+                finished = True
+                break
+            yield event
+    except Exception:
+        finished = True
+        raise
+    finally:
+        # Stops the generation thread even if the consumer went away early
+        # (e.g. the task was cancelled when the client disconnected)
+        if not finished:
+            stop_event.cancel('client_disconnect')
+        stop_event.set()
+        try:
+            await asyncio.to_thread(stream.close)
+        except ValueError:
+            # Generator is still running in a worker thread; stop_event ends it
+            pass
+
+
+def _deployment(name: Optional[str] = None):
+    """Lease the named (or default) model for one request
+
+    Returns the deployment and its idempotent release function; raises
+    404 for an unknown model and 503 when it cannot take requests.
+    """
+    if not models:
+        raise HTTPException(status_code=503, detail="Model not initialized")
+    try:
+        return models.acquire(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Model not found: {name}")
+    except ModelUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+def _release_after(future, release: Callable[..., None]):
+    """Call release now, or once future finishes if it is still running"""
+    if future is not None and not future.done():
+        future.add_done_callback(release)
+    else:
+        release()
+
+
+def _check_streaming_available(handler):
+    """Raise if streaming is disabled for handler's model"""
+    if not handler.config.get('performance', {}).get('enable_streaming', True):
+        raise HTTPException(status_code=404, detail="Streaming is disabled")
+
+
+def _admit():
+    """Reserve an inference admission slot or raise 429"""
+    try:
+        return inference_executor.admit()
+    except QueueFullError as e:
+        raise _overloaded(e)
+
+
+def _submit(fn, *args, **kwargs):
+    """Submit blocking work to the inference executor or raise 429"""
+    try:
+        return inference_executor.submit(fn, *args, **kwargs)
+    except QueueFullError as e:
+        raise _overloaded(e)
+
+
+def _overloaded(error: QueueFullError) -> HTTPException:
+    """Build the 429 response for a full admission queue"""
+    return HTTPException(
+        status_code=429,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+def _cancel_token(timeout: Optional[float] = None) -> CancelToken:
+    """Cancel token for one request, expiring after timeout (at most server.timeout)"""
+    if timeout is not None and timeout <= 0:
+        raise HTTPException(status_code=400, detail="timeout must be positive")
+    limit = inference_executor.timeout
+    if timeout is None or (limit is not None and timeout > limit):
+        timeout = limit
+    return CancelToken(timeout)
+
+
+async def _wait_for_disconnect(http_request: Request):
+    """Return once the client of http_request disconnects"""
+    while True:
+        message = await http_request.receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def _wait_for_result(future, cancel: Optional[CancelToken] = None,
+                           http_request: Optional[Request] = None) -> Dict[str, Any]:
+    """Await an inference future, raising 504 once server.timeout passes
+
+    With cancel, the deadline is cancel's and the request is cancelled
+    (dropped if still queued, stopped between decode steps if running)
+    when it passes or when the client of http_request disconnects.
+    """
+    if cancel is None:
+        try:
+            return await inference_executor.wait(future)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Generation timed out")
+
+    waiter = asyncio.ensure_future(inference_executor.wait(future, timeout=cancel.remaining()))
+    watchers = {waiter}
+    if http_request is not None:
+        watchers.add(asyncio.ensure_future(_wait_for_disconnect(http_request)))
+    try:
+        await asyncio.wait(watchers, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for watcher in watchers:
+            watcher.cancel()
+
+    if waiter.done() and not waiter.cancelled():
+        if isinstance(waiter.exception(), asyncio.TimeoutError):
+            cancel.cancel('deadline')
+        else:
+            result = waiter.result()
+            if result.get('cancelled') is None:
+                return result
+    else:
+        logger.info("Client disconnected, cancelling generation")
+        cancel.cancel('client_disconnect')
+    if future.cancel():
+        cancel.record('queued')
+    if cancel.reason == 'deadline':
+        raise HTTPException(status_code=504, detail="Generation timed out")
+    # Nobody is listening; 499 (client closed request) only reaches the logs
+    raise HTTPException(status_code=499, detail="Client closed request")
+
+
+def _generation_failed(result: Dict[str, Any]) -> HTTPException:
+    """HTTP error for an unsuccessful generation result
+
+    Requests the memory governor turned away get 413 when they can never
+    fit the budget and 503 with Retry-After when it stayed full.
+    """
+    error = result.get('error', 'Generation failed')
+    if result.get('memory') == 'too_large':
+        return HTTPException(status_code=413, detail=error)
+    if result.get('memory') == 'busy':
+        return HTTPException(status_code=503, detail=error, headers={"Retry-After": str(result['retry_after'])})
+    return HTTPException(status_code=500, detail=error)
+
+
+def _get_gen_kwargs(request: TextRequest) -> Dict[str, Any]:
+    """Extract per-request generation parameters"""
+    gen_kwargs = {}
+    if request.temperature is not None:
+        gen_kwargs['temperature'] = request.temperature
+    if request.max_length is not None:
+        gen_kwargs['max_length'] = request.max_length
+    if request.seed is not None:
+        gen_kwargs['seed'] = request.seed
+    return gen_kwargs
+
+
+@app.get("/replicas")
+async def get_replicas(model: Optional[str] = None):
+    """Per-replica health, load and batching stats"""
+    deployment, release_model = _deployment(model)
+    try:
+        return deployment.pool.get_stats()
+    finally:
+        release_model()
+
+
+@app.post("/replicas/{name}/drain")
+async def drain_replica(name: str, model: Optional[str] = None):
+    """Stop routing new requests to a replica; in-flight requests finish"""
+    deployment, release_model = _deployment(model)
+    try:
+        return deployment.pool.drain(name).get_stats()
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Replica not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    finally:
+        release_model()
+
+
+@app.post("/replicas/{name}/resume")
+async def resume_replica(name: str, model: Optional[str] = None):
+    """Route requests to a drained replica again"""
+    deployment, release_model = _deployment(model)
+    try:
+        return deployment.pool.resume(name).get_stats()
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Replica not found")
+    finally:
+        release_model()
+
+
+@app.get("/admin/models")
+async def list_models():
+    """Resident, loading and draining models"""
+    if not models:
+        raise HTTPException(status_code=503, detail="Model not initialized")
+    return models.get_stats()
+
+
+@app.post("/admin/models", status_code=202)
+async def load_model(request: ModelLoadRequest):
+    """Load a model in the background and swap it in once warmed up
+
+    Poll GET /admin/models/{name} for its state (loading, ready or failed).
+    """
+    if not models:
+        raise HTTPException(status_code=503, detail="Model not initialized")
+    overrides = {section: dict(values) for section, values in request.overrides.items()}
+    if request.model is not None:
+        overrides.setdefault('model', {})['name'] = request.model
+    if request.dtype is not None:
+        overrides.setdefault('model', {})['dtype'] = request.dtype
+    try:
+        deployment = models.load(request.name, request.config_path, overrides, request.default)
+    except (ValueError, OSError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return deployment.get_stats()
+
+
+@app.get("/admin/models/{name}")
+async def get_model(name: str):
+    """State of a resident, loading or recently loaded model"""
+    deployment = models.get(name) if models else None
+    if deployment is None:
+        raise HTTPException(status_code=404, detail="Model not found")
+    return deployment.get_stats()
+
+
+@app.delete("/admin/models/{name}")
+async def unload_model(name: str):
+    """Drain and unload a resident model other than the default"""
+    if not models:
+        raise HTTPException(status_code=503, detail="Model not initialized")
+    try:
+        return models.unload(name).get_stats()
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Model not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/admin/profile")
+async def list_profiles():
+    """Running and kept profiling sessions"""
+    return PROFILER.get_stats()
+
+
+@app.post("/admin/profile", status_code=202)
+async def start_profile(request: ProfileRequest):
+    """Profile the next requests generation requests and/or seconds
+
+    Poll GET /admin/profile/{id} until its state is done, then download
+    its files from GET /admin/profile/{id}/{file}.
+    """
+    if not PROFILER.enabled:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    try:
+        # torch.profiler takes a moment to initialize the first time
+        session = await asyncio.to_thread(
+            PROFILER.start, request.requests, request.seconds, request.torch_trace, request.stacks
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ProfilingBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except OSError as e:
+        raise HTTPException(
+            status_code=500, detail=f"Cannot write profiles to {PROFILER.output_dir} (profiling.output_dir): {e}"
+        )
+    return session.get_stats()
+
+
+@app.delete("/admin/profile")
+async def stop_profile():
+    """End the running profiling session early and write its files"""
+    session = await asyncio.to_thread(PROFILER.stop)
+    if session is None:
+        raise HTTPException(status_code=404, detail="No profiling session is running")
+    return session.get_stats()
+
+
+@app.get("/admin/profile/{session_id}")
+async def get_profile(session_id: str):
+    """State and files of a profiling session"""
+    session = PROFILER.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Profiling session not found")
+    return session.get_stats()
+
+
+@app.get("/admin/profile/{session_id}/{name}")
+async def download_profile(session_id: str, name: str):
+    """Download a file of a finished profiling session"""
+    path = PROFILER.file_path(session_id, name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile file not found")
+    return FileResponse(path, filename=f"{session_id}-{name}")
+
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str, model: Optional[str] = None):
+    """Inspect a conversation session"""
+    deployment, release_model = _deployment(model)
+    try:
+        session = deployment.handler.sessions.get(session_id)
+    finally:
+        release_model()
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str, model: Optional[str] = None):
+    """Delete a conversation session and free its KV cache"""
+    deployment, release_model = _deployment(model)
+    try:
+        deleted = deployment.handler.sessions.delete(session_id)
+    finally:
+        release_model()
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"deleted": True, "session_id": session_id}
+
+
+@app.post("/prefixes")
+async def register_prefix(request: PrefixRequest):
+    """Prefill a persona/system prompt prefix into the prefix KV-cache"""
+    deployment, release_model = _deployment(request.model)
+    future = None
+    try:
+        if not deployment.handler.prefix_cache.enabled:
+            raise HTTPException(status_code=404, detail="Prefix cache is disabled")
+        future = _submit(deployment.handler.register_prefix, request.text)
+        return await _wait_for_result(future)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Prefix registration error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        _release_after(future, release_model)
+
 
+# The multipart body is parsed by UploadSpooler rather than a File()
+# parameter, so the schema is declared here
+AUDIO_UPLOAD_BODY = {
+    "required": True,
+    "content": {
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "properties": {"audio": {"type": "string", "format": "binary"}},
+                "required": ["audio"]
+            }
+        }
+    }
+}
 
-@app.post("/generate/audio")
-async def generate_from_audio(audio: UploadFile = File(...)):
-    """Generate response from audio input"""
-    if not model_handler or not model_handler.is_loaded():
-        raise HTTPException(status_code=503, detail="Model not loaded")
+
+@app.post("/generate/audio", openapi_extra={"requestBody": AUDIO_UPLOAD_BODY})
+async def generate_from_audio(http_request: Request, model: Optional[str] = None):
+    """Generate response from audio input
+
+    The "audio" file part is streamed into a spooled buffer bounded by
+    server.max_request_size (413 once exceeded) and decoded from there in
+    chunks.
+    """
+    deployment, release_model = _deployment(model)
+    handler = deployment.handler
+    future = None
     
     try:
-        # Read audio file
-        audio_data = await audio.read()
+        try:
+            audio = await upload_spooler.read_file(http_request, 'audio')
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except MultiPartException as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except KeyError:
+            raise HTTPException(status_code=422, detail="Missing 'audio' file upload")
+        
+        # Decode, downmix, resample, trim silence and normalize to the model's input format
+        try:
+            segments, vad = await asyncio.to_thread(handler.audio.process_speech, audio.file)
+        except AudioFormatError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        finally:
+            await audio.close()
         
-        # Process audio (simplified - you may need to add audio processing)
-        result = model_handler.generate(input_audio=audio_data)
+        audio_stats = _record_vad(vad, segments)
+        
+        # Silent input never reaches the model
+        if not segments:
+            if handler.audio.vad.on_silence == 'reject':
+                raise HTTPException(status_code=422, detail="No speech detected in audio")
+            return Response(success=True, output="", audio=audio_stats, model=deployment.name)
+        
+        cancel = _cancel_token()
+        future = _submit(_generate_segments, handler, segments, cancel)
+        result = await _wait_for_result(future, cancel, http_request)
         
         if result['success']:
             return Response(
                 success=True,
-                output=result['output']
+                output=result['output'],
+                audio=audio_stats,
+                model=deployment.name
             )
         else:
-            raise HTTPException(
-                status_code=500,
-                detail=result.get('error', 'Generation failed')
-            )
+            raise _generation_failed(result)
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Audio generation error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        _release_after(future, release_model)
+
+
+def _record_vad(vad, segments) -> Optional[Dict[str, Any]]:
+    """Count and log the speech an upload's VAD kept; returns its stats"""
+    if not vad:
+        return None
+    AUDIO_SECONDS.inc(vad.speech_seconds, kind='speech')
+    AUDIO_SECONDS.inc(vad.removed_seconds, kind='removed')
+    logger.info(
+        f"VAD kept {vad.speech_seconds:.2f}s of {vad.input_seconds:.2f}s "
+        f"in {len(segments)} segment(s)"
+    )
+    return vad.to_dict()
+
+
+@profiled('generate_audio')
+def _generate_segments(handler, segments, cancel: Optional[CancelToken] = None, **gen_kwargs) -> Dict[str, Any]:
+    """Generate a response per speech segment, joined in order"""
+    outputs = []
+    for segment in segments:
+        result = handler.generate(input_audio=segment, cancel=cancel, **gen_kwargs)
+        if not result['success']:
+            return result
+        outputs.append(result['output'])
+    return {'output': " ".join(outputs), 'success': True}
+
+
+BINARY_BODY = {
+    "required": True,
+    "content": {
+        content_type: {"schema": {"type": "string", "format": "binary"}}
+        for content_type in (binary.PCM_TYPE, binary.TOKENS_TYPE) + binary.MSGPACK_TYPES
+    }
+}
+
+
+@app.post("/generate/binary", openapi_extra={"requestBody": BINARY_BODY})
+async def generate_binary(http_request: Request, model: Optional[str] = None,
+                          max_length: Optional[int] = None, temperature: Optional[float] = None,
+                          seed: Optional[int] = None, timeout: Optional[float] = None):
+    """Generate from a compact binary body, bypassing JSON and form parsing
+
+    Content-Type selects the body (see src/binary.py): headered raw PCM is
+    answered with the output as UTF-8 text, while token IDs (packed int32
+    or msgpack) skip the tokenizer both ways and are answered with the
+    generated token IDs in the same encoding. Generation parameters come
+    from the query string, or from a msgpack map.
+    """
+    content_type = http_request.headers.get('content-type', '').split(';')[0].strip().lower()
+    if content_type not in (binary.PCM_TYPE, binary.TOKENS_TYPE) + binary.MSGPACK_TYPES:
+        raise HTTPException(status_code=415, detail=f"Unsupported content type: {content_type or 'none'}")
+    if content_type in binary.MSGPACK_TYPES and binary.msgpack is None:
+        raise HTTPException(status_code=415, detail="msgpack is not installed; send packed int32 tokens instead")
+    try:
+        body = await upload_spooler.read_body(http_request)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    params = {'model': model, 'max_length': max_length, 'temperature': temperature,
+              'seed': seed, 'timeout': timeout}
+    try:
+        if content_type == binary.PCM_TYPE:
+            samples, sample_rate = binary.parse_pcm(body)
+        elif content_type == binary.TOKENS_TYPE:
+            token_ids = binary.parse_tokens(body)
+        else:
+            token_ids, body_params = binary.parse_msgpack(body)
+            params.update(body_params)
+    except binary.BinaryFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    deployment, release_model = _deployment(params.pop('model'))
+    handler = deployment.handler
+    future = None
+    try:
+        cancel = _cancel_token(params.pop('timeout'))
+        gen_kwargs = {key: value for key, value in params.items() if value is not None}
+        headers = {"X-Model": deployment.name}
+
+        if content_type == binary.PCM_TYPE:
+            try:
+                segments, vad = await asyncio.to_thread(
+                    lambda: handler.audio.speech_segments(handler.audio.to_float(samples), sample_rate)
+                )
+            except AudioFormatError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            _record_vad(vad, segments)
+            if not segments:
+                if handler.audio.vad.on_silence == 'reject':
+                    raise HTTPException(status_code=422, detail="No speech detected in audio")
+                return PlainTextResponse("", headers=headers)
+            future = _submit(_generate_segments, handler, segments, cancel, **gen_kwargs)
+        else:
+            try:
+                binary.check_token_ids(token_ids, handler.vocab_size())
+            except binary.BinaryFormatError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            future = _submit(
+                handler.generate, input_ids=token_ids, return_ids=True, cancel=cancel, **gen_kwargs
+            )
+        result = await _wait_for_result(future, cancel, http_request)
+        if not result['success']:
+            raise _generation_failed(result)
+
+        if content_type == binary.PCM_TYPE:
+            return PlainTextResponse(result['output'], headers=headers)
+        if content_type == binary.TOKENS_TYPE:
+            return RawResponse(binary.pack_tokens(result['output_ids']), media_type=content_type, headers=headers)
+        return RawResponse(
+            binary.pack_msgpack({'output_ids': result['output_ids'], 'model': deployment.name}),
+            media_type=content_type, headers=headers
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Binary generation error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        _release_after(future, release_model)
+
+
+@app.websocket("/ws/audio")
+async def stream_audio_websocket(websocket: WebSocket):
+    """Full-duplex speech input over a WebSocket
+
+    Binary messages carry raw PCM laid out as audio.pcm describes, unless a
+    leading {"type": "start", ...} message (AudioStreamStart fields) sets
+    the layout and generation parameters. Audio is consumed in
+    audio.chunk_size-frame chunks into a ring buffer of the most recent
+    audio.stream.window_ms. Once audio.stream.min_context_ms is buffered a
+    response is generated from the window while audio keeps arriving, and
+    generated again from the newer window when it finishes.
+
+    Responses are sent as {"type": "text", "response": n, ...} messages and
+    a {"type": "done", ...} message. {"type": "end"} marks the last frame of
+    an utterance: its window is set aside, a partial response still running
+    is stopped, and a final response is generated whose done message
+    carries latency_ms from the last audio frame to the first response
+    message. Audio for the next utterance may be sent straight away.
+    {"type": "cancel"} stops the current response.
+    """
+    await websocket.accept()
+    try:
+        audio_stream = _audio_stream(None)
+    except HTTPException as e:
+        await websocket.send_json({'type': 'error', 'error': e.detail})
+        await websocket.close()
+        return
+
+    state: Dict[str, Any] = {
+        'stream': audio_stream,
+        'model': None,
+        'gen_kwargs': {},
+        # Finished utterances waiting for their final response
+        'utterances': deque(),
+        'stop_event': None
+    }
+    wake = asyncio.Event()
+    await websocket.send_json({'type': 'ready', **state['stream'].get_stats()})
+    responder = asyncio.create_task(_respond_to_audio(websocket, state, wake))
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            stream: AudioStream = state['stream']
+            data = message.get('bytes')
+            if data is not None:
+                if stream.feed(data):
+                    wake.set()
+                continue
+
+            try:
+                control = json.loads(message.get('text') or '{}')
+                kind = control.pop('type', None)
+                if kind == 'start':
+                    if stream.ring.total_written:
+                        raise ValueError("start must precede the audio of an utterance")
+                    start = AudioStreamStart(**control)
+                    state['stream'] = _audio_stream(start.model, start.sample_rate, start.channels, start.dtype)
+                    state['model'] = start.model
+                    state['gen_kwargs'] = _get_gen_kwargs(start)
+                    await websocket.send_json({'type': 'ready', **state['stream'].get_stats()})
+                elif kind == 'end':
+                    stream.flush()
+                    if not len(stream.ring):
+                        raise ValueError("No audio received")
+                    window, last_frame_at = stream.take()
+                    state['utterances'].append((window, stream.sample_rate, last_frame_at))
+                    stream.reset()
+                    # The final response should not wait behind a stale partial one
+                    if state['stop_event']:
+                        state['stop_event'].cancel('superseded')
+                    wake.set()
+                elif kind == 'cancel':
+                    if state['stop_event']:
+                        state['stop_event'].cancel('client_cancel')
+                else:
+                    raise ValueError(f"Unknown message type: {kind}")
+            except Exception as e:
+                error = e.detail if isinstance(e, HTTPException) else str(e)
+                await websocket.send_json({'type': 'error', 'error': error})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if state['stop_event']:
+            state['stop_event'].cancel('client_disconnect')
+        responder.cancel()
+    logger.info("Audio WebSocket client disconnected")
+
+
+def _audio_stream(model: Optional[str], *args) -> AudioStream:
+    """Audio input stream for the named (or default) model"""
+    deployment, release_model = _deployment(model)
+    try:
+        _check_streaming_available(deployment.handler)
+        return AudioStream(deployment.handler.audio, deployment.config, *args)
+    finally:
+        release_model()
+
+
+async def _respond_to_audio(websocket: WebSocket, state: Dict[str, Any], wake: asyncio.Event):
+    """Generate responses for a /ws/audio connection as audio arrives"""
+    response_id = 0
+    while True:
+        await wake.wait()
+        wake.clear()
+        stream: AudioStream = state['stream']
+        final = bool(state['utterances'])
+        if final:
+            window, sample_rate, last_frame_at = state['utterances'].popleft()
+        elif stream.ready:
+            # Copied here, where the reader cannot write to the ring concurrently
+            window, last_frame_at = stream.take()
+            sample_rate = stream.sample_rate
+        else:
+            continue
+
+        release_model = None
+        try:
+            deployment, release_model = _deployment(state['model'])
+            samples = await asyncio.to_thread(deployment.handler.audio.finish, window, sample_rate)
+            if state['utterances'] and not final:
+                # The utterance ended meanwhile; answer that instead
+                release_model()
+                wake.set()
+                continue
+            release = _admit()
+        except HTTPException as e:
+            if release_model:
+                release_model()
+            error = {'type': 'error', 'error': e.detail, 'final': final}
+            if e.status_code == 429:
+                error['retry_after'] = int(e.headers['Retry-After'])
+            await websocket.send_json(error)
+            continue
+        except Exception as e:
+            # e.g. resampling failed or the model was unloaded meanwhile;
+            # the task must survive to answer later audio
+            logger.error(f"Audio streaming error: {e}")
+            if release_model:
+                release_model()
+            if websocket.client_state == WebSocketState.DISCONNECTED:
+                return
+            await websocket.send_json({'type': 'error', 'error': str(e), 'final': final})
+            continue
+
+        response_id += 1
+        stop_event = _cancel_token()
+        state['stop_event'] = stop_event
+        latency_ms = None
+        generation = deployment.handler.generate_stream(
+            input_audio=samples, stop_event=stop_event, **state['gen_kwargs']
+        )
+        try:
+            async for event in _iterate_stream(generation, stop_event):
+                if latency_ms is None:
+                    latency_ms = (time.perf_counter() - last_frame_at) * 1000
+                    if final:
+                        AUDIO_STREAM_LATENCY.observe(latency_ms / 1000)
+                event.update(response=response_id, final=final)
+                if event.get('done'):
+                    event.update(
+                        type='done', latency_ms=latency_ms,
+                        audio_ms=len(window) * 1000 / sample_rate
+                    )
+                else:
+                    event['type'] = 'text'
+                await websocket.send_json(event)
+        except Exception as e:
+            logger.error(f"Audio streaming error: {e}")
+            if websocket.client_state == WebSocketState.DISCONNECTED:
+                return
+            await websocket.send_json({'type': 'error', 'error': str(e), 'response': response_id, 'final': final})
+        finally:
+            state['stop_event'] = None
+            release()
+            release_model()
+
+        if state['utterances'] or state['stream'].ready:
+            # Audio (or the end of an utterance) arrived while this response ran
+            wake.set()
 
 
 def main():
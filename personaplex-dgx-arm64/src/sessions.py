@@ -0,0 +1,239 @@
+"""
+Conversation sessions for PersonaPlex
+Keeps each conversation's token history and KV cache between turns
+"""
+
+import time
+import threading
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List
+
+import torch
+
+from src.prefix_cache import cache_nbytes, move_cache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Session:
+    """State of one multi-turn conversation"""
+    session_id: str
+    token_ids: List[int] = field(default_factory=list)
+    past_key_values: Any = None
+    nbytes: int = 0
+    offloaded: bool = False
+    turns: int = 0
+    created_at: float = field(default_factory=time.time)
+    last_access: float = field(default_factory=time.time)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def describe(self) -> Dict[str, Any]:
+        """Summary used by the inspect endpoint"""
+        return {
+            'session_id': self.session_id,
+            'turns': self.turns,
+            'tokens': len(self.token_ids),
+            'cached_tokens': self.cached_tokens,
+            'cache_bytes': self.nbytes,
+            'cache_location': (
+                'none' if self.past_key_values is None
+                else 'host' if self.offloaded else 'device'
+            ),
+            'created_at': self.created_at,
+            'last_access': self.last_access
+        }
+
+    @property
+    def cached_tokens(self) -> int:
+        """Number of history tokens covered by the KV cache"""
+        if self.past_key_values is None:
+            return 0
+        if hasattr(self.past_key_values, 'get_seq_length'):
+            return int(self.past_key_values.get_seq_length())
+        return int(self.past_key_values[0][0].shape[-2])
+
+
+class SessionStore:
+    """Server-side store of conversation sessions
+
+    Sessions expire after idle_ttl_seconds without a turn. KV caches are
+    kept on the model device up to max_memory_mb; beyond that the least
+    recently used caches are offloaded to host RAM (offload_to_host, up to
+    max_host_memory_mb) or dropped. A session whose cache was dropped keeps
+    its token history and simply re-prefills it on the next turn.
+    """
+
+    def __init__(self, config: Dict[str, Any], device: torch.device):
+        """Initialize store from the sessions config"""
+        session_config = config.get('sessions', {}) or {}
+        self.enabled = bool(session_config.get('enabled', True))
+        self.idle_ttl = float(session_config.get('idle_ttl_seconds', 1800))
+        self.max_sessions = int(session_config.get('max_sessions', 1000))
+        self.max_memory_bytes = int(float(session_config.get('max_memory_mb', 1024)) * 1024 * 1024)
+        self.offload_to_host = bool(session_config.get('offload_to_host', True))
+        self.max_host_memory_bytes = int(
+            float(session_config.get('max_host_memory_mb', 4096)) * 1024 * 1024
+        )
+        self.device = device
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'created': 0,
+            'expired': 0,
+            'deleted': 0,
+            'offloaded': 0,
+            'restored': 0,
+            'caches_dropped': 0,
+            'prefill_tokens_saved': 0
+        }
+
+    def acquire(self, session_id: str) -> Session:
+        """Get (or create) a session and lock it for one turn
+
+        Turns of the same session are serialized; the caller must call
+        release() when the turn is done. The session's KV cache is moved
+        back to the model device if it had been offloaded.
+        """
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = Session(session_id)
+                self._sessions[session_id] = session
+                self._stats['created'] += 1
+                while len(self._sessions) > self.max_sessions:
+                    if not self._evict_session():
+                        break
+            self._sessions.move_to_end(session_id)
+
+        session.lock.acquire()
+        session.last_access = time.time()
+        if session.past_key_values is not None and session.offloaded:
+            session.past_key_values = move_cache(session.past_key_values, self.device)
+            session.offloaded = False
+            with self._lock:
+                self._stats['restored'] += 1
+        return session
+
+    def release(self, session: Session, token_ids: Optional[List[int]] = None,
+                past_key_values: Any = None, prefill_tokens_saved: int = 0):
+        """Store the state of a finished turn and unlock the session"""
+        try:
+            if token_ids is not None:
+                session.token_ids = token_ids
+                session.past_key_values = past_key_values
+                session.nbytes = cache_nbytes(past_key_values) if past_key_values is not None else 0
+                session.offloaded = False
+                session.turns += 1
+            session.last_access = time.time()
+            with self._lock:
+                self._stats['prefill_tokens_saved'] += prefill_tokens_saved
+        finally:
+            session.lock.release()
+        with self._lock:
+            self._enforce_memory_budget()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Describe a session, or None if it does not exist"""
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            return session.describe() if session else None
+
+    def delete(self, session_id: str) -> bool:
+        """Delete a session and free its KV cache"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return False
+            self._stats['deleted'] += 1
+        session.past_key_values = None
+        return True
+
+    def clear(self):
+        """Delete every session"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.past_key_values = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get store statistics"""
+        with self._lock:
+            self._expire()
+            stats = dict(self._stats)
+            stats['active_sessions'] = len(self._sessions)
+            stats['device_memory_bytes'] = self._memory_bytes(offloaded=False)
+            stats['host_memory_bytes'] = self._memory_bytes(offloaded=True)
+        stats['max_memory_bytes'] = self.max_memory_bytes
+        stats['max_host_memory_bytes'] = self.max_host_memory_bytes
+        return stats
+
+    def _memory_bytes(self, offloaded: bool) -> int:
+        """Total cache bytes on device or host (lock must be held)"""
+        return sum(
+            session.nbytes for session in self._sessions.values()
+            if session.past_key_values is not None and session.offloaded == offloaded
+        )
+
+    def _expire(self):
+        """Drop sessions idle for longer than the TTL (lock must be held)"""
+        cutoff = time.time() - self.idle_ttl
+        for session_id, session in list(self._sessions.items()):
+            if session.last_access >= cutoff:
+                # Sessions are in LRU order, so the rest are newer
+                break
+            if session.lock.locked():
+                continue
+            del self._sessions[session_id]
+            session.past_key_values = None
+            self._stats['expired'] += 1
+
+    def _evict_session(self) -> bool:
+        """Remove the least recently used idle session (lock must be held)"""
+        for session_id, session in self._sessions.items():
+            if not session.lock.locked():
+                del self._sessions[session_id]
+                session.past_key_values = None
+                self._stats['expired'] += 1
+                return True
+        return False
+
+    def _enforce_memory_budget(self):
+        """Offload or drop LRU caches until within budget (lock must be held)"""
+        device_bytes = self._memory_bytes(offloaded=False)
+        host_bytes = self._memory_bytes(offloaded=True)
+        on_host = self.device.type == 'cpu'
+
+        for session in list(self._sessions.values()):
+            if device_bytes <= self.max_memory_bytes:
+                break
+            if session.past_key_values is None or session.offloaded or session.lock.locked():
+                continue
+            device_bytes -= session.nbytes
+            # Offloading is only meaningful when the model lives off-host
+            if (self.offload_to_host and not on_host
+                    and host_bytes + session.nbytes <= self.max_host_memory_bytes):
+                session.past_key_values = move_cache(session.past_key_values, torch.device('cpu'))
+                session.offloaded = True
+                host_bytes += session.nbytes
+                self._stats['offloaded'] += 1
+            else:
+                session.past_key_values = None
+                session.nbytes = 0
+                self._stats['caches_dropped'] += 1
+
+        for session in list(self._sessions.values()):
+            if host_bytes <= self.max_host_memory_bytes:
+                break
+            if session.past_key_values is None or not session.offloaded or session.lock.locked():
+                continue
+            host_bytes -= session.nbytes
+            session.past_key_values = None
+            session.nbytes = 0
+            session.offloaded = False
+            self._stats['caches_dropped'] += 1
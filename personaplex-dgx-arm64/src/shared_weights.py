@@ -0,0 +1,138 @@
+"""
+Shared memory-mapped weights for PersonaPlex
+Lets several uvicorn worker processes map one read-only copy of the model
+"""
+
+import os
+import json
+import fcntl
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any, Callable
+
+import torch
+from safetensors import safe_open
+from safetensors.torch import save_file, load_file
+from transformers import AutoConfig, AutoModelForCausalLM, GenerationConfig
+
+logger = logging.getLogger(__name__)
+
+# safetensors metadata key mapping tied tensor names to the stored name
+ALIASES_KEY = "personaplex.aliases"
+
+
+class SharedWeights:
+    """Converts model weights once to safetensors and maps them per process
+
+    The first worker to start takes an exclusive file lock, loads the model
+    the normal way and writes every parameter and buffer in the serving
+    dtype to one safetensors file. Every worker (including the first) then
+    builds the model on the meta device and assigns tensors that are
+    memory-mapped from that file, so the weight pages live once in the page
+    cache and are shared read-only by all processes.
+
+    Only meaningful for CPU serving: on CUDA each process still copies the
+    weights to the device.
+    """
+
+    def __init__(self, config: Dict[str, Any], model_source: str):
+        """Initialize from the performance.shared_weights config"""
+        shared_config = config.get('performance', {}).get('shared_weights', {}) or {}
+        self.enabled = bool(shared_config.get('enabled', False))
+        self.model_source = model_source
+        self.shared_dir = shared_config.get('dir') or os.path.join(model_source, 'shared_weights')
+
+    def weights_path(self, dtype: torch.dtype) -> str:
+        """Location of the converted weights for a dtype"""
+        return os.path.join(self.shared_dir, f"model-{str(dtype).replace('torch.', '')}.safetensors")
+
+    def load(self, dtype: torch.dtype, load_fn: Callable[[], torch.nn.Module]) -> torch.nn.Module:
+        """Return a model whose weights are mapped from the shared file
+
+        load_fn loads the model conventionally; it is only called by the
+        process that performs the one-time conversion.
+        """
+        path = self.weights_path(dtype)
+        with self._conversion_lock():
+            if not os.path.exists(path):
+                logger.info(f"Converting weights to shared format: {path}")
+                model = load_fn()
+                self._convert(model, path)
+                del model
+        return self._map(path, dtype)
+
+    @contextmanager
+    def _conversion_lock(self):
+        """Exclusive lock serializing the conversion across processes"""
+        os.makedirs(self.shared_dir, exist_ok=True)
+        with open(os.path.join(self.shared_dir, '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _convert(self, model: torch.nn.Module, path: str):
+        """Write all parameters and buffers (tied tensors once) to path"""
+        tensors = {}
+        aliases = {}
+        stored_by_ptr = {}
+        for name, tensor in _named_tensors(model):
+            ptr = (tensor.data_ptr(), tensor.shape, tensor.dtype)
+            if ptr in stored_by_ptr:
+                aliases[name] = stored_by_ptr[ptr]
+                continue
+            stored_by_ptr[ptr] = name
+            tensors[name] = tensor.detach().cpu().contiguous()
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        save_file(tensors, tmp_path, metadata={ALIASES_KEY: json.dumps(aliases)})
+        os.replace(tmp_path, path)
+
+    def _map(self, path: str, dtype: torch.dtype) -> torch.nn.Module:
+        """Build the model on the meta device and assign mmap-backed tensors"""
+        model_config = AutoConfig.from_pretrained(
+            self.model_source, trust_remote_code=True, local_files_only=True
+        )
+        with torch.device('meta'):
+            model = AutoModelForCausalLM.from_config(
+                model_config, torch_dtype=dtype, trust_remote_code=True
+            )
+        try:
+            model.generation_config = GenerationConfig.from_pretrained(
+                self.model_source, local_files_only=True
+            )
+        except Exception as e:
+            logger.warning(f"Generation config not available: {e}")
+
+        with safe_open(path, framework="pt") as f:
+            aliases = json.loads((f.metadata() or {}).get(ALIASES_KEY, '{}'))
+        # load_file maps the file; CPU tensors of the stored dtype are views
+        # of the mapping rather than private copies
+        tensors = load_file(path)
+        for name, source in aliases.items():
+            tensors[name] = tensors[source]
+
+        missing = [name for name, _ in _named_tensors(model) if name not in tensors]
+        if missing:
+            raise RuntimeError(f"Shared weights {path} are missing tensors: {missing[:5]}")
+        for name, tensor in tensors.items():
+            _assign(model, name, tensor)
+        logger.info(f"Mapped shared weights from {path}")
+        return model
+
+
+def _named_tensors(model: torch.nn.Module):
+    """All parameters and buffers, including tied and non-persistent ones"""
+    yield from model.named_parameters(remove_duplicate=False)
+    yield from model.named_buffers(remove_duplicate=False)
+
+
+def _assign(model: torch.nn.Module, name: str, tensor: torch.Tensor):
+    """Replace a parameter or buffer in place without copying"""
+    module_name, _, attr = name.rpartition('.')
+    module = model.get_submodule(module_name) if module_name else model
+    if attr in module._parameters:
+        module._parameters[attr] = torch.nn.Parameter(tensor, requires_grad=False)
+    else:
+        module._buffers[attr] = tensor
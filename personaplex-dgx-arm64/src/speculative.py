@@ -0,0 +1,195 @@
+"""
+Speculative decoding for PersonaPlex
+A small draft model proposes tokens that the main model verifies in one
+forward pass, with acceptance tracking and automatic fallback
+"""
+
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Any
+
+import torch
+from transformers import AutoModelForCausalLM
+
+from src.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DRAFT_TOKENS = REGISTRY.counter(
+    'personaplex_speculative_draft_tokens_total', 'Draft tokens proposed, by whether the main model accepted them',
+    ['outcome']
+)
+ACCEPTANCE_RATE = REGISTRY.gauge(
+    'personaplex_speculative_acceptance_rate', 'Draft-token acceptance rate over the recent request window'
+)
+
+
+@dataclass
+class Speculation:
+    """Generate kwargs and step counts of one speculative generation
+
+    steps counts main-model forward passes and proposed counts draft
+    forward passes (one proposed token each); set tokens to the number of
+    tokens generated before the context exits.
+    """
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+    steps: int = 0
+    proposed: int = 0
+    tokens: int = 0
+
+    @property
+    def accepted(self) -> int:
+        # Every verification step adds the accepted draft tokens plus one
+        # token from the main model
+        return min(max(self.tokens - self.steps, 0), self.proposed)
+
+
+class SpeculativeDecoder:
+    """Assisted generation with a small draft model
+
+    With performance.speculative.enabled, draft_model (a local path or hub
+    id sharing the main model's tokenizer) is loaded next to the main
+    model. Single text prompts then generate through transformers'
+    assisted decoding: the draft proposes up to num_draft_tokens tokens
+    (schedule "constant", or "heuristic" to adapt per request) and the main
+    model verifies them in one forward pass, so greedy output is unchanged.
+    When the acceptance rate over the last window requests drops below
+    min_acceptance, the next retry_after requests decode without the
+    draft before speculation is tried again.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """Initialize from the performance config"""
+        speculative_config = config.get('performance', {}).get('speculative', {}) or {}
+        self.enabled = bool(speculative_config.get('enabled', False))
+        self.draft_name = speculative_config.get('draft_model')
+        if self.enabled and not self.draft_name:
+            raise ValueError("performance.speculative.draft_model is required when speculative decoding is enabled")
+        self.num_draft_tokens = max(int(speculative_config.get('num_draft_tokens', 5)), 1)
+        self.schedule = speculative_config.get('schedule', 'constant')
+        if self.schedule not in ('constant', 'heuristic'):
+            raise ValueError(f"performance.speculative.schedule must be 'constant' or 'heuristic', not {self.schedule!r}")
+        self.confidence_threshold = speculative_config.get('confidence_threshold')
+        self.min_acceptance = float(speculative_config.get('min_acceptance', 0.3))
+        self.window = max(int(speculative_config.get('window', 20)), 1)
+        self.retry_after = max(int(speculative_config.get('retry_after', 100)), 0)
+
+        self.draft = None
+        self._lock = threading.Lock()
+        # Speculation in progress, by the thread running its generate call
+        self._running: Dict[int, Speculation] = {}
+        self._recent: deque = deque(maxlen=self.window)
+        self._fallback_remaining = 0
+        self.stats = {
+            'speculative_requests': 0, 'fallback_requests': 0, 'fallbacks': 0,
+            'steps': 0, 'proposed': 0, 'accepted': 0, 'tokens': 0
+        }
+
+    def load(self, source: str, main_model, dtype: torch.dtype, device: torch.device):
+        """Load the draft model from a local directory and attach it to main_model"""
+        draft = AutoModelForCausalLM.from_pretrained(
+            source, torch_dtype=dtype, trust_remote_code=True, local_files_only=True
+        ).to(device).eval()
+        if draft.config.vocab_size != main_model.config.vocab_size:
+            logger.warning(
+                f"Draft model vocabulary ({draft.config.vocab_size}) does not match the main model "
+                f"({main_model.config.vocab_size}); speculative decoding disabled"
+            )
+            self.enabled = False
+            return
+        draft.generation_config.num_assistant_tokens = self.num_draft_tokens
+        draft.generation_config.num_assistant_tokens_schedule = self.schedule
+        if self.confidence_threshold is not None:
+            draft.generation_config.assistant_confidence_threshold = float(self.confidence_threshold)
+        draft.register_forward_hook(self._count('proposed'))
+        main_model.register_forward_hook(self._count('steps'))
+        self.draft = draft
+        logger.info(f"Loaded draft model {self.draft_name} ({sum(p.numel() for p in draft.parameters()) / 1e6:.1f}M parameters)")
+
+    def _count(self, attribute: str):
+        """Forward hook adding one to attribute of the calling thread's speculation"""
+        def hook(module, args, output):
+            speculation = self._running.get(threading.get_ident())
+            if speculation is not None:
+                setattr(speculation, attribute, getattr(speculation, attribute) + 1)
+        return hook
+
+    @property
+    def active(self) -> bool:
+        return self.enabled and self.draft is not None
+
+    def _should_speculate(self) -> bool:
+        with self._lock:
+            if self._fallback_remaining:
+                self._fallback_remaining -= 1
+                self.stats['fallback_requests'] += 1
+                return False
+            return True
+
+    @contextmanager
+    def run(self, allowed: bool = True):
+        """Speculation for one generate call made inside the context
+
+        Yields a Speculation whose kwargs go to generate (empty when the
+        draft is not used); set its tokens before leaving the context.
+        """
+        if not (allowed and self.active and self._should_speculate()):
+            yield Speculation()
+            return
+        speculation = Speculation(kwargs={'assistant_model': self.draft})
+        ident = threading.get_ident()
+        self._running[ident] = speculation
+        try:
+            yield speculation
+        finally:
+            del self._running[ident]
+            self._record(speculation)
+
+    def _record(self, speculation: Speculation):
+        """Add one generation to the stats and fall back if acceptance is low"""
+        if not speculation.steps:
+            return
+        accepted = speculation.accepted
+        DRAFT_TOKENS.inc(accepted, outcome='accepted')
+        DRAFT_TOKENS.inc(speculation.proposed - accepted, outcome='rejected')
+        with self._lock:
+            self.stats['speculative_requests'] += 1
+            self.stats['steps'] += speculation.steps
+            self.stats['proposed'] += speculation.proposed
+            self.stats['accepted'] += accepted
+            self.stats['tokens'] += speculation.tokens
+            self._recent.append((accepted, speculation.proposed))
+            proposed = sum(p for _, p in self._recent)
+            rate = sum(a for a, _ in self._recent) / proposed if proposed else 0.0
+            ACCEPTANCE_RATE.set(rate)
+            if len(self._recent) == self.window and rate < self.min_acceptance and self.retry_after:
+                logger.warning(
+                    f"Draft acceptance {rate:.0%} is below {self.min_acceptance:.0%}; "
+                    f"decoding the next {self.retry_after} requests without the draft model"
+                )
+                self.stats['fallbacks'] += 1
+                self._fallback_remaining = self.retry_after
+                self._recent.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Acceptance rate, tokens per step and fallback state"""
+        if not self.enabled:
+            return {'enabled': False}
+        with self._lock:
+            stats = dict(self.stats)
+            recent_proposed = sum(p for _, p in self._recent)
+            stats.update({
+                'enabled': True,
+                'draft_model': self.draft_name,
+                'num_draft_tokens': self.num_draft_tokens,
+                'acceptance_rate': stats['accepted'] / stats['proposed'] if stats['proposed'] else None,
+                'recent_acceptance_rate': (
+                    sum(a for a, _ in self._recent) / recent_proposed if recent_proposed else None
+                ),
+                'tokens_per_step': stats['tokens'] / stats['steps'] if stats['steps'] else None,
+                'falling_back': self._fallback_remaining > 0
+            })
+        return stats
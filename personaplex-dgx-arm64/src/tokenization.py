@@ -0,0 +1,245 @@
+"""
+Tokenization service for PersonaPlex
+Batches concurrent encode calls, caches the encodings of hot prompts and
+detokenizes generated tokens incrementally
+"""
+
+import threading
+import logging
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Sequence, Tuple
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# What decode produces for an incomplete UTF-8 sequence, e.g. the first
+# SentencePiece byte-fallback pieces (<0xE2><0x82>) of a multi-byte character
+REPLACEMENT_CHAR = '\ufffd'
+
+
+class IncrementalDetokenizer:
+    """Turns a growing token sequence into the text each new token adds
+
+    Each push decodes a short window - the tokens behind the last emitted
+    text plus the new ones - and emits what the new tokens add to it, so a
+    stream of n tokens costs O(n) decoding instead of re-decoding the whole
+    sequence every step. Decoding with that context keeps the space of
+    SentencePiece word-boundary pieces ("▁word"), which a decode of the new
+    token alone would strip, and text ending in U+FFFD is held back until
+    the rest of its byte-fallback sequence arrives. The emitted pieces add
+    up to decoding all the tokens at once.
+    """
+
+    def __init__(self, decoder, skip_special_tokens: bool = True):
+        """decoder is a tokenizer or processor with a decode method"""
+        self.decoder = decoder
+        self.skip_special_tokens = skip_special_tokens
+        self.token_ids: List[int] = []
+        # token_ids[prefix_offset:read_offset] produced the last emitted text
+        self._prefix_offset = 0
+        self._read_offset = 0
+
+    def _decode(self, token_ids: Sequence[int]) -> str:
+        return self.decoder.decode(token_ids, skip_special_tokens=self.skip_special_tokens)
+
+    def push(self, token_ids: Sequence[int]) -> str:
+        """Add generated tokens; returns the text they complete (may be empty)"""
+        self.token_ids.extend(token_ids)
+        prefix_text = self._decode(self.token_ids[self._prefix_offset:self._read_offset])
+        new_text = self._decode(self.token_ids[self._prefix_offset:])
+        if len(new_text) <= len(prefix_text) or new_text.endswith(REPLACEMENT_CHAR):
+            return ''
+        self._prefix_offset = self._read_offset
+        self._read_offset = len(self.token_ids)
+        return new_text[len(prefix_text):]
+
+    def flush(self) -> str:
+        """Text of tokens still held back (e.g. a truncated byte sequence at the end)"""
+        if self._read_offset >= len(self.token_ids):
+            return ''
+        prefix_text = self._decode(self.token_ids[self._prefix_offset:self._read_offset])
+        new_text = self._decode(self.token_ids[self._prefix_offset:])
+        self._prefix_offset = self._read_offset = len(self.token_ids)
+        return new_text[len(prefix_text):]
+
+
+class _PendingEncode:
+    """An encode call waiting for (or leading) a batch"""
+
+    def __init__(self, text: str, add_special_tokens: bool):
+        self.text = text
+        self.add_special_tokens = add_special_tokens
+        self.token_ids: Optional[List[int]] = None
+        self.error: Optional[Exception] = None
+        self.done = False
+        # Set when the result is in, or when this call is handed the lead
+        self.wake = threading.Event()
+
+
+class TokenizerService:
+    """Encoding and decoding for a handler's tokenizer
+
+    Concurrent encode() calls are batched without a wait: the first caller
+    encodes its text straight away, and callers arriving meanwhile queue
+    up and are encoded together in one batched tokenizer call by the next
+    caller in line. Encodings of recent texts (persona/system prompts
+    repeat verbatim) are kept in an LRU cache of
+    performance.tokenizer.cache_size entries.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """Initialize from the performance config"""
+        tokenizer_config = config.get('performance', {}).get('tokenizer', {}) or {}
+        self.batching = bool(tokenizer_config.get('batching', True))
+        self.max_batch_size = max(int(tokenizer_config.get('max_batch_size', 64)), 1)
+        self.cache_size = max(int(tokenizer_config.get('cache_size', 1024)), 0)
+        self.cache_max_chars = int(tokenizer_config.get('cache_max_chars', 16384))
+        self.tokenizer = None
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, bool], Tuple[int, ...]]" = OrderedDict()
+        self._pending: List[_PendingEncode] = []
+        self._leading = False
+        self._stats = {
+            'encodes': 0,
+            'cache_hits': 0,
+            'batches': 0,
+            'batched_texts': 0,
+            'max_batch_size_seen': 0
+        }
+
+    def attach(self, tokenizer):
+        """Serve tokenizer (None after an unload); clears the cache"""
+        self.tokenizer = tokenizer
+        self.clear()
+
+    def clear(self):
+        """Drop all cached encodings"""
+        with self._lock:
+            self._cache.clear()
+
+    def _cached(self, text: str, add_special_tokens: bool) -> Optional[List[int]]:
+        key = (text, add_special_tokens)
+        with self._lock:
+            self._stats['encodes'] += 1
+            token_ids = self._cache.get(key)
+            if token_ids is None:
+                return None
+            self._cache.move_to_end(key)
+            self._stats['cache_hits'] += 1
+        return list(token_ids)
+
+    def _remember(self, text: str, add_special_tokens: bool, token_ids: List[int]):
+        if not self.cache_size or len(text) > self.cache_max_chars:
+            return
+        with self._lock:
+            self._cache[(text, add_special_tokens)] = tuple(token_ids)
+            self._cache.move_to_end((text, add_special_tokens))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _tokenize(self, texts: List[str], add_special_tokens: bool) -> List[List[int]]:
+        """One tokenizer call; never pads, so the shared tokenizer state is untouched"""
+        return self.tokenizer(texts, add_special_tokens=add_special_tokens)['input_ids']
+
+    def encode(self, text: str, add_special_tokens: bool = True) -> List[int]:
+        """Token IDs of text, from the cache or batched with concurrent calls"""
+        token_ids = self._cached(text, add_special_tokens)
+        if token_ids is not None:
+            return token_ids
+        if not self.batching:
+            token_ids = self._tokenize([text], add_special_tokens)[0]
+        else:
+            token_ids = self._encode_batched(_PendingEncode(text, add_special_tokens))
+        self._remember(text, add_special_tokens, token_ids)
+        return token_ids
+
+    def _encode_batched(self, request: _PendingEncode) -> List[int]:
+        """Queue request and wait for it, leading the batch when first in line"""
+        with self._lock:
+            self._pending.append(request)
+            leading = not self._leading
+            self._leading = True
+        if not leading:
+            request.wake.wait()
+        # Either first in an idle queue or handed the lead; this request is
+        # at the head of the queue, so it is part of the batch run now
+        if not request.done:
+            self._run_batch()
+        if request.error is not None:
+            raise request.error
+        return request.token_ids
+
+    def _run_batch(self):
+        """Encode the head of the queue, then pass the lead on (or release it)"""
+        with self._lock:
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            self._stats['batches'] += 1
+            self._stats['batched_texts'] += len(batch)
+            self._stats['max_batch_size_seen'] = max(self._stats['max_batch_size_seen'], len(batch))
+
+        groups: Dict[bool, List[_PendingEncode]] = {}
+        for request in batch:
+            groups.setdefault(request.add_special_tokens, []).append(request)
+        for add_special_tokens, requests in groups.items():
+            try:
+                results = self._tokenize([request.text for request in requests], add_special_tokens)
+                for request, token_ids in zip(requests, results):
+                    request.token_ids = token_ids
+            except Exception as e:
+                for request in requests:
+                    request.error = e
+
+        with self._lock:
+            if self._pending:
+                self._pending[0].wake.set()
+            else:
+                self._leading = False
+        for request in batch:
+            request.done = True
+            request.wake.set()
+
+    def encode_batch(self, texts: List[str], add_special_tokens: bool = True) -> List[List[int]]:
+        """Token IDs of several texts, encoding the cache misses in one call"""
+        results: List[Optional[List[int]]] = [self._cached(text, add_special_tokens) for text in texts]
+        missing = [index for index, token_ids in enumerate(results) if token_ids is None]
+        if missing:
+            encoded = self._tokenize([texts[index] for index in missing], add_special_tokens)
+            for index, token_ids in zip(missing, encoded):
+                results[index] = token_ids
+                self._remember(texts[index], add_special_tokens, token_ids)
+        return results
+
+    def to_inputs(self, token_ids: List[List[int]], device: Optional[torch.device] = None) -> Dict[str, torch.Tensor]:
+        """input_ids and attention_mask tensors, left-padded to the longest row"""
+        length = max(len(row) for row in token_ids)
+        pad_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else 0
+        input_ids = torch.full((len(token_ids), length), pad_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(token_ids), length), dtype=torch.long)
+        for row, ids in enumerate(token_ids):
+            if ids:
+                input_ids[row, length - len(ids):] = torch.tensor(ids, dtype=torch.long)
+                attention_mask[row, length - len(ids):] = 1
+        if device is not None:
+            input_ids, attention_mask = input_ids.to(device), attention_mask.to(device)
+        return {'input_ids': input_ids, 'attention_mask': attention_mask}
+
+    def decode(self, token_ids, skip_special_tokens: bool = True) -> str:
+        """Text of one token sequence"""
+        return self.tokenizer.decode(token_ids, skip_special_tokens=skip_special_tokens)
+
+    def decode_batch(self, rows, skip_special_tokens: bool = True) -> List[str]:
+        """Texts of several token sequences in one tokenizer call"""
+        return self.tokenizer.batch_decode(rows, skip_special_tokens=skip_special_tokens)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Encode, cache and batching statistics"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cache_entries'] = len(self._cache)
+        stats['cache_hit_rate'] = stats['cache_hits'] / stats['encodes'] if stats['encodes'] else 0.0
+        stats['mean_batch_size'] = stats['batched_texts'] / stats['batches'] if stats['batches'] else 0.0
+        stats['batching'] = self.batching
+        stats['cache_size'] = self.cache_size
+        return stats
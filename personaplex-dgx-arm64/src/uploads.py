@@ -0,0 +1,140 @@
+"""
+Upload spooling for PersonaPlex
+Streams multipart request bodies into size-bounded spooled files that
+spill to disk, rejecting oversized requests as soon as they are detected
+"""
+
+import logging
+import threading
+from typing import Dict, Any, AsyncGenerator, Optional
+
+from starlette.datastructures import Headers, UploadFile
+from starlette.formparsers import MultiPartParser
+from starlette.requests import Request
+
+from src.metrics import REGISTRY, ERRORS
+
+logger = logging.getLogger(__name__)
+
+UPLOADS = REGISTRY.counter(
+    'personaplex_uploads_total',
+    'File uploads received, by where they were buffered (memory, disk) or too_large when rejected',
+    ['outcome']
+)
+UPLOAD_BYTES = REGISTRY.counter(
+    'personaplex_upload_bytes_total',
+    'Request body bytes read from file uploads, by where they were buffered',
+    ['storage']
+)
+
+
+class UploadTooLargeError(Exception):
+    """Raised when a request body exceeds server.max_request_size"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Request body exceeds the {max_bytes} byte limit")
+        self.max_bytes = max_bytes
+
+
+class _SpoolingParser(MultiPartParser):
+    """MultiPartParser whose uploads roll over to disk past spool_bytes"""
+
+    def __init__(self, headers: Headers, stream: AsyncGenerator[bytes, None], spool_bytes: int):
+        super().__init__(headers, stream, max_files=1, max_fields=16)
+        # Read per instance by MultiPartParser.on_headers_finished
+        self.spool_max_size = spool_bytes
+
+
+class UploadSpooler:
+    """Size-bounded, spooled reads of multipart file uploads
+
+    The request body is consumed chunk by chunk as it arrives, and each
+    file part is written to a SpooledTemporaryFile that stays in memory up
+    to server.upload_spool_size bytes and moves to a temporary file beyond
+    that. A body larger than server.max_request_size is rejected with
+    UploadTooLargeError: before any of it is read when Content-Length
+    says so, otherwise as soon as the running byte count passes the limit.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """Initialize from the server config"""
+        server_config = config.get('server', {}) or {}
+        max_bytes = server_config.get('max_request_size')
+        self.max_bytes: Optional[int] = int(max_bytes) if max_bytes else None
+        self.spool_bytes = max(int(server_config.get('upload_spool_size', 1024 * 1024)), 0)
+        self._lock = threading.Lock()
+        self._stats = {
+            'memory': 0,
+            'disk': 0,
+            'too_large': 0,
+            'bytes': 0
+        }
+
+    def check_length(self, headers: Headers):
+        """Raise UploadTooLargeError when the declared Content-Length is over the limit"""
+        length = headers.get('content-length')
+        if self.max_bytes is None or length is None or not length.isdigit():
+            return
+        if int(length) > self.max_bytes:
+            self._rejected()
+
+    async def _limited(self, request: Request) -> AsyncGenerator[bytes, None]:
+        """The request body, stopping with UploadTooLargeError past max_bytes"""
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if self.max_bytes is not None and received > self.max_bytes:
+                self._rejected()
+            yield chunk
+
+    def _rejected(self):
+        with self._lock:
+            self._stats['too_large'] += 1
+        UPLOADS.inc(outcome='too_large')
+        ERRORS.inc(type='upload_too_large')
+        raise UploadTooLargeError(self.max_bytes)
+
+    async def read_file(self, request: Request, field: str) -> UploadFile:
+        """Stream a multipart request into a spooled file and return its field part
+
+        The caller owns the returned upload and must close it. Raises
+        UploadTooLargeError, MultiPartException for a malformed body and
+        KeyError when field is missing or not a file.
+        """
+        self.check_length(request.headers)
+        parser = _SpoolingParser(request.headers, self._limited(request), self.spool_bytes)
+        # On error the parser closes the files it has spooled so far
+        form = await parser.parse()
+        upload = form.get(field)
+        for _, value in form.multi_items():
+            if value is not upload and isinstance(value, UploadFile):
+                await value.close()
+        if not isinstance(upload, UploadFile):
+            raise KeyError(field)
+
+        storage = 'disk' if getattr(upload.file, '_rolled', False) else 'memory'
+        size = upload.size or 0
+        with self._lock:
+            self._stats[storage] += 1
+            self._stats['bytes'] += size
+        UPLOADS.inc(outcome=storage)
+        UPLOAD_BYTES.inc(size, storage=storage)
+        return upload
+
+    async def read_body(self, request: Request) -> bytes:
+        """The whole request body, raising UploadTooLargeError past max_bytes
+
+        For compact bodies that are parsed in memory (binary requests);
+        uploads that may be large go through read_file.
+        """
+        self.check_length(request.headers)
+        return b"".join([chunk async for chunk in self._limited(request)])
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Upload limits and counts"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['max_request_size'] = self.max_bytes
+        stats['spool_size'] = self.spool_bytes
+        return stats
+
@@ -0,0 +1,162 @@
+"""
+Voice-activity detection for PersonaPlex
+Finds speech in float32 audio with frame energy and zero-crossing rate so
+silence can be trimmed before it reaches the processor and model
+"""
+
+import math
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Energy of digital silence, so log10 never sees zero
+_SILENCE_DB = -120.0
+
+# Frame-energy percentile taken as the background noise level
+NOISE_FLOOR_PERCENTILE = 10
+
+
+@dataclass
+class VadResult:
+    """Speech spans found in one input, in samples"""
+    spans: List[Tuple[int, int]]
+    sample_rate: int
+    total_samples: int
+    speech_samples: int = field(init=False)
+
+    def __post_init__(self):
+        self.speech_samples = sum(end - start for start, end in self.spans)
+
+    @property
+    def input_seconds(self) -> float:
+        return self.total_samples / self.sample_rate
+
+    @property
+    def speech_seconds(self) -> float:
+        return self.speech_samples / self.sample_rate
+
+    @property
+    def removed_seconds(self) -> float:
+        return (self.total_samples - self.speech_samples) / self.sample_rate
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'input_seconds': round(self.input_seconds, 3),
+            'speech_seconds': round(self.speech_seconds, 3),
+            'removed_seconds': round(self.removed_seconds, 3),
+            'segments': len(self.spans)
+        }
+
+
+def frame_features(samples: np.ndarray, frame_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-frame RMS energy (dBFS) and zero-crossing rate of mono audio
+
+    The signal is viewed as (frames, frame_size) so both features are a few
+    vectorized reductions; the last partial frame is zero padded but
+    averaged over its real length.
+    """
+    num_frames = -(-len(samples) // frame_size)
+    padded = np.zeros(num_frames * frame_size, dtype=np.float32)
+    padded[:len(samples)] = samples
+    frames = padded.reshape(num_frames, frame_size)
+    lengths = np.full(num_frames, frame_size, dtype=np.float64)
+    lengths[-1] = len(samples) - (num_frames - 1) * frame_size
+
+    power = np.einsum('ij,ij->i', frames, frames, dtype=np.float64) / lengths
+    energy_db = np.full(num_frames, _SILENCE_DB)
+    np.log10(power, out=energy_db, where=power > 0)
+    energy_db[power > 0] *= 10
+
+    signs = np.signbit(frames)
+    crossings = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1)
+    zcr = crossings / np.maximum(lengths - 1, 1)
+    return energy_db, zcr
+
+
+def _runs(mask: np.ndarray) -> np.ndarray:
+    """(start, end) frame index pairs of the True runs in mask"""
+    edges = np.diff(np.concatenate(([False], mask, [False])).astype(np.int8))
+    return np.stack([np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)], axis=1)
+
+
+class VoiceActivityDetector:
+    """Energy and zero-crossing voice-activity detector
+
+    A frame (audio.vad.frame_size samples, audio.chunk_size by default) is
+    speech when its energy is above energy_threshold_db (dBFS), above
+    dynamic_range_db below the loudest frame, and noise_margin_db above the
+    noise floor (a low percentile of frame energies). Quieter frames still
+    count when their zero-crossing rate is above zcr_threshold and they are
+    within zcr_margin_db of that threshold but above the noise floor, which
+    keeps soft fricatives. Speech
+    runs shorter than min_speech_ms are dropped as clicks, and the rest are
+    padded by padding_ms on each side. With split_silence_ms set, pauses at
+    least that long split the input into separate segments; otherwise only
+    leading and trailing silence is trimmed.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """Initialize from the audio config"""
+        audio_config = config.get('audio', {}) or {}
+        vad_config = audio_config.get('vad', {}) or {}
+        self.enabled = bool(vad_config.get('enabled', True))
+        self.frame_size = int(vad_config.get('frame_size') or audio_config.get('chunk_size', 4096))
+        self.energy_threshold_db = float(vad_config.get('energy_threshold_db', -50.0))
+        self.dynamic_range_db = float(vad_config.get('dynamic_range_db', 35.0))
+        self.noise_margin_db = float(vad_config.get('noise_margin_db', 6.0))
+        self.zcr_threshold = float(vad_config.get('zcr_threshold', 0.25))
+        self.zcr_margin_db = float(vad_config.get('zcr_margin_db', 10.0))
+        self.min_speech_ms = float(vad_config.get('min_speech_ms', 100))
+        self.padding_ms = float(vad_config.get('padding_ms', 200))
+        split_silence_ms = vad_config.get('split_silence_ms')
+        self.split_silence_ms = float(split_silence_ms) if split_silence_ms else None
+        self.on_silence = str(vad_config.get('on_silence', 'reject')).lower()
+        if self.on_silence not in ('reject', 'empty'):
+            raise ValueError(f"audio.vad.on_silence must be 'reject' or 'empty', not {self.on_silence!r}")
+
+    def _frames(self, ms: float, sample_rate: int) -> int:
+        """Frames covering ms milliseconds"""
+        return math.ceil(ms * sample_rate / 1000 / self.frame_size)
+
+    def detect(self, samples: np.ndarray, sample_rate: int) -> VadResult:
+        """Speech spans of (frames,) or (frames, channels) float32 audio"""
+        total = len(samples)
+        if not total:
+            return VadResult([], sample_rate, 0)
+        mono = samples if samples.ndim == 1 else samples.mean(axis=1, dtype=np.float32)
+        energy_db, zcr = frame_features(mono, self.frame_size)
+
+        # Steady background noise sets the floor; white noise has a high
+        # zero-crossing rate too, so nothing near the floor counts as speech
+        floor = float(np.percentile(energy_db, NOISE_FLOOR_PERCENTILE)) + self.noise_margin_db
+        threshold = max(self.energy_threshold_db, float(energy_db.max()) - self.dynamic_range_db, floor)
+        speech = (energy_db > threshold) | (
+            (energy_db > max(threshold - self.zcr_margin_db, floor)) & (zcr > self.zcr_threshold)
+        )
+
+        runs = _runs(speech)
+        min_frames = self._frames(self.min_speech_ms, sample_rate)
+        runs = runs[runs[:, 1] - runs[:, 0] >= min_frames]
+        if not len(runs):
+            return VadResult([], sample_rate, total)
+
+        pad = self._frames(self.padding_ms, sample_rate)
+        if self.split_silence_ms:
+            # Shorter pauses stay inside a segment, as do ones the padding would bridge
+            gap = max(self._frames(self.split_silence_ms, sample_rate), 2 * pad)
+            keep = np.concatenate(([True], runs[1:, 0] - runs[:-1, 1] >= gap))
+            starts = runs[keep, 0]
+            ends = np.concatenate((runs[np.flatnonzero(keep)[1:] - 1, 1], [runs[-1, 1]]))
+            frame_spans = np.stack([starts, ends], axis=1)
+        else:
+            frame_spans = np.array([[runs[0, 0], runs[-1, 1]]])
+
+        spans = [
+            (max(int(start - pad), 0) * self.frame_size, min(int(end + pad) * self.frame_size, total))
+            for start, end in frame_spans
+        ]
+        return VadResult(spans, sample_rate, total)